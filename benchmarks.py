@@ -0,0 +1,308 @@
+# benchmarks.py
+# Medições de desempenho sem janela (não importa pygame).
+# Uso: python benchmarks.py <bsp|rays|decompose|codecs|entities|check> [opções]  (python benchmarks.py -h)
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import geometry as geo
+import map_manager as mm
+import raycast
+import compression
+from data_structures import Sector, Entity
+
+# -----------------------------
+# Mapas sintéticos
+# -----------------------------
+def make_grid_map(rooms_x, rooms_y, size=10.0):
+    """Gera uma grade de salas retangulares vizinhas (paredes compartilhadas)."""
+    sectors_ = []
+    for j in range(rooms_y):
+        for i in range(rooms_x):
+            x0, y0 = i * size, j * size
+            x1, y1 = x0 + size, y0 + size
+            # Sala levemente deslocada para gerar divisores não triviais
+            inset = (i * 7 + j * 3) % 3 * 0.5
+            outer = [(x0 + inset, y0), (x1, y0 + inset), (x1, y1), (x0, y1)]
+            sectors_.append(Sector(outer))
+    return sectors_
+
+def make_jittered_grid(rooms, size, jitter, seed=1):
+    """Grade de quadriláteros com os vértices internos deslocados até `jitter`.
+
+    Com `size` e `jitter` inteiros as coordenadas são inteiras; com jitter=0
+    a grade é regular (útil para salas menores que 1 unidade).
+    """
+    rng = random.Random(seed)
+    pts = {}
+    for j in range(rooms + 1):
+        for i in range(rooms + 1):
+            dx = rng.randint(-jitter, jitter) if 0 < i < rooms else 0
+            dy = rng.randint(-jitter, jitter) if 0 < j < rooms else 0
+            pts[(i, j)] = (i * size + dx, j * size + dy)
+    return [Sector([pts[(i, j)], pts[(i + 1, j)], pts[(i + 1, j + 1)], pts[(i, j + 1)]])
+            for j in range(rooms) for i in range(rooms)]
+
+def make_star(points, r_out=50.0, r_in=20.0):
+    return [((r_out if i % 2 == 0 else r_in) * math.cos(i * math.pi / points),
+             (r_out if i % 2 == 0 else r_in) * math.sin(i * math.pi / points))
+            for i in range(2 * points)]
+
+def make_comb(teeth, width=4.0, depth=30.0):
+    """Pente: base retangular com `teeth` dentes para cima."""
+    poly = [(0.0, 0.0), ((2 * teeth - 1) * width, 0.0)]
+    for i in reversed(range(teeth)):
+        x0 = 2 * i * width
+        poly += [(x0 + width, -depth), (x0, -depth)]
+        if i > 0:
+            poly += [(x0, -5.0), (x0 - width, -5.0)]
+    return poly
+
+def make_random_radial(n, seed=1):
+    """Polígono simples com raio aleatório por ângulo (estrelado em relação à origem)."""
+    rng = random.Random(seed)
+    radii = [rng.uniform(10, 50) for _ in range(n)]
+    return [(r * math.cos(2 * math.pi * i / n), r * math.sin(2 * math.pi * i / n))
+            for i, r in enumerate(radii)]
+
+def timed(func, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def bench_bsp(rooms, workers):
+    sectors_ = make_grid_map(rooms, rooms)
+    walls = mm.build_walls(sectors_)
+    print(f"BSP: {len(sectors_)} setores, {len(walls)} paredes")
+
+    serial, t_serial = timed(mm.build_bsp_from_walls, walls)
+    print(f"  serial:            {t_serial:8.3f}s")
+
+    parallel, t_parallel = timed(mm.build_bsp_from_walls, walls, workers=workers)
+    print(f"  paralelo ({workers:2d} proc): {t_parallel:8.3f}s  (speedup {t_serial / t_parallel:.2f}x)")
+
+    same = serial.to_json() == parallel.to_json()
+    print(f"  saída idêntica:    {same}")
+
+def bench_rays(rooms, count):
+    sectors_ = make_grid_map(rooms, rooms)
+    walls = mm.build_walls(sectors_)
+    bsp_root = mm.build_bsp_from_walls(walls)
+    size = rooms * 10.0
+    rng = random.Random(1)
+    origins = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+    targets = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+    print(f"Raios: {count} raios, {len(walls)} paredes")
+
+    _, t_brute = timed(lambda: [raycast.cast_ray_brute(walls, o, t) for o, t in zip(origins, targets)])
+    print(f"  força bruta (Python): {t_brute:8.3f}s")
+    _, t_bsp = timed(lambda: [raycast.cast_ray(bsp_root, walls, o, t) for o, t in zip(origins, targets)])
+    print(f"  BSP (Python):         {t_bsp:8.3f}s  ({t_brute / t_bsp:.1f}x)")
+    if raycast.np is not None:
+        _, t_batch = timed(raycast.cast_rays, bsp_root, walls, origins, targets)
+        print(f"  BSP (lote NumPy):     {t_batch:8.3f}s  ({t_brute / t_batch:.1f}x)")
+
+def bench_decompose(sizes):
+    print("Decomposição convexa (orelhas + Hertel-Mehlhorn)")
+    print(f"  {'contorno':<16}{'vért.':>6}{'reflexos':>9}{'triâng.':>8}{'peças':>7}{'mín.>=':>7}{'tempo':>10}")
+    for n in sizes:
+        for name, poly in ((f"estrela {n}", make_star(n)), (f"pente {n}", make_comb(n)),
+                           (f"radial {4 * n}", make_random_radial(4 * n))):
+            if geo.area_polygon(poly) < 0:
+                poly = poly[::-1]
+            reflex = sum(1 for i in range(len(poly))
+                         if geo.cross(poly[i][0] - poly[i - 1][0], poly[i][1] - poly[i - 1][1],
+                                             poly[(i + 1) % len(poly)][0] - poly[i][0],
+                                             poly[(i + 1) % len(poly)][1] - poly[i][1]) < 0)
+            result, t = timed(geo.convex_decompose, poly)
+            if result is None:
+                print(f"  {name:<16} falhou (contorno não simples)")
+                continue
+            pieces, _ = result
+            lower = math.ceil(reflex / 2) + 1 # Limite inferior de Chazelle
+            print(f"  {name:<16}{len(poly):>6}{reflex:>9}{len(poly) - 2:>8}{len(pieces):>7}{lower:>7}{t:>9.4f}s")
+
+def _folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+def bench_codecs(rooms, entity_count, levels):
+    """Tamanho e tempo de export/load por codec, com e sem omissão de padrões."""
+    doc = mm.MapDocument()
+    for s in make_grid_map(rooms, rooms):
+        doc.add_sector(s)
+    rng = random.Random(1)
+    size = rooms * 10.0
+    for _ in range(entity_count):
+        doc._insert_entity(Entity((rng.uniform(0, size), rng.uniform(0, size)), etype="enemy",
+                                  id=doc.new_entity_id()))
+    doc.clear_history()
+    print(f"Codecs: {len(doc.sectors)} setores, {len(doc.entities)} entidades")
+    print(f"  {'codec':<10}{'nível':>6}{'padrões':>9}{'tamanho':>12}{'razão':>8}{'salvar':>10}{'carregar':>10}")
+    tmp = tempfile.mkdtemp()
+    try:
+        baseline = None
+        for codec in [None] + list(compression.CODECS):
+            for level in ([None] if codec is None else levels):
+                for elide in (False, True):
+                    folder = os.path.join(tmp, "m")
+                    _, t_save = timed(doc.export_map, folder, codec=codec, level=level,
+                                      elide_defaults=elide)
+                    total = _folder_size(folder)
+                    if baseline is None:
+                        baseline = total
+                    # load_map substitui o mapa atual pelo mesmo conteúdo
+                    _, t_load = timed(doc.load_map, folder)
+                    shutil.rmtree(folder)
+                    print(f"  {codec or 'json':<10}{'-' if level is None else level:>6}"
+                          f"{'omite' if elide else 'grava':>9}{total / 1024:>10.0f}KB"
+                          f"{baseline / total:>7.1f}x{t_save:>9.3f}s{t_load:>9.3f}s")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def bench_entities(rooms, count, sample):
+    """Setor de cada entidade: um a um (árvore de setores, BSP) vs lote (geo.locate_points)."""
+    doc = mm.MapDocument()
+    for s in make_grid_map(rooms, rooms):
+        doc.add_sector(s)
+    # Um cômodo dentro de cada quarta sala, para o lote escolher o setor mais profundo
+    for s in list(doc.sectors[::4]):
+        x0, y0, x1, y1 = s.bbox
+        cx, cy, r = (x0 + x1) / 2, (y0 + y1) / 2, (x1 - x0) / 4
+        doc.add_sector(Sector([(cx - r, cy - r), (cx + r, cy - r), (cx + r, cy + r), (cx - r, cy + r)],
+                              parent_id=s.id, id=doc.new_sector_id()))
+    rng = random.Random(1)
+    size = rooms * 10.0
+    points = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+    print(f"Entidades: {count} pontos, {len(doc.sectors)} setores")
+
+    part = points[:sample]
+    _, t_tree = timed(lambda: [doc.find_sector_at(p) for p in part])
+    print(f"  árvore de setores:  {t_tree * count / len(part):8.3f}s  (estimado por {len(part)} pontos)")
+    bsp_root = doc.get_bsp()
+    by_bsp, t_bsp = timed(lambda: [mm.locate_sector(bsp_root, p) for p in points])
+    print(f"  BSP ponto a ponto:  {t_bsp:8.3f}s")
+    np = geo.np
+    if np is not None:
+        geo.np = None
+        try:
+            _, t_py = timed(doc.locate_points, points)
+        finally:
+            geo.np = np
+        print(f"  lote (Python):      {t_py:8.3f}s  ({t_bsp / t_py:.1f}x)")
+    batch, t_batch = timed(doc.locate_points, points)
+    label = "lote (NumPy):" if np is not None else "lote (Python):"
+    print(f"  {label:<20}{t_batch:8.3f}s  ({t_bsp / t_batch:.1f}x)")
+    same = sum(a == b for a, b in zip(batch, by_bsp))
+    print(f"  iguais à BSP:       {same}/{count}")
+
+# -----------------------------
+# Verificações aleatórias
+# -----------------------------
+def _check_maps(seeds):
+    """Mapas das verificações: grades inteiras deslocadas e salas de 0.9 unidade."""
+    for seed in range(seeds):
+        yield f"inteiro {seed}", make_jittered_grid(10, 3, 1, seed), 30.0
+        yield f"inteiro {seed}b", make_jittered_grid(8, 5, 2, seed), 40.0
+    yield "salas 0.9", make_jittered_grid(12, 0.9, 0), 10.8
+
+def check_locate(seeds, count):
+    """locate_sector (BSP) contra o teste exato de geo.locate_points."""
+    failures = 0
+    for name, sectors_, size in _check_maps(seeds):
+        bsp_root = mm.build_bsp_from_walls(mm.build_walls(sectors_))
+        rng = random.Random(len(name))
+        points = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+        exact = geo.locate_points(points, [s.outer for s in sectors_])
+        wrong = sum((sectors_[i].id if i >= 0 else None) != mm.locate_sector(bsp_root, p)
+                    for p, i in zip(points, exact))
+        failures += wrong
+        if wrong:
+            print(f"  {name}: {wrong}/{count} pontos no setor errado")
+    print(f"Localização (BSP x exato): {'OK' if not failures else f'{failures} divergências'}")
+    return failures
+
+def check_rays(seeds, count):
+    """cast_ray e cast_rays (BSP) contra cast_ray_brute, com portais aleatórios."""
+    failures = 0
+    for name, sectors_, size in _check_maps(seeds):
+        rng = random.Random(len(name))
+        for s in sectors_:
+            for i in range(len(s.outer)):
+                if rng.random() < 0.3:
+                    s.attrs[f"wall_{i}"] = "portal"
+        walls = mm.build_walls(sectors_)
+        bsp_root = mm.build_bsp_from_walls(walls)
+        origins = [(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(count)]
+        targets = [(rng.uniform(-1, size + 1), rng.uniform(-1, size + 1)) for _ in range(count)]
+        brute = [raycast.cast_ray_brute(walls, o, t) for o, t in zip(origins, targets)]
+        expected = [math.inf if h is None else h.distance for h in brute]
+        single = [raycast.cast_ray(bsp_root, walls, o, t) for o, t in zip(origins, targets)]
+        found = {"cast_ray": [math.inf if h is None else h.distance for h in single]}
+        if raycast.np is not None:
+            found["cast_rays"] = list(raycast.cast_rays(bsp_root, walls, origins, targets)[1])
+        for label, distances in found.items():
+            # Distância igual basta: num vértice duas paredes empatam
+            wrong = sum(not (a == b or abs(a - b) <= 1e-6) for a, b in zip(distances, expected))
+            failures += wrong
+            if wrong:
+                print(f"  {name}: {label} diverge em {wrong}/{count} raios")
+    print(f"Raios (BSP x força bruta): {'OK' if not failures else f'{failures} divergências'}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do editor de mapas.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p_bsp = sub.add_parser("bsp", help="Construção serial vs paralela da BSP.")
+    p_bsp.add_argument("--rooms", type=int, default=12, help="Salas por lado da grade.")
+    p_bsp.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    p_rays = sub.add_parser("rays", help="Raios: força bruta vs BSP vs lote vetorizado.")
+    p_rays.add_argument("--rooms", type=int, default=12, help="Salas por lado da grade.")
+    p_rays.add_argument("--count", type=int, default=5000, help="Quantidade de raios.")
+
+    p_dec = sub.add_parser("decompose", help="Peças e tempo da decomposição convexa.")
+    p_dec.add_argument("--sizes", type=int, nargs="+", default=[8, 32, 128],
+                       help="Quantidade de pontas/dentes dos contornos gerados.")
+
+    p_cod = sub.add_parser("codecs", help="Tamanho e tempo de export/load por codec de compressão.")
+    p_cod.add_argument("--rooms", type=int, default=40, help="Salas por lado da grade.")
+    p_cod.add_argument("--entities", type=int, default=20000, help="Quantidade de entidades.")
+    p_cod.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9],
+                       help="Níveis de compressão testados em cada codec.")
+
+    p_ent = sub.add_parser("entities", help="Setor de cada entidade: um a um vs lote vetorizado.")
+    p_ent.add_argument("--rooms", type=int, default=40, help="Salas por lado da grade.")
+    p_ent.add_argument("--count", type=int, default=100000, help="Quantidade de entidades.")
+    p_ent.add_argument("--sample", type=int, default=2000,
+                       help="Pontos usados para estimar a busca pela árvore de setores.")
+
+    p_chk = sub.add_parser("check", help="Verificações aleatórias da BSP contra os testes exatos.")
+    p_chk.add_argument("--seeds", type=int, default=10, help="Mapas aleatórios por tipo.")
+    p_chk.add_argument("--count", type=int, default=2000, help="Pontos por mapa.")
+
+    args = parser.parse_args()
+    if args.bench == "bsp":
+        bench_bsp(args.rooms, args.workers)
+    elif args.bench == "rays":
+        bench_rays(args.rooms, args.count)
+    elif args.bench == "decompose":
+        bench_decompose(args.sizes)
+    elif args.bench == "codecs":
+        bench_codecs(args.rooms, args.entities, args.levels)
+    elif args.bench == "entities":
+        bench_entities(args.rooms, args.count, args.sample)
+    elif args.bench == "check":
+        failures = check_locate(args.seeds, args.count) + check_rays(args.seeds, args.count)
+        sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
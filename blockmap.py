@@ -0,0 +1,85 @@
+# blockmap.py
+# Grade uniforme de paredes (blockmap) para consultas de colisão e seleção.
+# Cada célula lista os índices (em build_walls) das paredes que a cruzam,
+# guardados como tabela de offsets + vetor único de índices.
+import math
+
+import geometry as geo
+
+class Blockmap:
+    def __init__(self, origin, cell_size, cols, rows, offsets, indices):
+        self.origin = tuple(origin)
+        self.cell_size = cell_size
+        self.cols = cols
+        self.rows = rows
+        self.offsets = offsets # len = cols * rows + 1; célula i -> indices[offsets[i]:offsets[i+1]]
+        self.indices = indices
+
+    def cell_of(self, pt):
+        """(coluna, linha) da célula que contém o ponto (pode estar fora da grade)."""
+        return (int((pt[0] - self.origin[0]) // self.cell_size),
+                int((pt[1] - self.origin[1]) // self.cell_size))
+
+    def walls_in_cell(self, cx, cy):
+        if not (0 <= cx < self.cols and 0 <= cy < self.rows):
+            return []
+        i = cy * self.cols + cx
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def walls_in_box(self, bbox):
+        """Índices das paredes candidatas dentro de (min_x, min_y, max_x, max_y)."""
+        cx0, cy0 = self.cell_of(bbox[:2])
+        cx1, cy1 = self.cell_of(bbox[2:])
+        found = set()
+        for cy in range(max(0, cy0), min(self.rows - 1, cy1) + 1):
+            for cx in range(max(0, cx0), min(self.cols - 1, cx1) + 1):
+                found.update(self.walls_in_cell(cx, cy))
+        return sorted(found)
+
+    def walls_near(self, pt, radius):
+        """Índices das paredes candidatas a até `radius` do ponto."""
+        return self.walls_in_box((pt[0] - radius, pt[1] - radius, pt[0] + radius, pt[1] + radius))
+
+    def to_json(self):
+        return {
+            "origin": [round(self.origin[0], 2), round(self.origin[1], 2)],
+            "cell_size": self.cell_size,
+            "cols": self.cols,
+            "rows": self.rows,
+            "offsets": self.offsets,
+            "indices": self.indices,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["origin"], data["cell_size"], data["cols"], data["rows"],
+                   data["offsets"], data["indices"])
+
+def build_blockmap(walls, cell_size):
+    """Monta o blockmap das paredes (lista de build_walls) com células de `cell_size`."""
+    if not walls:
+        return Blockmap((0.0, 0.0), cell_size, 0, 0, [0], [])
+    x0 = math.floor(min(min(w.start[0], w.end[0]) for w in walls))
+    y0 = math.floor(min(min(w.start[1], w.end[1]) for w in walls))
+    x1 = max(max(w.start[0], w.end[0]) for w in walls)
+    y1 = max(max(w.start[1], w.end[1]) for w in walls)
+    cols = int((x1 - x0) // cell_size) + 1
+    rows = int((y1 - y0) // cell_size) + 1
+
+    cells = [[] for _ in range(cols * rows)]
+    for i, w in enumerate(walls):
+        # Só as células do bbox da parede que o segmento realmente cruza
+        bx0, by0, bx1, by1 = geo.polygon_bbox((w.start, w.end))
+        for cy in range(int((by0 - y0) // cell_size), int((by1 - y0) // cell_size) + 1):
+            for cx in range(int((bx0 - x0) // cell_size), int((bx1 - x0) // cell_size) + 1):
+                box = (x0 + cx * cell_size, y0 + cy * cell_size,
+                       x0 + (cx + 1) * cell_size, y0 + (cy + 1) * cell_size)
+                if geo.segment_intersects_box(w.start, w.end, box):
+                    cells[cy * cols + cx].append(i)
+
+    offsets = [0]
+    indices = []
+    for cell in cells:
+        indices.extend(cell)
+        offsets.append(len(indices))
+    return Blockmap((x0, y0), cell_size, cols, rows, offsets, indices)
@@ -0,0 +1,202 @@
+# changelog.py
+# Salvamento incremental: cada save acrescenta ao arquivo changes.jsonl (ao lado
+# do map.json) só os setores, paredes e entidades alterados. load_map aplica o
+# registro sobre a base; a compactação (em segundo plano) funde o registro na
+# base e troca os arquivos com os.replace, refazendo o blockmap e o PVS que a
+# base tinha.
+#
+# Cada linha do registro:
+#   {"sectors": [setor.to_json()], "removed_sectors": [ids],
+#    "walls": {"sectors": [ids], "walls": [parede.to_json()]},
+#    "entities": [entidade.to_json()], "removed_entities": [ids]}
+# "walls" substitui todas as paredes cuja sector_front está em walls.sectors.
+# Reaplicar uma linha já fundida não muda nada, então uma falha no meio da
+# compactação não corrompe o mapa.
+import json
+import os
+import threading
+
+import blockmap
+import compression
+import config
+import visibility
+from data_structures import Sector, Wall
+
+LOG_NAME = "changes.jsonl"
+
+lock = threading.Lock()  # Serializa escrita do registro, troca dos arquivos e leitura da pasta
+_compacting = {}         # pasta -> thread de compactação em andamento
+
+def log_path(folder):
+    return os.path.join(folder, LOG_NAME)
+
+def log_size(folder):
+    path = log_path(folder)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def append_record(folder, record):
+    """Acrescenta uma linha ao registro (custo proporcional ao tamanho da mudança)."""
+    line = json.dumps(record) + "\n"
+    with lock:
+        with open(log_path(folder), "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+def clear_log(folder):
+    with lock:
+        if os.path.exists(log_path(folder)):
+            os.remove(log_path(folder))
+
+def _parse(lines):
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            break # Última linha truncada por uma falha durante o save
+    return records
+
+def read_log(folder):
+    path = log_path(folder)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return _parse(f)
+
+def apply_records(map_data, entity_data, records):
+    """Aplica os registros sobre os dicts de map.json e entities.json (no lugar)."""
+    if not records:
+        return
+    sectors_ = {s["id"]: s for s in map_data.get("sectors", [])}
+    entities_ = {e["id"]: e for e in entity_data.get("entities", [])}
+    walls = map_data.get("walls", [])
+    for rec in records:
+        for sid in rec.get("removed_sectors", []):
+            sectors_.pop(sid, None)
+        for sdata in rec.get("sectors", []):
+            sectors_[sdata["id"]] = sdata # Sem "vids": load_map usa "outer"
+        if "walls" in rec:
+            replaced = set(rec["walls"]["sectors"])
+            walls = [w for w in walls if w["sector_front"] not in replaced] + rec["walls"]["walls"]
+        for eid in rec.get("removed_entities", []):
+            entities_.pop(eid, None)
+        for edata in rec.get("entities", []):
+            entities_[edata["id"]] = edata
+    map_data["sectors"] = list(sectors_.values())
+    map_data["walls"] = walls
+    entity_data["entities"] = list(entities_.values())
+    if any(rec.get("sectors") or rec.get("removed_sectors") for rec in records):
+        # PVS e blockmap são derivados da geometria antiga (compact e compile_maps refazem)
+        map_data.pop("pvs", None)
+        map_data.pop("blockmap", None)
+
+def _expand_vertices(map_data):
+    """Devolve "outer" aos setores da base que só têm "vids"."""
+    vertex_data = map_data.get("vertices")
+    for sdata in map_data.get("sectors", []):
+        if "vids" in sdata and vertex_data is not None:
+            sdata["outer"] = [vertex_data[i] for i in sdata.pop("vids")]
+
+def _rebuild_derived(map_data, cell_size, pvs):
+    """Refaz o blockmap (células de `cell_size`) e o PVS que apply_records descartou.
+
+    Usa as paredes na ordem final do map.json, que é a ordem indexada pelo blockmap.
+    """
+    if (cell_size is None or "blockmap" in map_data) and (not pvs or "pvs" in map_data):
+        return
+    walls = [Wall(tuple(w["start"]), tuple(w["end"]), w["sector_front"], w["sector_back"],
+                  w["is_portal"]) for w in map_data["walls"]]
+    if cell_size is not None and "blockmap" not in map_data:
+        map_data["blockmap"] = blockmap.build_blockmap(walls, cell_size).to_json()
+    if pvs and "pvs" not in map_data:
+        sectors_ = [Sector(sdata["outer"], id=sdata["id"]) for sdata in map_data["sectors"]]
+        map_data["pvs"] = visibility.compute_pvs(sectors_, walls, config.PVS_MAX_DEPTH).to_json()
+
+def _vertex_table(sector_data):
+    """Refaz a tabela compacta de vértices ("vertices" + "vids") do map.json."""
+    ids = {}
+    for sdata in sector_data:
+        sdata["vids"] = [ids.setdefault(tuple(v), len(ids)) for v in sdata.pop("outer")]
+    return [list(v) for v in ids]
+
+def _read_json(path, codec):
+    with compression.open_text(path, "r", codec) as f:
+        return json.load(f)
+
+def _write_json(path, codec, data, level=None):
+    """Grava em path + ".tmp" no mesmo formato (codec e nível) da base."""
+    dump_args = {"indent": 2} if codec is None else {"separators": (",", ":")}
+    with compression.open_text(path + ".tmp", "w", codec, level) as f:
+        json.dump(data, f, **dump_args)
+
+def compact(folder):
+    """Funde o registro em map.json/entities.json. Retorna quantas linhas foram fundidas.
+
+    A leitura e a fusão acontecem sem a trava; só a troca dos arquivos a usa,
+    e linhas acrescentadas enquanto isso continuam no registro.
+    """
+    with lock:
+        path = log_path(folder)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            consumed = f.read()
+    records = _parse(consumed.decode("utf-8").splitlines())
+    if not records:
+        return 0
+    # Só linhas completas são consumidas
+    consumed = consumed[:consumed.rfind(b"\n") + 1]
+
+    map_path, codec = compression.resolve(os.path.join(folder, "map.json"))
+    map_data = _read_json(map_path, codec)
+    entity_data = {"entities": []}
+    entities_path = compression.codec_path(os.path.join(folder, "entities.json"), codec)
+    if os.path.exists(entities_path):
+        entity_data = _read_json(entities_path, codec)
+    _expand_vertices(map_data)
+    cell_size = map_data.get("blockmap", {}).get("cell_size")
+    had_pvs = "pvs" in map_data
+    apply_records(map_data, entity_data, records)
+    _rebuild_derived(map_data, cell_size, had_pvs)
+    map_data["vertices"] = _vertex_table(map_data["sectors"])
+    level = map_data.get("compression_level")
+    _write_json(map_path, codec, map_data, level)
+    _write_json(entities_path, codec, entity_data, level)
+
+    with lock:
+        with open(path, "rb") as f:
+            tail = f.read()[len(consumed):]
+        os.replace(entities_path + ".tmp", entities_path)
+        os.replace(map_path + ".tmp", map_path)
+        with open(path + ".tmp", "wb") as f:
+            f.write(tail)
+        os.replace(path + ".tmp", path)
+    return len(records)
+
+def _compact_job(folder):
+    try:
+        compact(folder)
+    except Exception as e:
+        print(f"Aviso: falha ao compactar o registro de '{folder}': {e}")
+    finally:
+        with lock:
+            _compacting.pop(folder, None)
+
+def compact_async(folder):
+    """Compacta numa thread em segundo plano (no máximo uma por pasta)."""
+    with lock:
+        if folder in _compacting:
+            return None
+        thread = _compacting[folder] = threading.Thread(target=_compact_job, args=(folder,),
+                                                        daemon=True)
+    thread.start()
+    return thread
+
+def wait_idle(folder, timeout=None):
+    """Espera a compactação em andamento da pasta terminar."""
+    thread = _compacting.get(folder)
+    if thread is not None:
+        thread.join(timeout)
@@ -0,0 +1,112 @@
+# chunks.py
+# Layout em blocos (tiles) para mapas grandes: setores e entidades são
+# particionados numa grade e cada bloco vira um arquivo em <pasta>/tiles/.
+# Um setor pertence ao bloco do centro do seu bbox; uma entidade ao bloco da
+# sua posição. O índice guarda o bbox real do conteúdo de cada bloco, então
+# setores que passam da borda continuam sendo encontrados pela região.
+import json
+import os
+
+from geometry import polygon_bbox
+
+TILES_DIR = "tiles"
+INDEX_NAME = "index.json"
+
+def tile_of(pt, tile_size):
+    return (int(pt[0] // tile_size), int(pt[1] // tile_size))
+
+def tile_name(key):
+    return f"{key[0]}_{key[1]}.json"
+
+def sector_tile(sdata, tile_size):
+    min_x, min_y, max_x, max_y = polygon_bbox(sdata["outer"])
+    return tile_of(((min_x + max_x) / 2, (min_y + max_y) / 2), tile_size)
+
+def tile_bbox(tile):
+    """bbox (min_x, min_y, max_x, max_y) do conteúdo de um bloco, ou None se vazio."""
+    boxes = [polygon_bbox(s["outer"]) for s in tile["sectors"] if s["outer"]]
+    boxes += [(e["pos"][0], e["pos"][1], e["pos"][0], e["pos"][1]) for e in tile["entities"]]
+    if not boxes:
+        return None
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+def partition(sector_data, entity_data, tile_size):
+    """{(tx, ty): {"sectors": [...], "entities": [...]}} a partir dos dicts to_json."""
+    tiles = {}
+    for sdata in sector_data:
+        key = sector_tile(sdata, tile_size)
+        tiles.setdefault(key, {"sectors": [], "entities": []})["sectors"].append(sdata)
+    for edata in entity_data:
+        key = tile_of(edata["pos"], tile_size)
+        tiles.setdefault(key, {"sectors": [], "entities": []})["entities"].append(edata)
+    return tiles
+
+def is_tiled(folder):
+    return os.path.exists(os.path.join(folder, TILES_DIR, INDEX_NAME))
+
+def read_index(folder):
+    with open(os.path.join(folder, TILES_DIR, INDEX_NAME), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["tiles"] = {tuple(t["key"]): t for t in data["tiles"]}
+    return data
+
+def write_index(folder, index):
+    data = dict(index)
+    data["tiles"] = [index["tiles"][key] for key in sorted(index["tiles"])]
+    path = os.path.join(folder, TILES_DIR, INDEX_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def read_tile(folder, key):
+    with open(os.path.join(folder, TILES_DIR, tile_name(key)), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_tile(folder, key, tile):
+    """Grava um bloco e retorna a sua entrada no índice (None se ficou vazio)."""
+    path = os.path.join(folder, TILES_DIR, tile_name(key))
+    bbox = tile_bbox(tile)
+    if bbox is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(tile, f)
+    os.replace(path + ".tmp", path)
+    return {"key": list(key), "bbox": bbox,
+            "sectors": len(tile["sectors"]), "entities": len(tile["entities"])}
+
+def export_tiles(folder, sector_data, entity_data, tile_size, next_sector_id, next_entity_id):
+    """Grava o mapa inteiro no layout em blocos. Retorna o índice."""
+    tiles_dir = os.path.join(folder, TILES_DIR)
+    os.makedirs(tiles_dir, exist_ok=True)
+    for name in os.listdir(tiles_dir):
+        if name.endswith(".json") and name != INDEX_NAME:
+            os.remove(os.path.join(tiles_dir, name)) # Blocos de uma exportação anterior
+    index = {"tile_size": tile_size, "next_sector_id": next_sector_id,
+             "next_entity_id": next_entity_id, "tiles": {}}
+    for key, tile in partition(sector_data, entity_data, tile_size).items():
+        entry = write_tile(folder, key, tile)
+        if entry is not None:
+            index["tiles"][key] = entry
+    write_index(folder, index)
+    return index
+
+def remove_tiles(folder):
+    """Apaga o layout em blocos da pasta (blocos e índice), se houver."""
+    tiles_dir = os.path.join(folder, TILES_DIR)
+    if not os.path.isdir(tiles_dir):
+        return
+    for name in os.listdir(tiles_dir):
+        if name.endswith(".json") or name.endswith(".json.tmp"):
+            os.remove(os.path.join(tiles_dir, name))
+    if not os.listdir(tiles_dir):
+        os.rmdir(tiles_dir)
+
+def tiles_in_box(index, box):
+    """Chaves dos blocos cujo conteúdo intersecta o bbox `box`."""
+    min_x, min_y, max_x, max_y = box
+    return [key for key, t in index["tiles"].items()
+            if t["bbox"][2] >= min_x and t["bbox"][0] <= max_x
+            and t["bbox"][3] >= min_y and t["bbox"][1] <= max_y]
@@ -0,0 +1,181 @@
+# compile_maps.py
+# Compilador de mapas em lote, sem janela (não importa pygame).
+# Etapas: validação, paredes, BSP, blockmap, dicas de portal, PVS e setor de cada entidade.
+# Uso: python compile_maps.py map_data a e --jobs 8 --out build/ [--strict] [--threads] [--no-pvs]
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import map_manager as mm
+import visibility
+import blockmap
+import config
+import validate
+import chunks
+import compression
+
+COMPILED_NAME = "compiled.json"
+SUMMARY_NAME = "compile_summary.json"
+
+def compile_map_folder(folder, out_dir=None, strict=False, pvs=True):
+    """Compila uma pasta de mapa (map.json + entities.json, ou layout em blocos).
+
+    A pasta é carregada num MapDocument próprio, então várias compilações
+    podem rodar em threads do mesmo processo.
+    Com strict=True, mapas com problemas de geometria (validate) não são
+    compilados; com pvs=False o PVS fica de fora ("pvs": null). Retorna um
+    dicionário com o resultado e os tempos de cada etapa.
+    """
+    result = {"folder": folder, "ok": False, "timings": {}}
+    timings = result["timings"]
+    t_start = time.perf_counter()
+
+    if not compression.exists(os.path.join(folder, "map.json")) and not chunks.is_tiled(folder):
+        result["error"] = "map.json não encontrado"
+        return result
+
+    try:
+        t0 = time.perf_counter()
+        doc = mm.MapDocument()
+        doc.load_map(folder, assign_entities=False) # Etapa medida à parte abaixo
+        timings["load"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        issues = doc.validate_map()
+        timings["validate"] = time.perf_counter() - t0
+        result["issues"] = len(issues)
+        if issues:
+            result["validation"] = validate.summarize(issues)
+            if strict:
+                result["error"] = result["validation"]
+                timings["total"] = time.perf_counter() - t_start
+                return result
+
+        t0 = time.perf_counter()
+        walls = doc.build_walls()
+        timings["walls"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bsp_root = mm.build_bsp_from_walls(walls)
+        timings["bsp"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        bmap = blockmap.build_blockmap(walls, config.BLOCKMAP_CELL)
+        timings["blockmap"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        doc.compute_portal_hints()
+        timings["portal_hints"] = time.perf_counter() - t0
+
+        pvs_data = None
+        if pvs:
+            t0 = time.perf_counter()
+            pvs_data = visibility.compute_pvs(doc.sectors, walls, config.PVS_MAX_DEPTH).to_json()
+            timings["pvs"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        reassigned = doc.assign_entity_sectors()
+        timings["entities"] = time.perf_counter() - t0
+
+        compiled = {
+            "sectors": [s.to_json() for s in doc.sectors],
+            "walls": [w.to_json() for w in walls],
+            "bsp": bsp_root.to_json() if bsp_root else None,
+            "blockmap": bmap.to_json(),
+            "portal_hints": [[[list(a1), list(a2)], [list(b1), list(b2)]]
+                             for (a1, a2), (b1, b2) in doc.portal_hint_segments],
+            "pvs": pvs_data,
+            "entities": [e.to_json() for e in doc.entities],
+        }
+
+        t0 = time.perf_counter()
+        target_dir = folder
+        if out_dir:
+            target_dir = os.path.join(out_dir, os.path.basename(os.path.normpath(folder)))
+            os.makedirs(target_dir, exist_ok=True)
+        out_path = os.path.join(target_dir, COMPILED_NAME)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(compiled, f)
+        timings["write"] = time.perf_counter() - t0
+
+        result.update({
+            "ok": True,
+            "output": out_path,
+            "sectors": len(doc.sectors),
+            "walls": len(walls),
+            "portal_hints": len(doc.portal_hint_segments),
+            "entities": len(doc.entities),
+            "entities_reassigned": reassigned,
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    timings["total"] = time.perf_counter() - t_start
+    return result
+
+def compile_folders(folders, out_dir=None, jobs=None, strict=False, threads=False, pvs=True):
+    """Compila várias pastas em paralelo. Retorna os resultados na ordem de entrada.
+
+    Com threads=True usa threads do próprio processo em vez de processos
+    (sem custo de criação e de cópia dos resultados; a CPU fica com o GIL).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(folders) <= 1:
+        return [compile_map_folder(f, out_dir, strict, pvs) for f in folders]
+    executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor(max_workers=jobs) as pool:
+        return list(pool.map(compile_map_folder, folders, [out_dir] * len(folders),
+                             [strict] * len(folders), [pvs] * len(folders)))
+
+def print_summary(results, wall_time, jobs, threads=False):
+    ok = [r for r in results if r["ok"]]
+    for r in results:
+        if r["ok"]:
+            print(f"  OK   {r['folder']}: {r['sectors']} setores, {r['walls']} paredes, "
+                  f"{r['entities']} entidades em {r['timings']['total']:.3f}s")
+            if r.get("issues"):
+                print(f"       Aviso: {r['validation']}")
+        else:
+            print(f"  ERRO {r['folder']}: {r.get('error')}")
+    cpu_time = sum(r["timings"].get("total", 0.0) for r in results)
+    print(f"{len(ok)}/{len(results)} mapas compilados em {wall_time:.3f}s "
+          f"({jobs} {'threads' if threads else 'processos'}, {cpu_time:.3f}s somados por mapa).")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila pastas de mapas sem abrir o editor.")
+    parser.add_argument("folders", nargs="+", help="Pastas contendo map.json e entities.json.")
+    parser.add_argument("--out", default=None,
+                        help="Diretório de saída (padrão: grava compiled.json em cada pasta).")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="Número de processos (padrão: número de núcleos).")
+    parser.add_argument("--threads", action="store_true",
+                        help="Usa threads em vez de processos (cada mapa num MapDocument).")
+    parser.add_argument("--strict", action="store_true",
+                        help="Falha mapas com setores sobrepostos ou paredes cruzadas.")
+    parser.add_argument("--no-pvs", dest="pvs", action="store_false",
+                        help="Não calcula o PVS (lento em mapas grandes e abertos).")
+    parser.add_argument("--summary", default=None,
+                        help=f"Arquivo JSON com o resumo de tempos (padrão: <out>/{SUMMARY_NAME}).")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    results = compile_folders(args.folders, args.out, args.jobs, args.strict, args.threads,
+                              args.pvs)
+    wall_time = time.perf_counter() - t0
+
+    print_summary(results, wall_time, args.jobs, args.threads)
+
+    summary_path = args.summary
+    if summary_path is None and args.out:
+        summary_path = os.path.join(args.out, SUMMARY_NAME)
+    if summary_path:
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({"wall_time": wall_time, "jobs": args.jobs, "maps": results}, f, indent=2)
+
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# compression.py
+# Arquivos do mapa (map.json, entities.json) opcionalmente comprimidos com os
+# codecs da biblioteca padrão. A compressão é feita em fluxo: json.dump escreve
+# direto no compressor, sem montar o texto inteiro na memória.
+import gzip
+import io
+import lzma
+import os
+import zlib
+
+CODECS = {"gzip": ".gz", "lzma": ".xz", "zlib": ".zz"}
+DEFAULT_LEVELS = {"gzip": 6, "lzma": 6, "zlib": 6}
+CHUNK = 1 << 16
+
+class _ZlibFile(io.RawIOBase):
+    """Fluxo zlib (sem cabeçalho gzip) sobre um arquivo, para leitura ou escrita."""
+    def __init__(self, path, mode, level):
+        super().__init__()
+        self._writing = "w" in mode
+        self._file = open(path, "wb" if self._writing else "rb")
+        if self._writing:
+            self._z = zlib.compressobj(level)
+        else:
+            self._z = zlib.decompressobj()
+            self._pending = b""
+            self._eof = False
+
+    def readable(self):
+        return not self._writing
+
+    def writable(self):
+        return self._writing
+
+    def write(self, data):
+        self._file.write(self._z.compress(bytes(data)))
+        return len(data)
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            chunk = self._file.read(CHUNK)
+            if chunk:
+                self._pending = self._z.decompress(chunk)
+            else:
+                self._pending = self._z.flush()
+                self._eof = True
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            if self._writing:
+                self._file.write(self._z.flush())
+            self._file.close()
+        super().close()
+
+def codec_path(path, codec):
+    """Caminho do arquivo com a extensão do codec (None = JSON puro)."""
+    return path + CODECS[codec] if codec else path
+
+def resolve(path):
+    """(caminho existente, codec) para `path` puro ou comprimido; None se não existe."""
+    if os.path.exists(path):
+        return path, None
+    for codec, ext in CODECS.items():
+        if os.path.exists(path + ext):
+            return path + ext, codec
+    return None
+
+def exists(path):
+    return resolve(path) is not None
+
+def remove_variants(path, keep=None):
+    """Apaga as outras versões (pura/comprimidas) de `path`, menos a do codec `keep`."""
+    for codec in [None] + list(CODECS):
+        other = codec_path(path, codec)
+        if codec != keep and os.path.exists(other):
+            os.remove(other)
+
+def remove_all(path):
+    """Apaga todas as versões (pura e comprimidas) de `path`."""
+    for codec in [None] + list(CODECS):
+        other = codec_path(path, codec)
+        if os.path.exists(other):
+            os.remove(other)
+
+def open_text(path, mode="r", codec=None, level=None):
+    """Abre `path` (já com a extensão) como texto UTF-8, comprimindo em fluxo."""
+    if codec is None:
+        return open(path, mode, encoding="utf-8")
+    if level is None:
+        level = DEFAULT_LEVELS[codec]
+    if codec == "gzip":
+        return gzip.open(path, mode + "t", compresslevel=level, encoding="utf-8")
+    if codec == "lzma":
+        return lzma.open(path, mode + "t", preset=level if "w" in mode else None, encoding="utf-8")
+    if codec == "zlib":
+        raw = _ZlibFile(path, mode, level)
+        buffered = io.BufferedWriter(raw, CHUNK) if "w" in mode else io.BufferedReader(raw, CHUNK)
+        return io.TextIOWrapper(buffered, encoding="utf-8")
+    raise ValueError(f"Codec desconhecido: {codec}")
@@ -6,9 +6,23 @@ UI_W = 420 #320           # UI lateral reduzida
 VIEW_W = W - UI_W
 GRID = 10
 TOLERANCE = 0.1
+PICK_RADIUS_PX = 6 # Distância máxima (pixels) para selecionar uma parede
 CAM_OFFSET_X = 0
 CAM_OFFSET_Y = 0
 
+# --- Inicialização ---
+FONT_CACHE_FILE = "editor_font_cache.json" # Caminhos de fontes já resolvidos
+
+# --- Quadros ---
+MAX_FPS = 60         # Limite de quadros por segundo
+IDLE_WAIT_MS = 1000  # Espera máxima por eventos quando não há nada para redesenhar
+
+# --- Nível de detalhe (zoom afastado) ---
+LOD_GRID = 5              # Com GRID abaixo disso o mapa é desenhado simplificado
+LOD_MIN_WALL_PX = 1.5     # Paredes mais curtas que isso (pixels) não são desenhadas
+LOD_MIN_SECTOR_PX = 3     # Setores menores que isso (pixels) viram um ponto
+LOD_ENTITY_CLUSTER_PX = 12 # Lado (pixels) das células que agrupam entidades no zoom afastado
+
 # --- Cores ---
 COL_BG = (30, 32, 36)
 COL_GRID = (42, 45, 50)
@@ -28,4 +42,41 @@ COL_PORTAL_CONFIRMED = (0, 255, 0)
 COL_DIV = (255, 220, 0) # BSP
 COL_FRONT_ARROW = (0, 255, 0)
 
-COL_VERTEX = (240, 240, 240)
\ No newline at end of file
+COL_VERTEX = (240, 240, 240)
+
+# --- BSP ---
+BSP_PARALLEL_THRESHOLD = 256 # Subárvores menores que isso são construídas no próprio processo
+
+# --- Setores ---
+AUTO_CONVEX_DECOMPOSE = True # Divide contornos côncavos em setores convexos (senão rejeita)
+
+# --- Histórico ---
+UNDO_LIMIT = 500 # Máximo de comandos guardados para desfazer
+JOURNAL_FILE = "editor_journal.jsonl" # Diário para recuperar sessões interrompidas
+
+# --- Exportação ---
+EXPORT_PVS = False # Grava o PVS no map.json ao salvar (o compile_maps calcula, menos com --no-pvs)
+PVS_MAX_DEPTH = 8 # Portais atravessados antes de o PVS parar de recortar (None = sem limite)
+EXPORT_BLOCKMAP = False # Grava a grade de paredes (blockmap) para colisão no map.json (o compile_maps sempre gera)
+BLOCKMAP_CELL = 8.0 # Lado de cada célula do blockmap (unidades do mapa)
+EXPORT_CODEC = None # "gzip", "lzma" ou "zlib" para gravar map.json/entities.json comprimidos
+EXPORT_LEVEL = None # Nível de compressão (None = padrão do codec)
+EXPORT_ELIDE_DEFAULTS = False # Omite atributos iguais ao padrão do registro
+INCREMENTAL_SAVE = False # Salvar na mesma pasta só acrescenta as mudanças ao changes.jsonl (o map.json fica atrasado até a compactação)
+CHANGELOG_COMPACT_BYTES = 4 * 1024 * 1024 # Tamanho do registro que dispara a compactação
+EXPORT_TILE_SIZE = None # Lado dos blocos (unidades do mapa) para exportar em blocos; None grava map.json
+
+# --- Mapas em blocos ---
+CHUNK_BUDGET = 200000 # Máximo de setores + entidades carregados antes de descartar blocos distantes
+CHUNK_MARGIN = 0.5    # Margem (em blocos) carregada além da área visível
+
+# --- Prévia em primeira pessoa ---
+FP_FOV = 90.0            # Campo de visão horizontal (graus)
+FP_EYE_HEIGHT = 1.6      # Altura dos olhos acima do piso do setor
+FP_NEAR = 0.05           # Plano de recorte próximo
+FP_COLUMN_STEP = 2       # Largura em pixels de cada coluna renderizada
+FP_DEPTH_FALLOFF = 0.04  # Escurecimento por unidade de distância
+COL_FP_CEILING = (90, 95, 110)
+COL_FP_FLOOR = (70, 60, 50)
+COL_FP_WALL = (200, 200, 210)
+COL_FP_STEP = (160, 140, 110)
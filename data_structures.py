@@ -1,7 +1,7 @@
 # data_structures.py
 import json
 from collections import defaultdict
-from geometry import area_polygon # Importação relativa após a separação
+from geometry import area_polygon, edges_of, is_convex_polygon, polygon_bbox, polygon_centroid
 
 # -----------------------------
 # Atributos dinâmicos
@@ -43,20 +43,72 @@ ENTITY_ATTRIBUTE_REGISTRY["is_enemy"] = AttributeSpec("is_enemy", bool, True)
 # -----------------------------
 class Sector:
     _next_id = 1
-    def __init__(self, outer_vertices, parent_id=None, attrs=None):
-        self.id = Sector._next_id
-        Sector._next_id += 1
+    def __init__(self, outer_vertices, parent_id=None, attrs=None, id=None):
+        if id is None:
+            # Sem documento (scripts, testes): contador da classe
+            id = Sector._next_id
+            Sector._next_id += 1
+        self.id = id
+        self.rev = 0
         self.outer = outer_vertices[:]
+        self.vids = None # Índices na tabela de vértices do mapa (preenchido pelo map_manager)
         self.parent_id = parent_id
         self.attrs = {}
         if attrs:
             self.attrs.update(attrs)
 
-    def to_json(self):
+    # Geometria derivada: calculada sob demanda e descartada quando `outer`
+    # é reatribuído. Quem alterar a lista no lugar deve chamar invalidate_geometry().
+    @property
+    def outer(self):
+        return self._outer
+
+    @outer.setter
+    def outer(self, vertices):
+        self._outer = list(vertices)
+        self.invalidate_geometry()
+
+    def invalidate_geometry(self):
+        self.rev += 1
+        self._geom = {}
+
+    def _derived(self, name, func):
+        try:
+            return self._geom[name]
+        except KeyError:
+            value = self._geom[name] = func(self._outer)
+            return value
+
+    @property
+    def area(self):
+        """Área com sinal (positiva no sentido anti-horário)."""
+        return self._derived("area", area_polygon)
+
+    @property
+    def bbox(self):
+        return self._derived("bbox", polygon_bbox)
+
+    @property
+    def centroid(self):
+        return self._derived("centroid", polygon_centroid)
+
+    @property
+    def is_convex(self):
+        return self._derived("is_convex", is_convex_polygon)
+
+    @property
+    def edges(self):
+        return self._derived("edges", edges_of)
+
+    def to_json(self, elide_defaults=False):
+        """Dict para exportação. Com elide_defaults=True omite atributos iguais ao
+        padrão do registro (load_map os preenche de volta)."""
         attrs_output = {}
         for key, spec in ATTRIBUTE_REGISTRY.items():
             # Obtém o valor de self.attrs ou o valor padrão (spec.default).
             val = self.attrs.get(key, spec.default)
+            if elide_defaults and val == spec.default:
+                continue
             attrs_output[key] = val
             
         return {
@@ -84,16 +136,18 @@ class Entity:
         "pickup": (0, 0, 255),
     }
 
-    def __init__(self, pos, etype="generic", angle=0.0, sector_id=None, attrs=None):
-        self.id = Entity._next_id
-        Entity._next_id += 1
+    def __init__(self, pos, etype="generic", angle=0.0, sector_id=None, attrs=None, id=None):
+        if id is None:
+            id = Entity._next_id
+            Entity._next_id += 1
+        self.id = id
         self.type = etype
         self.pos = tuple(pos)
         self.angle = angle
         self.sector_id = sector_id
         self.attrs = attrs or {}
 
-    def to_json(self):
+    def to_json(self, elide_defaults=False):
         # Combina atributos modificados com valores padrão das entidades.
         attrs_output = {}
         # ...
@@ -106,6 +160,8 @@ class Entity:
         for key, spec in entity_type_attrs.items(): # Uso direto do registro global
             # Obtém o valor de self.attrs ou o valor padrão do registro.
             val = self.attrs.get(key, spec.default)
+            if elide_defaults and val == spec.default:
+                continue # Omitido: load_map usa o padrão do registro
             attrs_output[key] = val
 
         return {
@@ -124,12 +180,13 @@ class Entity:
 
 class Wall:
     # A classe Wall...
-    def __init__(self, start, end, front_id, back_id, is_portal=False):
+    def __init__(self, start, end, front_id, back_id, is_portal=False, edge_index=None):
         self.start = start
         self.end = end
         self.sector_front = front_id
         self.sector_back = back_id
         self.is_portal = is_portal
+        self.edge_index = edge_index # i do atributo wall_i no setor da frente
 
     def to_json(self):
         return {
@@ -149,11 +206,33 @@ class BSPNode:
         self.collinear = collinear or []
         self.front_segments = []
         self.back_segments = []
+        # Segmentos de parede sobre a reta do nó (divisor + colineares)
+        # e o índice da parede (em build_walls) de cada um.
+        self.wall_segments = []
+        self.wall_ids = []
 
     def to_json(self):
         return {
             "line": [[round(self.line[0][0],2), round(self.line[0][1],2)],
                      [round(self.line[1][0],2), round(self.line[1][1],2)]],
-            "front": self.front.to_json() if isinstance(self.front, BSPNode) else None,
-            "back": self.back.to_json() if isinstance(self.back, BSPNode) else None
-        }
\ No newline at end of file
+            "front": self.front.to_json() if self.front is not None else None,
+            "back": self.back.to_json() if self.back is not None else None
+        }
+
+class BSPLeaf:
+    # Subsetor: região convexa sem paredes internas, pertencente a um setor.
+    def __init__(self, poly, segments=None, wall_ids=None, sector_id=None):
+        self.poly = poly                  # polígono convexo da célula
+        self.segments = segments or []    # paredes que limitam a célula (voltadas para dentro)
+        self.wall_ids = wall_ids or []
+        self.sector_id = sector_id        # None = fora de qualquer setor
+
+    def to_json(self):
+        return {
+            "leaf": True,
+            "sector_id": self.sector_id,
+            "poly": [[round(x,2), round(y,2)] for (x,y) in self.poly],
+            "segments": [[[round(a[0],2), round(a[1],2)], [round(b[0],2), round(b[1],2)]]
+                         for a, b in self.segments],
+            "wall_ids": self.wall_ids
+        }
@@ -0,0 +1,54 @@
+# frame_scheduler.py
+# Agenda os quadros do editor: limita o FPS e, sem nada para redesenhar,
+# dorme em pg.event.wait em vez de girar o loop.
+import time
+
+import pygame as pg
+import config
+
+class FrameScheduler:
+    def __init__(self, max_fps=None, idle_wait_ms=None):
+        self.clock = pg.time.Clock()
+        self.max_fps = max_fps or config.MAX_FPS
+        self.idle_wait_ms = config.IDLE_WAIT_MS if idle_wait_ms is None else idle_wait_ms
+        self.dirty = True      # Algo mudou desde o último quadro
+        self.animating = False # Força quadros contínuos (ex.: cursor piscando)
+        self.frame_ms = 0.0    # Tempo gasto desenhando o último quadro
+        self._frame_start = 0.0
+
+    @property
+    def budget_ms(self):
+        return 1000.0 / self.max_fps
+
+    @property
+    def fps(self):
+        return self.clock.get_fps()
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def poll(self):
+        """Eventos pendentes. Se não há o que desenhar, bloqueia até chegar um.
+
+        Qualquer evento marca o quadro como sujo.
+        """
+        if self.dirty or self.animating:
+            events = pg.event.get()
+        else:
+            first = pg.event.wait(self.idle_wait_ms)
+            events = [] if first.type == pg.NOEVENT else [first] + pg.event.get()
+        if events:
+            self.dirty = True
+        return events
+
+    def begin_frame(self):
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Fecha o quadro e espera o que faltar para respeitar max_fps."""
+        self.frame_ms = (time.perf_counter() - self._frame_start) * 1000.0
+        self.dirty = False
+        self.clock.tick(self.max_fps)
+
+    def stats_text(self):
+        return f"{self.fps:.0f} FPS | {self.frame_ms:.1f}/{self.budget_ms:.1f} ms"
@@ -1,5 +1,13 @@
 # geometry.py
 import math
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional: sem ele locate_points testa ponto a ponto
+    np = None
+
+LOCATE_GRID_MAX = 1024 # Máximo de células por eixo na grade de locate_points
 
 def cross(ax, ay, bx, by):
     return ax*by - ay*bx
@@ -18,6 +26,54 @@ def area_polygon(poly):
         area += x1*y2 - x2*y1
     return area / 2.0
 
+def polygon_bbox(poly):
+    """Retorna (min_x, min_y, max_x, max_y) do polígono."""
+    xs = [p[0] for p in poly]
+    ys = [p[1] for p in poly]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def polygon_centroid(poly):
+    """Centroide da área do polígono (média dos vértices se a área for nula)."""
+    a = area_polygon(poly)
+    if abs(a) < 1e-12:
+        n = len(poly)
+        return (sum(p[0] for p in poly) / n, sum(p[1] for p in poly) / n)
+    cx = cy = 0.0
+    for i in range(len(poly)):
+        x1, y1 = poly[i]
+        x2, y2 = poly[(i+1) % len(poly)]
+        f = x1*y2 - x2*y1
+        cx += (x1 + x2) * f
+        cy += (y1 + y2) * f
+    return (cx / (6.0 * a), cy / (6.0 * a))
+
+def bbox_overlap(b1, b2, tol=0.0):
+    return not (b1[2] + tol < b2[0] or b2[2] + tol < b1[0] or
+                b1[3] + tol < b2[1] or b2[3] + tol < b1[1])
+
+def bbox_contains_point(bbox, pt, tol=1.0):
+    return (bbox[0] - tol <= pt[0] <= bbox[2] + tol and
+            bbox[1] - tol <= pt[1] <= bbox[3] + tol)
+
+def segment_intersects_box(a, b, bbox, eps=1e-9):
+    """True se o segmento a-b toca o retângulo (min_x, min_y, max_x, max_y) (Liang-Barsky)."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    for p, q in ((-dx, a[0] - bbox[0]), (dx, bbox[2] - a[0]),
+                 (-dy, a[1] - bbox[1]), (dy, bbox[3] - a[1])):
+        if abs(p) < eps:
+            if q < -eps:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1 + eps:
+            return False
+    return True
+
 def is_convex_polygon(poly):
     if len(poly) < 3: return False
     sign = 0
@@ -87,6 +143,15 @@ def point_in_poly(pt, poly):
                 inside = not inside
     return inside
 
+def point_in_poly_exact(pt, poly):
+    """Teste de paridade sem tolerância (pontos sobre o contorno seguem a regra do teste)."""
+    x, y = pt
+    inside = False
+    for (x1, y1), (x2, y2) in edges_of(poly):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
 def point_line_distance(p, a, b):
     ax, ay = a; bx, by = b; px, py = p
     vx, vy = bx - ax, by - ay
@@ -111,6 +176,39 @@ def segments_intersect(a1, a2, b1, b2):
         return True
     return (o1 > 0) != (o2 > 0) and (o3 > 0) != (o4 > 0)
 
+def proper_intersection(a1, a2, b1, b2, eps=1e-9):
+    """Ponto onde os segmentos se cruzam no interior de ambos, ou None.
+
+    Encostar (extremo sobre o outro segmento) ou sobrepor de forma colinear
+    não conta, então paredes compartilhadas não são cruzamentos.
+    """
+    dax, day = a2[0]-a1[0], a2[1]-a1[1]
+    dbx, dby = b2[0]-b1[0], b2[1]-b1[1]
+    denom = cross(dax, day, dbx, dby)
+    if abs(denom) < eps:
+        return None
+    t = cross(b1[0]-a1[0], b1[1]-a1[1], dbx, dby) / denom
+    u = cross(b1[0]-a1[0], b1[1]-a1[1], dax, day) / denom
+    tol = eps / max(eps, min(math.hypot(dax, day), math.hypot(dbx, dby))) + 1e-9
+    if tol < t < 1 - tol and tol < u < 1 - tol:
+        return (a1[0] + dax * t, a1[1] + day * t)
+    return None
+
+def point_strictly_in_poly(pt, poly, eps=1e-6):
+    """Como point_in_poly, mas pontos sobre (ou a eps de) o contorno ficam de fora."""
+    if len(poly) < 3:
+        return False
+    for a, b in edges_of(poly):
+        if point_line_distance(pt, a, b) <= eps:
+            return False
+    x, y = pt
+    inside = False
+    for (x1, y1), (x2, y2) in edges_of(poly):
+        if (y1 > y) != (y2 > y):
+            if x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+    return inside
+
 def polys_intersect(polyA, polyB):
     for a1, a2 in edges_of(polyA):
         for b1, b2 in edges_of(polyB):
@@ -156,12 +254,13 @@ def classify_segment(seg, splitter, eps=1e-6):
     sa = point_side(a, splitter)
     sb = point_side(b, splitter)
 
-    if sa > eps and sb > eps:
-        return "front"
-    if sa < -eps and sb < -eps:
-        return "back"
     if abs(sa) <= eps and abs(sb) <= eps:
         return "collinear"
+    # Um extremo sobre a reta não faz o segmento atravessá-la
+    if sa >= -eps and sb >= -eps:
+        return "front"
+    if sa <= eps and sb <= eps:
+        return "back"
     return "spanning"
 
 def split_segment(seg, splitter, eps=1e-6):
@@ -227,4 +326,301 @@ def all_collinear(segments, eps=1e-6):
         dax, day = b[0] - a[0], b[1] - a[1]
         if abs(dx * day - dy * dax) > eps:
             return False
-    return True
\ No newline at end of file
+        # Paralelos mas em retas diferentes não são colineares
+        if abs(point_side(a, segments[0])) > eps:
+            return False
+    return True
+
+def clip_segment(seg, line, keep_sign=1, eps=1e-6):
+    """Mantém a parte de `seg` em que keep_sign * point_side(p, line) >= 0."""
+    a, b = seg
+    da = keep_sign * point_side(a, line)
+    db = keep_sign * point_side(b, line)
+    if da >= -eps and db >= -eps:
+        return seg
+    if da < -eps and db < -eps:
+        return None
+    t = da / (da - db)
+    p = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+    return (a, p) if da >= -eps else (p, b)
+
+def clip_polygon(poly, line, keep_sign=1, eps=1e-6):
+    """Recorta um polígono convexo por um semiplano (Sutherland-Hodgman)."""
+    out = []
+    n = len(poly)
+    for i in range(n):
+        a = poly[i]
+        b = poly[(i+1) % n]
+        da = keep_sign * point_side(a, line)
+        db = keep_sign * point_side(b, line)
+        if da >= -eps:
+            out.append(a)
+        if (da > eps and db < -eps) or (da < -eps and db > eps):
+            t = da / (da - db)
+            out.append((a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t))
+    return out
+
+def clip_segment_to_convex(seg, poly, eps=1e-6):
+    """Parte de `seg` dentro de um polígono convexo anti-horário (ou None)."""
+    for edge in edges_of(poly):
+        seg = clip_segment(seg, edge, 1, eps)
+        if seg is None:
+            return None
+    return seg
+
+def weld_points(points, tol):
+    """Agrupa pontos a até `tol` uns dos outros usando um hash espacial.
+
+    Retorna {ponto: representante}; o representante é o primeiro ponto visto
+    do grupo, então pontos já alinhados à grade não se movem.
+    """
+    cells = defaultdict(list)
+    rep = {}
+    for p in points:
+        if p in rep:
+            continue
+        cx, cy = int(p[0] // tol), int(p[1] // tol)
+        found = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for q in cells.get((cx + dx, cy + dy), ()):
+                    if point_distance(p, q) <= tol:
+                        found = q
+                        break
+                if found is not None: break
+            if found is not None: break
+        if found is None:
+            cells[(cx, cy)].append(p)
+            rep[p] = p
+        else:
+            rep[p] = found
+    return rep
+
+def is_collinear_vertex(a, b, c, eps=1e-6):
+    """True se `b` está sobre o segmento a-c (b pode ser removido do contorno)."""
+    length = point_distance(a, c)
+    if length < eps:
+        return False
+    if abs(cross(b[0]-a[0], b[1]-a[1], c[0]-a[0], c[1]-a[1])) / length > eps:
+        return False
+    return (b[0]-a[0])*(c[0]-b[0]) + (b[1]-a[1])*(c[1]-b[1]) > 0
+
+# -----------------------------
+# Decomposição convexa
+# -----------------------------
+def _in_triangle(p, a, b, c, eps=1e-12):
+    d1 = cross(b[0]-a[0], b[1]-a[1], p[0]-a[0], p[1]-a[1])
+    d2 = cross(c[0]-b[0], c[1]-b[1], p[0]-b[0], p[1]-b[1])
+    d3 = cross(a[0]-c[0], a[1]-c[1], p[0]-c[0], p[1]-c[1])
+    has_neg = d1 < -eps or d2 < -eps or d3 < -eps
+    has_pos = d1 > eps or d2 > eps or d3 > eps
+    return not (has_neg and has_pos)
+
+def triangulate_polygon(poly, eps=1e-9):
+    """Triangulação de um polígono simples por remoção de orelhas, O(n²).
+
+    Retorna (triângulos, removidos): triângulos são triplas de índices de
+    `poly` na mesma orientação; removidos lista (i, j, k) para cada vértice
+    j colinear descartado entre i e k. Retorna None se nenhuma orelha for
+    encontrada (contorno não simples).
+    """
+    n = len(poly)
+    if n < 3:
+        return None
+    sign = 1 if area_polygon(poly) >= 0 else -1
+    idx = list(range(n))
+    tris, dropped = [], []
+    while len(idx) > 3:
+        m = len(idx)
+        for k in range(m):
+            i, j, l = idx[k - 1], idx[k], idx[(k + 1) % m]
+            a, b, c = poly[i], poly[j], poly[l]
+            turn = sign * cross(b[0]-a[0], b[1]-a[1], c[0]-b[0], c[1]-b[1])
+            if abs(turn) <= eps:
+                if (b[0]-a[0])*(c[0]-b[0]) + (b[1]-a[1])*(c[1]-b[1]) < 0:
+                    continue # Espinho (volta sobre si mesmo), não é orelha
+                dropped.append((i, j, l))
+                del idx[k]
+                break
+            if turn < 0:
+                continue # Vértice reflexo
+            if any(_in_triangle(poly[q], a, b, c) for q in idx
+                   if q not in (i, j, l) and poly[q] not in (a, b, c)):
+                continue
+            tris.append((i, j, l))
+            del idx[k]
+            break
+        else:
+            return None
+    a, b, c = (poly[q] for q in idx)
+    if abs(cross(b[0]-a[0], b[1]-a[1], c[0]-b[0], c[1]-b[1])) > eps:
+        tris.append(tuple(idx))
+    return tris, dropped
+
+def _merge_pieces(pa, pb, u, v):
+    """Une duas peças pela diagonal: pa contém u->v e pb contém v->u."""
+    ia, ib = pa.index(v), pb.index(u)
+    a_rot = pa[ia:] + pa[:ia]   # v ... u
+    b_rot = pb[ib:] + pb[:ib]   # u ... v
+    return a_rot + b_rot[1:-1]
+
+def convex_decompose(poly):
+    """Divide um polígono simples em peças convexas (Hertel-Mehlhorn).
+
+    Triangula por orelhas e remove toda diagonal cuja retirada mantém a
+    união convexa; o resultado tem no máximo 4x o mínimo de peças.
+    Retorna (peças, diagonais): listas de pontos na orientação de `poly`
+    e as diagonais restantes como pares de pontos. None se não for simples.
+    """
+    result = triangulate_polygon(poly)
+    if result is None:
+        return None
+    tris, dropped = result
+    pieces = [list(t) for t in tris]
+
+    def piece_with(u, v):
+        for p in pieces:
+            for i in range(len(p)):
+                if p[i] == u and p[(i + 1) % len(p)] == v:
+                    return p
+        return None
+
+    diagonals = []
+    seen = set()
+    for t in tris:
+        for i in range(3):
+            u, v = t[i], t[(i + 1) % 3]
+            if (v, u) in seen:
+                diagonals.append((u, v))
+            seen.add((u, v))
+
+    kept = []
+    for u, v in diagonals:
+        pa, pb = piece_with(u, v), piece_with(v, u)
+        merged = _merge_pieces(pa, pb, u, v)
+        if is_convex_polygon([poly[q] for q in merged]):
+            pieces.remove(pa)
+            pieces.remove(pb)
+            pieces.append(merged)
+        else:
+            kept.append((u, v))
+
+    # Devolve os vértices colineares descartados às arestas de onde saíram
+    for i, j, l in reversed(dropped):
+        for p in pieces:
+            for a, b in ((i, l), (l, i)):
+                for k in range(len(p)):
+                    if p[k] == a and p[(k + 1) % len(p)] == b:
+                        p.insert(k + 1, j)
+                        break
+
+    return ([[poly[q] for q in p] for p in pieces],
+            [(poly[u], poly[v]) for u, v in kept])
+
+# -----------------------------
+# Localização de pontos em lote
+# -----------------------------
+def _locate_grid(boxes):
+    """(x0, y0, tamanho da célula, nx, ny) da grade que cobre os bboxes.
+
+    A célula tem o tamanho mediano dos bboxes, então cada ponto costuma ter
+    poucos polígonos candidatos.
+    """
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    span_x = max(b[2] for b in boxes) - x0
+    span_y = max(b[3] for b in boxes) - y0
+    sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for b in boxes)
+    size = max(sizes[len(sizes) // 2], span_x / LOCATE_GRID_MAX, span_y / LOCATE_GRID_MAX, 1e-9)
+    return x0, y0, size, int(span_x // size) + 1, int(span_y // size) + 1
+
+def locate_points(points, polys, boxes=None):
+    """Índice do primeiro polígono de `polys` que contém cada ponto (-1 se nenhum).
+
+    A ordem de `polys` é a prioridade (ex.: setores mais profundos primeiro).
+    Os pares ponto/polígono candidatos saem de uma grade sobre os bboxes e
+    o teste de paridade (crossing number) roda sobre todos os pares de uma
+    vez com NumPy, aresta a aresta. Pontos exatamente sobre o contorno seguem
+    a regra do teste, sem a tolerância de point_in_poly. Retorna um array
+    com NumPy e uma lista sem ele.
+    """
+    if boxes is None:
+        boxes = [polygon_bbox(p) for p in polys]
+    if np is None:
+        return _locate_points_py(points, polys, boxes)
+
+    P = np.asarray(points, dtype=float).reshape(-1, 2)
+    result = np.full(len(P), -1, dtype=np.int64)
+    if not len(P) or not len(polys):
+        return result
+    x0, y0, size, nx, ny = _locate_grid(boxes)
+    B = np.asarray(boxes, dtype=float)
+
+    # Pontos ordenados pela célula (chave cx * ny + cy); fora da grade não há candidatos
+    cx = np.floor((P[:, 0] - x0) / size).astype(np.int64)
+    cy = np.floor((P[:, 1] - y0) / size).astype(np.int64)
+    keys = np.where((cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny), cx * ny + cy, nx * ny)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    # Cada coluna de células de um bbox é um intervalo contíguo de chaves
+    c0 = np.floor((B[:, :2] - (x0, y0)) / size).astype(np.int64)
+    c1 = np.minimum(np.floor((B[:, 2:] - (x0, y0)) / size).astype(np.int64), (nx - 1, ny - 1))
+    ncols = c1[:, 0] - c0[:, 0] + 1
+    col_poly = np.repeat(np.arange(len(B)), ncols)
+    col = c0[col_poly, 0] + np.arange(len(col_poly)) - np.repeat(np.cumsum(ncols) - ncols, ncols)
+    starts = np.searchsorted(sorted_keys, col * ny + c0[col_poly, 1], "left")
+    ends = np.searchsorted(sorted_keys, col * ny + c1[col_poly, 1] + 1, "left")
+    counts = ends - starts
+    pair_poly = np.repeat(col_poly, counts)
+    pair_pt = order[np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())]
+
+    # Filtro exato pelo bbox antes do teste de paridade
+    px, py = P[pair_pt, 0], P[pair_pt, 1]
+    bb = B[pair_poly]
+    keep = (px >= bb[:, 0]) & (px <= bb[:, 2]) & (py >= bb[:, 1]) & (py <= bb[:, 3])
+    pair_poly, pair_pt, px, py = pair_poly[keep], pair_pt[keep], px[keep], py[keep]
+
+    # Arestas em um array (polígonos, k, 4); as sobras repetem o último vértice
+    # e viram arestas degeneradas que nunca cruzam o raio
+    k_max = max(len(p) for p in polys)
+    E = np.zeros((len(polys), k_max + 1, 2))
+    for i, poly in enumerate(polys):
+        if len(poly) >= 3:
+            E[i, :len(poly)] = poly
+            E[i, len(poly):] = poly[0]
+    inside = np.zeros(len(pair_pt), dtype=bool)
+    for k in range(k_max):
+        a, b = E[pair_poly, k], E[pair_poly, k + 1]
+        crossing = (a[:, 1] > py) != (b[:, 1] > py)
+        dy = np.where(crossing, b[:, 1] - a[:, 1], 1.0)
+        inside ^= crossing & (px < (b[:, 0] - a[:, 0]) * (py - a[:, 1]) / dy + a[:, 0])
+
+    # Para cada ponto fica o polígono de menor índice (maior prioridade)
+    pair_poly, pair_pt = pair_poly[inside], pair_pt[inside]
+    first = np.lexsort((pair_poly, pair_pt))
+    pair_poly, pair_pt = pair_poly[first], pair_pt[first]
+    head = np.ones(len(pair_pt), dtype=bool)
+    head[1:] = pair_pt[1:] != pair_pt[:-1]
+    result[pair_pt[head]] = pair_poly[head]
+    return result
+
+def _locate_points_py(points, polys, boxes):
+    result = [-1] * len(points)
+    if not points or not polys:
+        return result
+    x0, y0, size, nx, ny = _locate_grid(boxes)
+    cells = defaultdict(list) # (cx, cy) -> índices dos polígonos, em ordem de prioridade
+    for i, (min_x, min_y, max_x, max_y) in enumerate(boxes):
+        for cx in range(int((min_x - x0) // size), min(int((max_x - x0) // size), nx - 1) + 1):
+            for cy in range(int((min_y - y0) // size), min(int((max_y - y0) // size), ny - 1) + 1):
+                cells[(cx, cy)].append(i)
+    for j, (x, y) in enumerate(points):
+        for i in cells.get((math.floor((x - x0) / size), math.floor((y - y0) / size)), ()):
+            min_x, min_y, max_x, max_y = boxes[i]
+            if not (min_x <= x <= max_x and min_y <= y <= max_y) or len(polys[i]) < 3:
+                continue
+            if point_in_poly_exact((x, y), polys[i]):
+                result[j] = i
+                break
+    return result
@@ -1,4 +1,5 @@
 # main_editor.py
+import os
 import sys
 import pygame as pg
 import threading
@@ -11,68 +12,120 @@ import geometry as geo
 import map_manager as mm
 import ui
 import render
+import validate
+import chunks
+import streaming
+import compression
+from frame_scheduler import FrameScheduler
 from data_structures import ATTRIBUTE_REGISTRY, Entity, ENTITY_ATTRIBUTE_REGISTRY
 
 # -----------------------------
 # Variáveis de Estado
 # -----------------------------
 # show_grid, use_snap, mode, message movidos para ui.py
-# sectors, current_vertices, selected_sector movidos para map_manager.py
+# sectors, current_vertices, selected_sector movidos para map_manager.py (mm.doc)
+streamer = None # Mapa em blocos aberto com carregamento sob demanda (streaming.TileStreamer)
 
 # -----------------------------
 # Inicialização
 # -----------------------------
-pg.init()
-screen = pg.display.set_mode((config.W, config.H))
-pg.display.set_caption("2D Map Editor")
-
-try:
-    font = pg.font.SysFont('Consolas', 18)
-except:
-    font = pg.font.Font(None, 24) # Fallback
-
-ui.init_ui(font)
+def load_font(name, size):
+    """Fonte do sistema, com o caminho resolvido guardado em FONT_CACHE_FILE.
+
+    pg.font.match_font enumera as fontes instaladas, o que é lento em
+    máquinas com muitas fontes; o resultado é reaproveitado entre execuções.
+    """
+    cache = {}
+    if os.path.exists(config.FONT_CACHE_FILE):
+        try:
+            with open(config.FONT_CACHE_FILE, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+    path = cache.get(name)
+    if name not in cache or (path and not os.path.exists(path)):
+        # None também é guardado: a fonte não existe e o fallback é usado direto
+        path = cache[name] = pg.font.match_font(name)
+        try:
+            with open(config.FONT_CACHE_FILE, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError:
+            pass # Sem cache, só fica mais lento na próxima vez
+    try:
+        return pg.font.Font(path, size) if path else pg.font.Font(None, 24) # Fallback
+    except (OSError, RuntimeError):
+        return pg.font.Font(None, 24)
 
 # -----------------------------
 # Funções de Ação (Callbacks)
 # -----------------------------
 
-def handle_prompt_input(prompt):
-    """Função para simular uma caixa de entrada (bloqueante)."""
-    print(prompt, end="")
-    try:
-        user_input = input()
-        return user_input.strip()
-    except EOFError:
-        return ""
-
 def on_export():
-    map_name = handle_prompt_input("Nome da pasta para exportar (ex: 'mapa_fase_1'): ")
-    if map_name:
+    def done(map_name):
+        if not map_name:
+            ui.set_message("Exportação cancelada.")
+            return
         try:
+            if streamer is not None:
+                # Só parte do mapa está na memória: regrava os blocos alterados
+                if os.path.normpath(map_name) != os.path.normpath(streamer.folder):
+                    ui.set_message(f"Mapa em blocos: salve na própria pasta '{streamer.folder}'.")
+                    return
+                written = streamer.flush()
+                ui.set_message(f"Mapa '{map_name}' salvo: {written} blocos regravados.")
+                return
             # Chama a função atualizada do map_manager
-            msg = mm.export_map(map_name) 
+            export_args = {"pvs": config.EXPORT_PVS,
+                           "blockmap_cell": config.BLOCKMAP_CELL if config.EXPORT_BLOCKMAP else None,
+                           "codec": config.EXPORT_CODEC, "level": config.EXPORT_LEVEL,
+                           "elide_defaults": config.EXPORT_ELIDE_DEFAULTS}
+            if config.INCREMENTAL_SAVE and not config.EXPORT_TILE_SIZE:
+                # Mesma pasta do último save: só as mudanças vão para changes.jsonl
+                msg = mm.doc.save_incremental(map_name, **export_args)
+            else:
+                msg = mm.doc.export_map(map_name, tile_size=config.EXPORT_TILE_SIZE, **export_args)
+            mm.doc.start_journal(config.JOURNAL_FILE, map_name) # Estado salvo: novo ponto de partida
+            issues = mm.doc.validate_map()
+            if issues:
+                msg += f" Aviso: {validate.summarize(issues)} [V] para ver."
             ui.set_message(msg)
         except Exception as e:
             ui.set_message(f"ERRO ao exportar: {e}")
-    else:
-        ui.set_message("Exportação cancelada.")
+    ui.begin_prompt("Nome da pasta para exportar (ex: 'mapa_fase_1'):", done)
 
 def on_load():
-    map_name = handle_prompt_input("Nome da pasta para carregar (ex: 'mapa_fase_1'): ")
-    if map_name:
+    def done(map_name):
+        if not map_name:
+            ui.set_message("Carregamento cancelado.")
+            return
+        global streamer
         try:
+            streaming.close(streamer)
+            streamer = None
+            if chunks.is_tiled(map_name) and not compression.exists(os.path.join(map_name, "map.json")):
+                streamer = streaming.open_tiled(map_name)
+                mm.doc.start_journal(config.JOURNAL_FILE, map_name)
+                ui.set_message(f"Mapa em blocos '{map_name}' aberto: "
+                               f"{len(streamer.index['tiles'])} blocos, carregados perto da câmera.")
+                ui.rebuild_attr_panel()
+                return
             # Chama a função atualizada do map_manager
-            msg = mm.load_map(map_name)
+            msg = mm.doc.load_map(map_name)
+            if not msg.startswith("ERRO"):
+                mm.doc.start_journal(config.JOURNAL_FILE, map_name)
             ui.set_message(msg)
             ui.rebuild_attr_panel() 
         except Exception as e:
             ui.set_message(f"ERRO ao carregar: {e}")
-    else:
-        ui.set_message("Carregamento cancelado.")
+    ui.begin_prompt("Nome da pasta para carregar (ex: 'mapa_fase_1'):", done)
 
 def on_clear():
-    msg = mm.clear_map()
+    global streamer
+    streaming.close(streamer)
+    streamer = None
+    msg = mm.doc.clear_map()
+    mm.doc.start_journal(config.JOURNAL_FILE, None)
     ui.set_message(msg)
     ui.rebuild_attr_panel()
 
@@ -80,245 +133,317 @@ def toggle_bsp():
     ui.toggle_bsp()
     ui.rebuild_ui(on_export, on_load, on_clear, toggle_bsp) # Atualiza o botão
 
-# Reconstruir UI com as novas funções de callback
-ui.rebuild_ui(on_export, on_load, on_clear, toggle_bsp)
-
 def handle_entity_creation(grid_map):
-    """Lógica para criar uma entidade após a entrada do tipo."""
-    entity_type = handle_prompt_input("Tipo da entidade (skill_level, is_enemy): ")
+    """Pede o tipo e cria a entidade onde o usuário clicou."""
     mx, my = pg.mouse.get_pos()
-    
-    if entity_type:
-        msg = mm.add_entity((mx, my), entity_type, grid_map)
-        ui.set_message(msg)
-    else:
-        ui.set_message("Criação de entidade cancelada.")
-    ui.rebuild_attr_panel()
+
+    def done(entity_type):
+        if entity_type:
+            msg = mm.doc.add_entity((mx, my), entity_type, grid_map)
+            ui.set_message(msg)
+        else:
+            ui.set_message("Criação de entidade cancelada.")
+        ui.rebuild_attr_panel()
+    ui.begin_prompt("Tipo da entidade (skill_level, is_enemy):", done)
 
 def handle_attribute_input(key, obj ):
-    """Lógica para receber entrada de texto do usuário para um atributo."""
+    """Pede, na caixa de texto da janela, o novo valor de um atributo."""
     if not obj: return
 
-    prompt = f"Novo valor para {key} (ou 'r' para remover): "
-    
-    # Simulação de input box (Pygame não tem um fácil)
-    # Na prática, você precisaria de uma biblioteca de UI ou uma implementação própria.
-    # Aqui, se usa o input() do console como fallback, o que bloqueia o Pygame.
-    # Para um editor real, isso deve ser uma janela de diálogo do Pygame.
-    
-    # Apenas como placeholder:
-    print(prompt, end="")
-    try:
-        new_val = input()
-    except EOFError: # Acontece em alguns ambientes de execução
-        return
-    
     obj_name = "Entidade" if isinstance(obj, Entity) else "Setor"
     obj_id = obj.id
-    
-    if new_val.lower() == 'r':
-        # Usa o 'obj' para remover
-        mm.remove_attrs(obj, [key])
-        ui.set_message(f"Atributo {key} removido de {obj_name} {obj_id}")
-    else:
-        # Usa o 'obj' para setar
-        if mm.set_attr(obj, key, new_val):
-            ui.set_message(f"Atributo {key} definido para {new_val} em {obj_name} {obj_id}")
+
+    def done(new_val):
+        if not new_val:
+            ui.set_message("Atribuição cancelada.")
+        elif new_val.lower() == 'r':
+            # Usa o 'obj' para remover
+            mm.doc.remove_attrs(obj, [key])
+            ui.set_message(f"Atributo {key} removido de {obj_name} {obj_id}")
         else:
-            ui.set_message(f"ERRO: Valor inválido para o tipo de {key}.")
-    
-    ui.rebuild_attr_panel() # Atualiza a UI
+            # Usa o 'obj' para setar
+            if mm.doc.set_attr(obj, key, new_val):
+                ui.set_message(f"Atributo {key} definido para {new_val} em {obj_name} {obj_id}")
+            else:
+                ui.set_message(f"ERRO: Valor inválido para o tipo de {key}.")
+        ui.rebuild_attr_panel() # Atualiza a UI
+    ui.begin_prompt(f"Novo valor para {key} (ou 'r' para remover):", done)
 
 # -----------------------------
 # Loop Principal
 # -----------------------------
-running = True
-while running:
-    for e in pg.event.get():
-        if e.type == pg.QUIT:
-            running = False
-
-        # Tratar eventos de botão primeiro
-        if ui.handle_ui_event(e):
-            continue
+def main():
+    # Só os módulos usados (pg.init() também abriria áudio e joystick)
+    pg.display.init()
+    pg.font.init()
+    screen = pg.display.set_mode((config.W, config.H))
+    pg.display.set_caption("2D Map Editor")
+
+    ui.init_ui(load_font("Consolas", 18))
+    # Reconstruir UI com as novas funções de callback
+    ui.rebuild_ui(on_export, on_load, on_clear, toggle_bsp)
+
+    # Diário de comandos: guarda o diário da sessão anterior para recuperação [R]
+    previous_journal = config.JOURNAL_FILE + ".prev"
+    grabbed_vertex = None # vid sendo movido com [M]
+    validation = {"key": None, "issues": []} # Último resultado de [V] e a geometria validada
+    if mm.journal_has_changes(config.JOURNAL_FILE):
+        os.replace(config.JOURNAL_FILE, previous_journal)
+        ui.set_message("Sessão anterior não salva encontrada: [R] para recuperar.")
+    mm.doc.start_journal(config.JOURNAL_FILE, None)
+
+    scheduler = FrameScheduler()
+    running = True
+    while running:
+        for e in scheduler.poll():
+            if e.type == pg.QUIT:
+                running = False
+
+            # Tratar eventos de botão primeiro
+            if ui.handle_ui_event(e):
+                continue
+
+            # Lógica de Input no painel de visualização
+            if e.type == pg.MOUSEWHEEL :
+                if e.y > 0: # scroll para cima
+                    config.GRID = max(2, config.GRID - 1) # diminui tamanho da célula
+                elif e.y < 0: # scroll para baixo
+                    config.GRID = max(2, config.GRID + 1) # aumenta o tamanho da célula
+                ui.set_message(f"Zoom ajustado: GRID={config.GRID}")
+                ui.rebuild_help_panel()
+            if e.type == pg.MOUSEBUTTONDOWN and e.button == 1:
+                mx, my = e.pos
+                if mx < config.VIEW_W: # Clique na área de desenho
+                    if ui.mode == "draw":
+                        # Adicionar vértice
+                        mm.doc.add_vertex(mx, my, config.GRID, ui.use_snap)
+                        ui.set_message(f"Vértice adicionado: ({mx}, {my})")
+                    elif ui.mode == "select":#Modo select
+                        # Tentar selecionar entidade(Prioridade)
+                        msg = mm.doc.pick_entity(mx, my, config.GRID)
+                        if mm.doc.selected_entity is None:
+                            #Se não selecionou entidade, seleciona setor.
+                            msg = mm.doc.pick_sector(mx, my, config.GRID)
+                        ui.set_message(msg)
+                    elif ui.mode == "portal": #Modo portal
+                        # Tentar criar portal
+                        if mm.doc.try_create_portal_at_point((mx, my), config.GRID):
+                            ui.set_message("Portal criado/alterado.")
+                        else:
+                            ui.set_message("Nenhuma dica de portal encontrada no local.")
+                    elif ui.mode == "entity":#Modo entity
+                        # Cria entidade na posição do clique
+                        handle_entity_creation(config.GRID)
+                    ui.rebuild_attr_panel()
 
-        # Lógica de Input no painel de visualização
-        if e.type == pg.MOUSEWHEEL :
-            if e.y > 0: # scroll para cima
-                config.GRID = max(2, config.GRID - 1) # diminui tamanho da célula
-            elif e.y < 0: # scroll para baixo
-                config.GRID = max(2, config.GRID + 1) # aumenta o tamanho da célula
-            ui.set_message(f"Zoom ajustado: GRID={config.GRID}")
-            ui.rebuild_help_panel()
-        if e.type == pg.MOUSEBUTTONDOWN and e.button == 1:
-            mx, my = e.pos
-            if mx < config.VIEW_W: # Clique na área de desenho
+            elif e.type == pg.MOUSEBUTTONDOWN and e.button == 3:
                 if ui.mode == "draw":
-                    # Adicionar vértice
-                    mm.add_vertex(mx, my, config.GRID, ui.use_snap)
-                    ui.set_message(f"Vértice adicionado: ({mx}, {my})")
-                elif ui.mode == "select":#Modo select
-                    # Tentar selecionar entidade(Prioridade)
-                    msg = mm.pick_entity(mx, my, config.GRID)
-                    if mm.selected_entity is None:
-                        #Se não selecionou entidade, seleciona setor.
-                        msg = mm.pick_sector(mx, my, config.GRID)
+                    # Fechar polígono
+                    msg = mm.doc.close_sector()
                     ui.set_message(msg)
-                elif ui.mode == "portal": #Modo portal
-                    # Tentar criar portal
-                    if mm.try_create_portal_at_point((mx, my), config.GRID):
-                        ui.set_message("Portal criado/alterado.")
+                    ui.rebuild_attr_panel() # Pode mudar a seleção
+                elif ui.mode == "select":
+                    # Limpar seleção
+                    mm.doc.selected_sector = None
+                    mm.doc.selected_entity = None
+                    ui.set_message("Seleção limpa.")
+                    ui.rebuild_attr_panel()
+                elif ui.mode == "entity":
+                    msg = mm.doc.remove_entity(mm.doc.selected_entity)
+                    ui.set_message(msg)
+                    ui.rebuild_attr_panel()
+
+            # Teclas
+            elif e.type == pg.KEYDOWN:
+                if e.key == pg.K_ESCAPE:
+                    running = False
+
+                elif e.key == pg.K_TAB:
+                    # Ciclagem de modos
+                    if ui.mode == "draw":
+                        ui.set_mode("select")
+                    elif ui.mode == "select":
+                        ui.set_mode("portal")
+                        mm.doc.compute_portal_hints() # Recalcula hints ao entrar no modo portal
+                    elif ui.mode == "portal":
+                        ui.set_mode("entity")
                     else:
-                        ui.set_message("Nenhuma dica de portal encontrada no local.")
-                elif ui.mode == "entity":#Modo entity
-                    # Cria entidade na posição do clique
-                    handle_entity_creation(config.GRID)
-                ui.rebuild_attr_panel()
+                        ui.set_mode("draw")
+
+                elif e.key == pg.K_LEFT:
+                    config.CAM_OFFSET_X += config.GRID
+                elif e.key == pg.K_RIGHT:
+                    config.CAM_OFFSET_X -= config.GRID
+                elif e.key == pg.K_UP:
+                    config.CAM_OFFSET_Y += config.GRID
+                elif e.key == pg.K_DOWN:
+                    config.CAM_OFFSET_Y -= config.GRID
+
+                elif e.key == pg.K_e:
+                    on_export()
+
+                elif e.key == pg.K_b:
+                    toggle_bsp()
+
+                elif e.key == pg.K_c:
+                    # Solda vértices e funde arestas colineares
+                    ui.set_message(mm.doc.cleanup_geometry())
+                    ui.rebuild_attr_panel()
 
-        elif e.type == pg.MOUSEBUTTONDOWN and e.button == 3:
-            if ui.mode == "draw":
-                # Fechar polígono
-                msg = mm.close_sector()
-                ui.set_message(msg)
-                ui.rebuild_attr_panel() # Pode mudar a seleção
-            elif ui.mode == "select":
-                # Limpar seleção
-                mm.selected_sector = None
-                mm.selected_entity = None
-                ui.set_message("Seleção limpa.")
-                ui.rebuild_attr_panel()
-            elif ui.mode == "entity":
-                msg = mm.remove_entity(mm.selected_entity)
-                ui.set_message(msg)
-                ui.rebuild_attr_panel()
+                elif e.key == pg.K_v:
+                    validation["issues"] = mm.doc.validate_map()
+                    validation["key"] = mm.doc.geometry_key()
+                    ui.set_message(validate.summarize(validation["issues"]))
 
-        # Teclas
-        elif e.type == pg.KEYDOWN:
-            if e.key == pg.K_ESCAPE:
-                running = False
-            
-            elif e.key == pg.K_TAB:
-                # Ciclagem de modos
-                if ui.mode == "draw":
-                    ui.set_mode("select")
-                elif ui.mode == "select":
-                    ui.set_mode("portal")
-                    mm.compute_portal_hints() # Recalcula hints ao entrar no modo portal
-                elif ui.mode == "portal":
-                    ui.set_mode("entity")
-                else:
-                    ui.set_mode("draw")
-
-            elif e.key == pg.K_LEFT:
-                config.CAM_OFFSET_X += config.GRID
-            elif e.key == pg.K_RIGHT:
-                config.CAM_OFFSET_X -= config.GRID
-            elif e.key == pg.K_UP:
-                config.CAM_OFFSET_Y += config.GRID
-            elif e.key == pg.K_DOWN:
-                config.CAM_OFFSET_Y -= config.GRID
-
-            elif e.key == pg.K_e:
-                on_export()
-
-            elif e.key == pg.K_b:
-                toggle_bsp()
-
-            elif e.key == pg.K_g:
-                ui.toggle_grid()
-                ui.rebuild_help_panel()
+                elif e.key == pg.K_f:
+                    if render.find_player_spawn() is None:
+                        ui.set_message("Prévia requer uma entidade player_spawn.")
+                    else:
+                        ui.toggle_preview()
+                    ui.rebuild_help_panel()
 
-            elif e.key == pg.K_s:
-                ui.toggle_snap()
-                ui.rebuild_help_panel()
+                elif e.key == pg.K_g:
+                    ui.toggle_grid()
+                    ui.rebuild_help_panel()
 
-            elif e.key == pg.K_n:
-                mm.current_vertices.clear()
-                ui.set_message("Limpo vértices atuais.")
-                ui.rebuild_attr_panel()
+                elif e.key == pg.K_s:
+                    ui.toggle_snap()
+                    ui.rebuild_help_panel()
 
-            elif e.key == pg.K_z:
-                if mm.current_vertices:
-                    mm.current_vertices.pop()
-                    ui.set_message("Desfeito último vértice.")
+                elif e.key == pg.K_n:
+                    mm.doc.current_vertices.clear()
+                    ui.set_message("Limpo vértices atuais.")
                     ui.rebuild_attr_panel()
 
-            elif e.key == pg.K_DELETE:
-                #Prioridade em deletar entidade
-                if mm.selected_entity:
-                    msg = mm.remove_entity(mm.selected_entity)
-                    ui.set_message(msg)
+                elif e.key == pg.K_z:
+                    if mm.doc.current_vertices:
+                        mm.doc.current_vertices.pop()
+                        ui.set_message("Desfeito último vértice.")
+                    else:
+                        ui.set_message(mm.doc.undo())
+                    ui.rebuild_attr_panel()
+
+                elif e.key == pg.K_y:
+                    ui.set_message(mm.doc.redo())
+                    ui.rebuild_attr_panel()
+
+                elif e.key == pg.K_r:
+                    if os.path.exists(previous_journal):
+                        ui.set_message(mm.doc.replay_journal(previous_journal))
+                        os.remove(previous_journal)
+                    else:
+                        ui.set_message("Nenhuma sessão para recuperar.")
                     ui.rebuild_attr_panel()
-                    
-                elif mm.selected_sector:
-                    mm.sectors.remove(mm.selected_sector)
-                    mm.selected_sector = None
-                    mm.rebuild_indices()
-                    ui.set_message("Setor deletado.")
+
+                elif e.key == pg.K_m and ui.mode == "select" and mm.doc.selected_entity:
+                    mx, my = pg.mouse.get_pos()
+                    ui.set_message(mm.doc.move_entity(mm.doc.selected_entity, mm.screen_to_map(mx, my)))
                     ui.rebuild_attr_panel()
 
-            elif e.key == pg.K_w and ui.mode == "select" and mm.selected_sector:
-                # Atributo de parede (Portal ID, Textura, etc.).
-                walls_vertices = mm.selected_sector.outer + mm.selected_sector.outer[:1]
-                mx, my = pg.mouse.get_pos()
-
-                # Procura a parede mais proxima do cursor.
-                for i in range(len(mm.selected_sector.outer)):
-                    v1 = walls_vertices[i]
-                    v2 = walls_vertices[i+1]
-
-                    # Verifica se o ponto está proximo da linha.
-                    d = geo.point_line_distance((mx, my), v1, v2)
-                    if d < config.TOLERANCE:
-                        key = f"wall_{i}"
-                        obj = mm.selected_sector
-                        handle_attribute_input(key, obj)
-                        break
-                else:
-                    ui.set_message("Nenhuma parede próxima.")
-            
-            elif e.key == pg.K_a and ui.mode == "select":
-                
-                # Define o objeto a ser modificado: prioriza Entidade sobre Setor
-                obj = mm.selected_entity if mm.selected_entity else mm.selected_sector
-                
-                if obj:
-                    
-                    prompt_msg = "Atributo (hp, mass, floor_h, etc.) > "
-                    prompt_key = handle_prompt_input(prompt_msg)
-                    
-                    if prompt_key:
-                        handle_attribute_input(prompt_key, obj)
+                elif e.key == pg.K_m and ui.mode == "select":
+                    # 1º [M] pega o vértice sob o cursor, 2º [M] solta (com snap)
+                    mx, my = pg.mouse.get_pos()
+                    if grabbed_vertex is None:
+                        grabbed_vertex = mm.doc.vertex_near(mm.screen_to_map(mx, my),
+                                                        config.PICK_RADIUS_PX / config.GRID)
+                        if grabbed_vertex is None:
+                            ui.set_message("Nenhum vértice próximo.")
+                        else:
+                            ui.set_message(f"Vértice {grabbed_vertex} selecionado: [M] para soltar.")
+                    else:
+                        pos = mm.snap_screen_point(mx, my, config.GRID, ui.use_snap)
+                        ui.set_message(mm.doc.move_vertex(grabbed_vertex, pos))
+                        grabbed_vertex = None
+                        ui.rebuild_attr_panel()
+
+                elif e.key == pg.K_DELETE:
+                    #Prioridade em deletar entidade
+                    if mm.doc.selected_entity:
+                        msg = mm.doc.remove_entity(mm.doc.selected_entity)
+                        ui.set_message(msg)
+                        ui.rebuild_attr_panel()
+
+                    elif mm.doc.selected_sector:
+                        # Shift+DEL remove também os cômodos filhos
+                        cascade = bool(e.mod & pg.KMOD_SHIFT)
+                        msg = mm.doc.remove_sector(mm.doc.selected_sector, cascade=cascade)
+                        ui.set_message(msg)
+                        ui.rebuild_attr_panel()
+
+                elif e.key == pg.K_w and ui.mode == "select" and mm.doc.selected_sector:
+                    # Atributo de parede (Portal ID, Textura, etc.).
+                    # Procura a parede mais próxima do cursor pelo blockmap.
+                    mx, my = pg.mouse.get_pos()
+                    pt = mm.screen_to_map(mx, my)
+                    near = mm.doc.walls_near(pt, config.PICK_RADIUS_PX / config.GRID, mm.doc.selected_sector.id)
+                    if near:
+                        _, _, wall = near[0]
+                        handle_attribute_input(f"wall_{wall.edge_index}", mm.doc.selected_sector)
                     else:
-                        ui.set_message("Atribuição cancelada.")
-                else:
-                    ui.set_message("Nenhum setor ou entidade selecionada.")
-            
-            
-
-    # --- Lógica de Renderização ---
-    screen.fill(config.COL_BG)
-
-    if ui.show_grid:
-        render.draw_grid(screen)
-
-    # Reconstrução da BSP para visualização (custoso, mas apenas para debug)
-    walls = mm.build_walls(mm.sectors)
-    bsp_root = mm.build_bsp_from_walls(walls)
-
-    if ui.show_bsp: 
-        # Desenha a BSP (apenas a estrutura, não a renderização do jogo)
-        render.draw_bsp(screen, bsp_root)
-    else:
-        # Desenha setores e paredes no modo editor
-        render.draw_sectors_and_walls(screen, mode=ui.mode)
-
-    render.draw_entities(screen)
-    
-    render.draw_current(screen)
-    ui.draw_ui(screen)
-    
-    pg.display.flip()
-
-pg.quit()
-sys.exit()
+                        ui.set_message("Nenhuma parede próxima.")
+
+                elif e.key == pg.K_a and ui.mode == "select":
+
+                    # Define o objeto a ser modificado: prioriza Entidade sobre Setor
+                    obj = mm.doc.selected_entity if mm.doc.selected_entity else mm.doc.selected_sector
+
+                    if obj:
+                        def on_key(prompt_key, obj=obj):
+                            if prompt_key:
+                                handle_attribute_input(prompt_key, obj)
+                            else:
+                                ui.set_message("Atribuição cancelada.")
+                        ui.begin_prompt("Atributo (hp, mass, floor_h, etc.):", on_key)
+                    else:
+                        ui.set_message("Nenhum setor ou entidade selecionada.")
+
+
+
+        # --- Lógica de Renderização ---
+        # Só redesenha quando houve entrada ou mudança de estado
+        if not scheduler.dirty:
+            continue
+        scheduler.begin_frame()
+        if streamer is not None:
+            # Blocos perto da câmera entram; os distantes saem pelo orçamento
+            streamer.update(mm.screen_to_map(0, 0) + mm.screen_to_map(config.VIEW_W, config.H))
+        stats = scheduler.stats_text()
+        ui.set_frame_stats(stats if streamer is None else f"{stats}  {streamer.status_text()}")
+        screen.fill(config.COL_BG)
+
+        spawn = render.find_player_spawn() if ui.show_preview else None
+        if spawn is not None:
+            # Prévia em primeira pessoa a partir do player_spawn.
+            # As paredes são refeitas porque marcar portais não muda a BSP.
+            render.draw_first_person(screen, mm.doc.get_bsp(), mm.doc.build_walls(),
+                                     spawn.pos, spawn.angle)
+        else:
+            if ui.show_grid:
+                render.draw_grid(screen)
+
+            if ui.show_bsp: 
+                # Desenha a BSP (apenas a estrutura, não a renderização do jogo).
+                # A árvore só é reconstruída quando a geometria muda.
+                render.draw_bsp(screen, mm.doc.get_bsp())
+            else:
+                # Desenha setores e paredes no modo editor
+                render.draw_sectors_and_walls(screen, mode=ui.mode)
+
+            render.draw_entities(screen)
+
+            if validation["key"] == mm.doc.geometry_key():
+                # Marcadores somem quando a geometria muda depois da validação
+                render.draw_issues(screen, validation["issues"])
+
+            render.draw_current(screen)
+
+        ui.draw_ui(screen)
+
+        pg.display.flip()
+        scheduler.end_frame()
+
+    pg.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
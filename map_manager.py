@@ -1,72 +1,40 @@
 # map_manager.py
 import os, json
-from collections import defaultdict
+import itertools
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import geometry as geo
 import config
-from data_structures import Sector, Entity, Wall, BSPNode, ATTRIBUTE_REGISTRY, ENTITY_ATTRIBUTE_REGISTRY
+import visibility
+import blockmap
+import validate
+import chunks
+import changelog
+import compression
+from data_structures import Sector, Entity, Wall, BSPNode, BSPLeaf, ATTRIBUTE_REGISTRY, ENTITY_ATTRIBUTE_REGISTRY
 
 # -----------------------------
-# Estado do editor (Variáveis globais do Módulo)
+# Topologia (vértices compartilhados)
 # -----------------------------
-sectors = []
-current_vertices = []
-selected_sector = None
-sectors_by_id = {}
-children_by_parent = defaultdict(list)
-portal_hint_segments = [] # pares ((a1,a2),(b1,b2)) candidatos
-entities = []
-selected_entity = None
-
-def rebuild_indices():
-    global sectors_by_id, children_by_parent
-    sectors_by_id.clear()
-    children_by_parent.clear()
-    for s in sectors:
-        sectors_by_id[s.id] = s
-        if s.parent_id is not None:
-            children_by_parent[s.parent_id].append(s)
-
-def add_sector(sec):
-    global sectors, sectors_by_id, children_by_parent
-    sectors.append(sec)
-    sectors_by_id[sec.id] = sec
-    if sec.parent_id is not None:
-        children_by_parent[sec.parent_id].append(sec)
-
-def add_entity(pos, etype, grid_map, angle=0.0):
-    """Cria uma nova entidade na posição."""
-    # Posição convertida dos pixeis da tela para coordenadas de grade
-    map_x, map_y = screen_to_map(pos[0], pos[1])
-    map_pos = (map_x, map_y)
-    # Encontra o setor em que a entidade está.
-    sector_id = None
-    pt = map_pos
-    
-    # Lógica para achar o setor (reutilizando pick_sector_recursive)
-    roots = [s for s in sectors if getattr(s, "parent_id", None) is None]
-    roots.sort(key=lambda s: geo.area_polygon(s.outer), reverse=True)
-    for root in roots:
-        sec = pick_sector_recursive(pt, root)
-        if sec:
-            sector_id = sec.id
-            break
-
-    e = Entity(map_pos, etype=etype, sector_id=sector_id)
-    entities.append(e)
-    global selected_entity
-    selected_entity = e
-    return f"Entidade {e.id} ({etype}) criada no setor {sector_id}."
-
-def depth(sector):
-    d = 0
-    cur = sector
-    while getattr(cur, "parent_id", None) is not None:
-        parent = sectors_by_id.get(cur.parent_id)
-        if not parent:
-            break
-        d += 1
-        cur = parent
-    return d
+def _vertex_key(pt):
+    return (round(pt[0], 3), round(pt[1], 3)) # Mesma precisão de geo.normalize_edge
+
+def build_topology(sectors_):
+    """Tabela de vértices e semi-arestas para uma lista avulsa de setores.
+
+    Retorna ({sector_id: vids}, {(vid_a, vid_b): [(sector_id, i)]}) sem
+    alterar os setores; o mapa do editor mantém a sua incrementalmente.
+    """
+    ids = {}
+    loops = {}
+    half = defaultdict(list)
+    for s in sectors_:
+        vids = [ids.setdefault(_vertex_key(v), len(ids)) for v in s.outer]
+        loops[s.id] = vids
+        if len(vids) >= 2:
+            for i in range(len(vids)):
+                half[(vids[i], vids[(i + 1) % len(vids)])].append((s.id, i))
+    return loops, half
 
 # -----------------------------
 # Atributos dinâmicos (Shell/Getter/Setter)
@@ -97,45 +65,12 @@ def get_attr(obj, key):
     # 3. Retornar None se não for encontrado
     return None
 
-def set_attr(obj, key, value):
-    """Tenta definir um atributo para um Setor ou Entidade, com validação de tipo."""
-    registry = get_registry(obj)
-    
-    # 1. Tentar validar contra o registro padrão
-    if key in registry:
-        spec = registry[key]
-        try:
-            # Tenta converter o valor (que vem como string) para o tipo correto
-            converted_value = spec.typ(value)
-            obj.attrs[key] = converted_value
-            return True
-        except (ValueError, TypeError):
-            return False # Falha na conversão
-    
-    # 2. Se a chave não está no registro (atributo customizado ou de parede):
-    # Armazena como string
-    obj.attrs[key] = str(value) 
-    return True
-
-
-
 def screen_to_map(sx, sy):
     return ((sx - config.CAM_OFFSET_X) / config.GRID,
             (sy - config.CAM_OFFSET_Y) / config.GRID)
 
-def remove_attrs(obj, keys):
-    """Remove atributos customizados de um setor ou entidade."""
-    for key in keys:
-        if key in obj.attrs:
-            del obj.attrs[key]
-# ... (outras funções de atributo)
-
-# -----------------------------
-# Interações essenciais (Desenho/Seleção)
-# -----------------------------
-
-def add_vertex(mx, my, grid, use_snap):
-    global current_vertices
+def snap_screen_point(mx, my, grid, use_snap):
+    """Converte um ponto da tela para o mapa, alinhando à grade se pedido."""
     if use_snap:
         nx, ny = geo.snap_to_grid(mx - config.CAM_OFFSET_X, my - config.CAM_OFFSET_Y, grid)
     else:
@@ -143,118 +78,147 @@ def add_vertex(mx, my, grid, use_snap):
     
     map_x = nx / grid
     map_y = ny / grid
+    return (map_x, map_y)
 
-    current_vertices.append((map_x, map_y))
-
-def close_sector():
-    global current_vertices, sectors, selected_sector
-    if len(current_vertices) < 3:
-        return "Setor precisa de 3+ vértices."
-    if not geo.is_convex_polygon(current_vertices):
-        return "Setor não é convexo."
-    if geo.area_polygon(current_vertices) < 0:
-        current_vertices = list(reversed(current_vertices))
-
-    parents = [s for s in sectors
-               if geo.point_in_poly(current_vertices[0], s.outer)
-               and not geo.polys_intersect(current_vertices, s.outer)
-               and all(geo.point_in_poly(v, s.outer) for v in current_vertices)]
 
-    if parents:
-        parent_id = min(parents, key=lambda s: abs(geo.area_polygon(s.outer))).id
-    else:
-        parent_id = None
-
-    s = Sector(current_vertices, parent_id=parent_id)
-    add_sector(s)
-    current_vertices = []
-    message = f"Setor {s.id} criado." if parent_id is None else f"Cômodo {s.id} dentro do setor {parent_id}."
-    rebuild_indices()
-    return message
-
-def pick_sector_recursive(pt, sector):
-    if not geo.point_in_poly(pt, sector.outer):
-        return None
-    children = children_by_parent.get(sector.id, [])
-    for child in sorted(children, key=lambda c: abs(geo.area_polygon(c.outer))):
-        found = pick_sector_recursive(pt, child)
-        if found:
-            return found
-    return sector
+# -----------------------------
+# Limpeza de geometria
+# -----------------------------
+def _simplify_loop(loop, tags, shared):
+    """Remove vértices repetidos e colineares de um contorno.
+
+    tags[i] é o atributo wall_i da aresta que começa em loop[i]; duas arestas
+    só são fundidas se tiverem o mesmo atributo. Vértices em `shared` (usados
+    por outros setores) são mantidos para não quebrar a adjacência.
+    """
+    items = list(zip(loop, tags))
+    changed = True
+    while changed and len(items) > 3:
+        changed = False
+        for k in range(len(items)):
+            prev_v, prev_tag = items[k - 1]
+            v, tag = items[k]
+            next_v = items[(k + 1) % len(items)][0]
+            if v == prev_v:
+                # Aresta degenerada: descarta a aresta k-1 e fica com a seguinte
+                del items[k - 1]
+            elif tag == prev_tag and v not in shared and geo.is_collinear_vertex(prev_v, v, next_v):
+                del items[k]
+            else:
+                continue
+            changed = True
+            break
+    return [v for v, _ in items], [t for _, t in items]
 
-def pick_sector(mx, my, grid_map):
-    global selected_sector
+def count_bsp_nodes(node):
+    if not isinstance(node, BSPNode):
+        return 0
+    return 1 + count_bsp_nodes(node.front) + count_bsp_nodes(node.back)
 
-    mx, my, = geo.snap_to_grid(mx, my, grid_map)
-    
-    map_x, map_y = screen_to_map(mx, my)
-    pt = (map_x, map_y)
-
-    roots = [s for s in sectors if getattr(s, "parent_id", None) is None]
-    roots.sort(key=lambda s: abs(geo.area_polygon(s.outer)), reverse=True)
-    for root in roots:
-        found = pick_sector_recursive(pt, root)
-        if found:
-            selected_sector = found
-            return f"Selecionado setor {selected_sector.id}"
-    selected_sector = None
-    return "Nenhum setor sob o clique."
-
-def pick_entity(mx, my, grid_map):
-    """Tenta selecionar uma entidade próxima ao clique."""
-    global selected_entity
-    map_x, map_y = screen_to_map(mx, my)
-    pt = (map_x, map_y)
-    
-    # Itera sobre entidades de trás para frente (última criada é a mais visível)
-    for entity in reversed(entities):
-        e_pos = entity.pos
-        if geo.point_distance(pt, e_pos) < config.TOLERANCE:
-            selected_entity = entity
-            return f"Entidade {selected_entity.id} ({selected_entity.type}) selecionada."
-            
-    selected_entity = None
-    return "Nenhuma entidade selecionada."
-
-def remove_entity(entity):
-    """Remove uma entidade do mapa."""
-    if entity in entities:
-        entities.remove(entity)
-        global selected_entity
-        if selected_entity == entity:
-            selected_entity = None
-        return f"Entidade {entity.id} removida."
-    return "Entidade não encontrada."
 
 # -----------------------------
-# Persistência
+# Histórico (undo/redo) por diffs de comando
 # -----------------------------
-# export_map, load_map, clear_map
+# Cada comando é um dicionário pequeno e serializável em JSON:
+#   sector_add                  {"sector": estado}
+#   sector_remove               {"sectors": [estados], "reparented": [ids], "entities": [[id, setor]]}
+#   entity_add / entity_remove  {"entity": estado}
+#   entity_move                 {"id", "old": [pos, setor], "new": [pos, setor]}
+#   attr_set                    {"kind", "id", "key", "old": [existe, valor], "new": [existe, valor]}
+#   sector_edit                 {"sectors": [{"id", "old": {outer, attrs}, "new": {outer, attrs}}]}
+#   batch                       {"cmds": [comandos]} (desfeitos na ordem inversa)
+
+def _sector_state(s):
+    return {"id": s.id, "outer": [list(v) for v in s.outer],
+            "parent_id": s.parent_id, "attrs": dict(s.attrs)}
+
+def _entity_state(e):
+    return {"id": e.id, "type": e.type, "pos": list(e.pos), "angle": e.angle,
+            "sector_id": e.sector_id, "attrs": dict(e.attrs)}
+
+def _attr_command(obj, key, value, present):
+    kind = "entity" if isinstance(obj, Entity) else "sector"
+    old = [key in obj.attrs, obj.attrs.get(key)]
+    return {"op": "attr_set", "kind": kind, "id": obj.id, "key": key,
+            "old": old, "new": [present, value]}
+
+def touched_objects(cmd, sectors_=None, entities_=None):
+    """Setores e entidades afetados por um comando.
+
+    Retorna ({sector_id: [estados com "outer" vistos no comando]}, {entity_id:
+    estado ou None}); os estados permitem localizar objetos recém-criados ou
+    já removidos.
+    """
+    sectors_ = {} if sectors_ is None else sectors_
+    entities_ = {} if entities_ is None else entities_
+    op = cmd["op"]
+    if op == "batch":
+        for sub in cmd["cmds"]:
+            touched_objects(sub, sectors_, entities_)
+    elif op == "sector_add":
+        sectors_.setdefault(cmd["sector"]["id"], []).append(cmd["sector"])
+    elif op == "sector_remove":
+        for state in cmd["sectors"]:
+            sectors_.setdefault(state["id"], []).append(state)
+        for sid in cmd["reparented"]:
+            sectors_.setdefault(sid, [])
+        for eid, _ in cmd["entities"]:
+            entities_.setdefault(eid, None)
+    elif op in ("entity_add", "entity_remove"):
+        entities_[cmd["entity"]["id"]] = cmd["entity"]
+    elif op == "entity_move":
+        entities_.setdefault(cmd["id"], None)
+    elif op == "sector_edit":
+        for edit in cmd["sectors"]:
+            sectors_.setdefault(edit["id"], []).extend((edit["old"], edit["new"]))
+    elif op == "entity_sectors":
+        # Aviso de assign_entity_sectors (não é um comando do histórico)
+        for eid in cmd["ids"]:
+            entities_.setdefault(eid, None)
+    elif op == "attr_set":
+        if cmd["kind"] == "entity":
+            entities_.setdefault(cmd["id"], None)
+        else:
+            sectors_.setdefault(cmd["id"], [])
+    return sectors_, entities_
+
+def journal_has_changes(path):
+    """True se o diário em `path` contém comandos além do cabeçalho."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip()) > 1
 
 # -----------------------------
 # Walls e BSP
 # -----------------------------
 
 def build_walls(sectors_):
-    edge_map = defaultdict(list)
-    for s in sectors_:
-        if len(s.outer) < 2: continue
-        for a, b in geo.edges_of(s.outer):
-            key = geo.normalize_edge(a, b)
-            edge_map[key].append(s.id)
+    """Paredes de uma lista avulsa de setores (vizinhança calculada na hora).
 
+    Para o mapa de um documento use MapDocument.build_walls, que aproveita as
+    semi-arestas mantidas pelo documento.
+    """
+    loops, half = build_topology(sectors_)
     walls = []
     for s in sectors_:
-        if len(s.outer) < 2: continue
-        for i, (a, b) in enumerate(geo.edges_of(s.outer)):
-            rev_key = geo.normalize_edge(b, a)
-            back_ids = [sid2 for sid2 in edge_map.get(rev_key, []) if sid2 != s.id]
-            back_id = back_ids[0] if back_ids else None
-            
-            is_portal = False
-            if get_attr(s, f"wall_{i}") == "portal" and back_id is not None:
-                is_portal = True
-            walls.append(Wall(a, b, s.id, back_id, is_portal=is_portal))
+        walls.extend(_sector_walls(s, loops[s.id], half))
+    return walls
+
+def _sector_walls(s, vids, half):
+    walls = []
+    if len(s.outer) < 2:
+        return walls
+    for i, (a, b) in enumerate(s.edges):
+        va, vb = vids[i], vids[(i + 1) % len(vids)]
+        back_ids = [sid2 for sid2, _ in half.get((vb, va), []) + half.get((va, vb), [])
+                    if sid2 != s.id]
+        back_id = back_ids[0] if back_ids else None
+
+        is_portal = False
+        if get_attr(s, f"wall_{i}") == "portal" and back_id is not None:
+            is_portal = True
+        walls.append(Wall(a, b, s.id, back_id, is_portal=is_portal, edge_index=i))
     return walls
 
 def choose_splitter(segments):
@@ -274,175 +238,1433 @@ def choose_splitter(segments):
             best_splitter = candidate
     return best_splitter
 
-def build_bsp_from_walls(walls):
-    segs = [ (w.start, w.end) for w in walls ]
-    if not segs: return None
-    def build(segments):
-        if not segments: return None
-        if geo.all_collinear(segments):
-            return BSPNode(segments[0], collinear=segments)
-        if len(segments) == 1:
-            return BSPNode(segments[0], collinear=[])
-        
+class _BSPContext:
+    """Dados compartilhados pela construção da BSP (e enviados aos processos).
+
+    Guarda a parede de origem de cada segmento (inclusive dos pedaços
+    gerados por cortes) e os contornos dos setores, usados para decidir a
+    que setor pertence cada folha.
+    """
+    def __init__(self, walls):
+        self.owner = {}
+        polys = defaultdict(list)
+        for i, w in enumerate(walls):
+            self.owner.setdefault((w.start, w.end), i)
+            polys[w.sector_front].append(w.start)
+        self.wall_sector = [w.sector_front for w in walls]
+        self.sector_polys = dict(polys)
+        self.sector_area = {sid: abs(geo.area_polygon(p)) for sid, p in polys.items()}
+        self.sector_bbox = {sid: geo.polygon_bbox(p) for sid, p in polys.items()}
+
+        xs = [c for w in walls for c in (w.start[0], w.end[0])]
+        ys = [c for w in walls for c in (w.start[1], w.end[1])]
+        margin = 1.0
+        x0, y0, x1, y1 = min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin
+        self.bounds = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+        # Grade uniforme de bboxes para localizar setores por ponto
+        self.cell = max(1.0, ((x1 - x0) * (y1 - y0) / max(1, len(polys))) ** 0.5)
+        self.origin = (x0, y0)
+        self.grid = defaultdict(list)
+        for sid, (bx0, by0, bx1, by1) in self.sector_bbox.items():
+            for gx in range(int((bx0 - x0) // self.cell), int((bx1 - x0) // self.cell) + 1):
+                for gy in range(int((by0 - y0) // self.cell), int((by1 - y0) // self.cell) + 1):
+                    self.grid[(gx, gy)].append(sid)
+
+    def smallest_sector(self, sector_ids):
+        return min(sector_ids, key=lambda sid: (self.sector_area.get(sid, 0.0), sid))
+
+    def sector_at(self, pt):
+        """Setor mais profundo (menor área) que contém o ponto."""
+        key = (int((pt[0] - self.origin[0]) // self.cell), int((pt[1] - self.origin[1]) // self.cell))
+        found = [sid for sid in self.grid.get(key, [])
+                 if geo.bbox_contains_point(self.sector_bbox[sid], pt, tol=0.0)
+                 and geo.point_in_poly(pt, self.sector_polys[sid])]
+        return self.smallest_sector(found) if found else None
+
+def _split_owned(rest, splitter, owner):
+    """geo.split_segments segmento a segmento, herdando a parede de origem."""
+    front, back, collinear = [], [], []
+    for s in rest:
+        f, b, c = geo.split_segments([s], splitter)
+        for piece in f + b + c:
+            owner.setdefault(piece, owner[s])
+        front += f
+        back += b
+        collinear += c
+    return front, back, collinear
+
+def _same_direction(seg, line):
+    (ax, ay), (bx, by) = seg
+    (cx, cy), (dx, dy) = line
+    return (bx - ax) * (dx - cx) + (by - ay) * (dy - cy) > 0
+
+def _make_leaf(ctx, cell, bounds):
+    """Cria o subsetor de uma célula convexa sem paredes internas."""
+    segments, wall_ids = [], []
+    for seg, wall in bounds:
+        piece = geo.clip_segment_to_convex(seg, cell, eps=1e-4)
+        if piece is not None and geo.segment_length(piece) > 1e-6:
+            segments.append(piece)
+            wall_ids.append(wall)
+
+    if segments:
+        # Paredes voltadas para dentro da célula: o interior é o setor delas
+        sector_id = ctx.smallest_sector({ctx.wall_sector[w] for w in wall_ids})
+    elif len(cell) >= 3:
+        sector_id = ctx.sector_at(geo.polygon_centroid(cell))
+    else:
+        sector_id = None
+    return BSPLeaf(cell, segments, wall_ids, sector_id)
+
+def _bsp_partition(segments, ctx, cell, bounds):
+    """Escolhe o divisor de um nó e particiona os segmentos restantes.
+
+    Retorna (node, front, back), onde front/back são tuplas
+    (segmentos, célula, paredes-limite) para os filhos. Filhos sem
+    segmentos viram folhas (subsetores) imediatamente.
+    """
+    terminal = False
+    if geo.all_collinear(segments):
+        node = BSPNode(segments[0], collinear=segments)
+        on_line = segments
+        front, back = [], []
+        terminal = True
+    elif len(segments) == 1:
+        node = BSPNode(segments[0], collinear=[])
+        on_line = segments
+        front, back = [], []
+        terminal = True
+    else:
         splitter = choose_splitter(segments)
         rest = [s for s in segments if s is not splitter]
 
-        front, back, collinear = geo.split_segments(rest, splitter)
-
-        if not front and not back:
-            return BSPNode(splitter, collinear=collinear)
-
-        front = [s for s in front if geo.segment_length(s) > 1]
-        back  = [s for s in back if geo.segment_length(s) > 1]
-        
+        front, back, collinear = _split_owned(rest, splitter, ctx.owner)
         node = BSPNode(splitter, collinear=collinear)
-        node.front_segments = front
-        node.back_segments = back
+        on_line = [splitter] + collinear
 
-        node.front = build(front)
-        node.back = build(back)
+        if not front and not back:
+            terminal = True
+        else:
+            # Só pedaços degenerados saem: mesmo um pedaço curto ainda é parede
+            front = [s for s in front if geo.segment_length(s) > 1e-9]
+            back  = [s for s in back if geo.segment_length(s) > 1e-9]
+            node.front_segments = front
+            node.back_segments = back
+
+    node.wall_segments = on_line
+    node.wall_ids = [ctx.owner[s] for s in on_line]
+
+    line = node.line
+    front_bounds = bounds + [(s, w) for s, w in zip(on_line, node.wall_ids) if _same_direction(s, line)]
+    back_bounds = bounds + [(s, w) for s, w in zip(on_line, node.wall_ids) if not _same_direction(s, line)]
+    front_job = (front, geo.clip_polygon(cell, line, 1), front_bounds)
+    back_job = (back, geo.clip_polygon(cell, line, -1), back_bounds)
+
+    if terminal:
+        node.front = _make_leaf(ctx, front_job[1], front_job[2])
+        node.back = _make_leaf(ctx, back_job[1], back_job[2])
+        return node, None, None
+    return node, front_job, back_job
+
+def _build_bsp(segments, ctx, cell, bounds):
+    """Construção serial (recursiva) de uma subárvore."""
+    if not segments:
+        return _make_leaf(ctx, cell, bounds)
+    node, front, back = _bsp_partition(segments, ctx, cell, bounds)
+    if front is None:
         return node
-    
-    return build(segs)
+    node.front = _build_bsp_job(front, ctx)
+    node.back = _build_bsp_job(back, ctx)
+    return node
+
+def _build_bsp_job(job, ctx):
+    segments, cell, bounds = job
+    return _build_bsp(segments, ctx, cell, bounds)
+
+def _build_bsp_parallel(segments, ctx, workers, threshold):
+    """Expande o topo da árvore serialmente e envia as subárvores grandes
+    para um ProcessPoolExecutor. Como cada subárvore usa exatamente a mesma
+    construção serial, o resultado é idêntico ao de _build_bsp."""
+    root, front, back = _bsp_partition(segments, ctx, ctx.bounds, [])
+    if front is None:
+        return root
+
+    # Fronteira de subárvores ainda não construídas: (pai, lado, job)
+    frontier = [(root, "front", front), (root, "back", back)]
+    while len(frontier) < workers * 2:
+        largest = max(range(len(frontier)), key=lambda i: len(frontier[i][2][0]))
+        parent, side, job = frontier[largest]
+        if len(job[0]) < threshold:
+            break
+        frontier.pop(largest)
+        node, f, b = _bsp_partition(job[0], ctx, job[1], job[2])
+        setattr(parent, side, node)
+        if f is not None:
+            frontier.append((node, "front", f))
+            frontier.append((node, "back", b))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for parent, side, job in frontier:
+            if len(job[0]) >= threshold:
+                futures.append((parent, side, pool.submit(_build_bsp_job, job, ctx)))
+            else:
+                setattr(parent, side, _build_bsp_job(job, ctx))
+        for parent, side, fut in futures:
+            setattr(parent, side, fut.result())
+    return root
+
+def build_bsp_from_walls(walls, workers=None, threshold=None):
+    """Constrói a BSP a partir das paredes.
+
+    As folhas são subsetores (BSPLeaf) convexos com o setor dono; os nós
+    guardam em wall_ids o índice, em `walls`, das paredes sobre o divisor.
+    Com workers > 1, subárvores com pelo menos `threshold` segmentos
+    são construídas em processos separados (mesma saída da versão serial).
+    """
+    # Paredes de comprimento zero (vértices repetidos) não definem uma reta
+    segs = [ (w.start, w.end) for w in walls if geo.segment_length((w.start, w.end)) > 1e-9 ]
+    if not segs: return None
+    ctx = _BSPContext(walls)
+    if threshold is None:
+        threshold = config.BSP_PARALLEL_THRESHOLD
+    if workers is None or workers <= 1 or len(segs) < threshold:
+        return _build_bsp(segs, ctx, ctx.bounds, [])
+    return _build_bsp_parallel(segs, ctx, workers, threshold)
+
+def locate_leaf(bsp_root, pt):
+    """Desce a árvore com geo.point_side até o subsetor que contém o ponto."""
+    node = bsp_root
+    while isinstance(node, BSPNode):
+        node = node.front if geo.point_side(pt, node.line) >= 0 else node.back
+    return node
+
+def locate_sector(bsp_root, pt):
+    """Id do setor que contém o ponto em O(profundidade), ou None."""
+    leaf = locate_leaf(bsp_root, pt)
+    return leaf.sector_id if leaf is not None else None
 
 # -----------------------------
-# Portal assist (visual + persistência)
+# Persistência
 # -----------------------------
-# compute_portal_hints, try_create_portal_at_point
-
-def compute_portal_hints():
-    global portal_hint_segments
-    portal_hint_segments = []
-    valid_loops = [(s, s.outer) for s in sectors if len(s.outer) >= 2]
-    for i in range(len(valid_loops)):
-        s1, l1 = valid_loops[i]
-        for j in range(i+1, len(valid_loops)):
-            s2, l2 = valid_loops[j]
-            if s1.id == s2.id: continue
-            for a1,a2 in geo.edges_of(l1):
-                for b1,b2 in geo.edges_of(l2):
-                    if geo.almost_colinear(a1,a2,b1,b2) and geo.overlap_on_line(a1,a2,b1,b2):
-                        portal_hint_segments.append(((a1,a2),(b1,b2)))
-
-def try_create_portal_at_point(pt, grid_map):
-    # Converte pixels da tela para espaçamento da grade
-    nx, ny = geo.snap_to_grid(pt[0], pt[1], grid_map)
-    pt = (nx / grid_map, ny / grid_map)
-
-    created = False
-    for (a1,a2),(b1,b2) in portal_hint_segments:
-        if geo.point_line_distance(pt, a1, a2) < config.TOLERANCE or geo.point_line_distance(pt, b1, b2) < config.TOLERANCE:
-            for s in sectors:
-                for i,(v1,v2) in enumerate(geo.edges_of(s.outer)):
-                    if geo.almost_colinear(a1,a2,v1,v2) and geo.overlap_on_line(a1,a2,v1,v2):
-                        current = get_attr(s, f"wall_{i}")
-                        if current == "portal":
-                            remove_attrs(s, [f"wall_{i}"])
-                        else:
-                            set_attr(s, f"wall_{i}", "portal")
-                        created = True
-    return created
-
-# Funções de I/O (Exportar/Importar)
-def export_map(map_name="map.json"):
-
-    #1- Cria o diretório (se não existir)
-    os.makedirs(map_name, exist_ok=True)
-
-    #2- Prepara os dados do mapa (Setores e Paredes)
-    walls = build_walls(sectors)
-    map_data = {
-        "sectors": [s.to_json() for s in sectors],
-        "walls": [w.to_json() for w in walls],
-    }
-
-    #3- Prepara os dados das entidades
-    entity_data = {
-        "entities": [e.to_json() for e in entities],
-    }
-
-    #4- Exportar map.json
-    map_filepath = os.path.join(map_name, "map.json")
-    with open(map_filepath, "w", encoding="utf-8") as f:
-        json.dump(map_data, f, indent=2)
-    
-    entities_filepath = os.path.join(map_name, "entities.json")
-    with open(entities_filepath, "w", encoding="utf-8") as f:
-        json.dump(entity_data, f, indent=2)
-    return f"Mapa '{map_name}' exportado com sucesso em 2 arquivos: map.json e entities.json."
-
-def load_map(map_name="map.json"):
-    # Carrega o mapa da estrutura de pasta
-    global sectors, entities, current_vertices, selected_sector, selected_entity
-
-    map_filepath = os.path.join(map_name, "map.json")
-    entities_filepath = os.path.join(map_name, "entities.json")
-
-    if not os.path.exists(map_filepath):
-        return f"ERRO: Arquivo de mapa não encontrado, verifique se o nome está certo."
-
-    #1 Carrega mapa com setores e paredes.
-    sectors.clear()
-    with open(map_filepath, "r", encoding="utf-8") as f:
-        map_data = json.load(f)
-
-    #sectors = []
-    for sdata in map_data.get("sectors", []):
-        outer = [tuple(v) for v in sdata["outer"]]
-        sec = Sector(outer, parent_id=sdata.get("parent_id"), attrs=sdata.get("attrs", {}))
-        sec.id = sdata["id"]
-
-        for key, spec in ATTRIBUTE_REGISTRY.items():
-            if key not in sec.attrs:
-                sec.attrs[key] = spec.default
-
-        sectors.append(sec)
-
-    # Carrega entidades do mapa.
-    entities.clear()
-    if os.path.exists(entities_filepath):
-        with open(entities_filepath, "r", encoding="utf-8") as f:
-            entity_data = json.load(f)
-        
-        for edata in entity_data.get("entities", []):
-            pos = tuple(edata["pos"])
-            ent = Entity(pos,
-                         etype=edata.get("type", "generic"),
-                         angle=edata.get("angle", 0.0),
-                         sector_id=edata.get("sector_id")
-                         )
-            ent.id = edata["id"]
-            ent.attrs.update(edata.get("attrs", {}))
-
-            for key, spec in ENTITY_ATTRIBUTE_REGISTRY.items():
-                if key not in ent.attrs:
-                    ent.attrs[key] = spec.default
-
-            entities.append(ent)
+def sector_from_json(sdata, vertex_data=None):
+    """Setor a partir do dict gravado (to_json), com os atributos padrão."""
+    if vertex_data is not None and "vids" in sdata:
+        outer = [tuple(vertex_data[i]) for i in sdata["vids"]]
     else:
-        # Aviso para o usuário se o arquivo secundário estiver faltando
-        print(f"Aviso: Arquivo de entidades {entities_filepath} não encontrado. Assumindo zero entidades.")
-
-    max_sector_id = max((s.id for s in sectors), default=0)
-    Sector.set_next_id(max_sector_id + 1)
-
-    max_entity_id = max((e.id for e in entities), default=0)
-    Entity.set_next_id(max_entity_id + 1)
-
-    rebuild_indices()
+        outer = [tuple(v) for v in sdata["outer"]]
+    sec = Sector(outer, parent_id=sdata.get("parent_id"), attrs=sdata.get("attrs", {}),
+                 id=sdata["id"])
+
+    for key, spec in ATTRIBUTE_REGISTRY.items():
+        if key not in sec.attrs:
+            sec.attrs[key] = spec.default
+    return sec
+
+def entity_from_json(edata):
+    """Entidade a partir do dict gravado (to_json), com os atributos padrão."""
+    pos = tuple(edata["pos"])
+    ent = Entity(pos,
+                 etype=edata.get("type", "generic"),
+                 angle=edata.get("angle", 0.0),
+                 sector_id=edata.get("sector_id"),
+                 id=edata["id"]
+                 )
+    ent.attrs.update(edata.get("attrs", {}))
+
+    for key, spec in ENTITY_ATTRIBUTE_REGISTRY.items():
+        if key not in ent.attrs:
+            ent.attrs[key] = spec.default
+    return ent
 
-    selected_sector = None
-    selected_entity = None
-    current_vertices = []
+# -----------------------------
+# Documento do mapa
+# -----------------------------
+_epochs = itertools.count(1) # Épocas únicas entre documentos (chaves dos caches de render)
+
+class MapDocument:
+    """Um mapa em memória: setores, entidades, índices, histórico e ids.
+
+    Cada documento é independente, então vários mapas podem ficar abertos
+    ou ser compilados em threads ao mesmo tempo. O editor usa `doc`.
+    """
+    def __init__(self):
+        self.sectors = []
+        self.current_vertices = []
+        self.selected_sector = None
+        self.sectors_by_id = {}
+        self.children_by_parent = defaultdict(list)
+        self.portal_hint_segments = [] # pares ((a1,a2),(b1,b2)) candidatos
+        self.portal_hints = defaultdict(list) # (setor, i) -> [(setor vizinho, j)] com aresta sobreposta
+        self.portal_hint_edges = set()        # arestas (setor, i) que têm dica de portal
+        self._portal_hint_key = None          # geometry_key() usada no último cálculo
+        self.entities = []
+        self.entities_by_sector = defaultdict(list)
+        self.entities_by_id = {}
+        self.selected_entity = None
+        self.map_epoch = next(_epochs) # Trocado a cada load/clear (invalida caches de geometria)
+        self.revision = 0 # Incrementado a cada alteração (comandos e carga sob demanda)
+        self.geometry_revision = 0 # Incrementado quando um setor entra, sai ou muda de contorno
+        self.partial = False # True quando só parte do mapa está na memória (streaming)
+        self.next_sector_id = 1
+        self.next_entity_id = 1
+
+        # Histórico de comandos (undo/redo)
+        self.undo_stack = deque(maxlen=config.UNDO_LIMIT)
+        self.redo_stack = []
+        self.journal_file = None       # Arquivo aberto do diário (recuperação de falhas)
+        self._journal_suspended = False # True enquanto um comando está sendo aplicado/reproduzido
+        self.change_listeners = []      # Funções chamadas com cada comando feito, desfeito ou refeito
+
+        # Alterações desde o último save (salvamento incremental em changelog.py)
+        self.saved_folder = None    # Pasta do último load/export completo: base do registro
+        self._unsaved_sectors = {}  # id -> contornos conhecidos do setor (vizinhos de removidos)
+        self._unsaved_entities = set()
+
+        # Topologia: tabela de vértices compartilhada e semi-arestas
+        self.vertices = []                    # vid -> (x, y), None se o índice está livre
+        self.vertex_ids = {}                  # coordenada arredondada -> vid
+        self.vertex_users = defaultdict(set)  # vid -> ids dos setores que usam o vértice
+        self.half_edges = defaultdict(list)   # (vid_a, vid_b) -> [(sector_id, índice da aresta)]
+        self._free_vids = []
+
+        self._bsp_cache = {"key": None, "root": None}
+        self._blockmap_cache = {"key": None, "walls": None, "blockmap": None}
+
+    # -----------------------------
+    # Ids
+    # -----------------------------
+    def new_sector_id(self):
+        sid = self.next_sector_id
+        self.next_sector_id += 1
+        return sid
+
+    def new_entity_id(self):
+        eid = self.next_entity_id
+        self.next_entity_id += 1
+        return eid
+
+    def _reset_ids(self):
+        """Próximos ids logo acima dos maiores em uso."""
+        self.next_sector_id = max((s.id for s in self.sectors), default=0) + 1
+        self.next_entity_id = max((e.id for e in self.entities), default=0) + 1
+
+    # -----------------------------
+    # Índices
+    # -----------------------------
+    def rebuild_indices(self):
+        self.sectors_by_id.clear()
+        self.children_by_parent.clear()
+        self.entities_by_sector.clear()
+        self.entities_by_id.clear()
+        self.vertices.clear()
+        self.vertex_ids.clear()
+        self.vertex_users.clear()
+        self.half_edges.clear()
+        self._free_vids.clear()
+        for s in self.sectors:
+            self.sectors_by_id[s.id] = s
+            if s.parent_id is not None:
+                self.children_by_parent[s.parent_id].append(s)
+            self._link_sector(s)
+        for e in self.entities:
+            self.entities_by_id[e.id] = e
+            if e.sector_id is not None:
+                self.entities_by_sector[e.sector_id].append(e)
+
+    # -----------------------------
+    # Topologia (vértices compartilhados)
+    # -----------------------------
+    def _intern_vertex(self, pt):
+        """Retorna o vid do vértice em `pt`, criando-o se necessário."""
+        key = _vertex_key(pt)
+        vid = self.vertex_ids.get(key)
+        if vid is None:
+            pt = (pt[0], pt[1])
+            if self._free_vids:
+                vid = self._free_vids.pop()
+                self.vertices[vid] = pt
+            else:
+                vid = len(self.vertices)
+                self.vertices.append(pt)
+            self.vertex_ids[key] = vid
+        return vid
+
+    def _link_sector(self, sec):
+        """Registra os vértices e semi-arestas de um setor.
+
+        Os cantos passam a ser as mesmas tuplas da tabela, então setores
+        vizinhos não guardam cópias das coordenadas compartilhadas.
+        """
+        self.geometry_revision += 1
+        sec.vids = [self._intern_vertex(v) for v in sec.outer]
+        moved = False
+        for i, vid in enumerate(sec.vids):
+            if sec.outer[i] != self.vertices[vid]:
+                moved = True
+            sec.outer[i] = self.vertices[vid]
+            self.vertex_users[vid].add(sec.id)
+        if moved:
+            sec.invalidate_geometry()
+        n = len(sec.vids)
+        if n >= 2:
+            for i in range(n):
+                self.half_edges[(sec.vids[i], sec.vids[(i + 1) % n])].append((sec.id, i))
+
+    def _unlink_sector(self, sec):
+        if sec.vids is None:
+            return
+        self.geometry_revision += 1
+        n = len(sec.vids)
+        if n >= 2:
+            for i in range(n):
+                key = (sec.vids[i], sec.vids[(i + 1) % n])
+                owners = self.half_edges.get(key)
+                if owners and (sec.id, i) in owners:
+                    owners.remove((sec.id, i))
+                    if not owners:
+                        del self.half_edges[key]
+        for vid in set(sec.vids):
+            users = self.vertex_users.get(vid)
+            if users is None:
+                continue
+            users.discard(sec.id)
+            if not users:
+                # Vértice sem uso: libera o índice
+                del self.vertex_users[vid]
+                self.vertex_ids.pop(_vertex_key(self.vertices[vid]), None)
+                self.vertices[vid] = None
+                self._free_vids.append(vid)
+        sec.vids = None
+
+    def twin_edge(self, sector, i):
+        """(sector_id, j) da aresta vizinha à aresta i do setor, ou None. O(1)."""
+        if sector.vids is None or len(sector.vids) < 2:
+            return None
+        a, b = sector.vids[i], sector.vids[(i + 1) % len(sector.vids)]
+        for key in ((b, a), (a, b)):
+            for owner in self.half_edges.get(key, ()):
+                if owner[0] != sector.id:
+                    return owner
+        return None
 
-    return f"Mapa '{map_name}' carregado. Setores: {len(sectors)}. Entidades: {len(entities)}."
+    def vertex_near(self, pt, radius):
+        """vid do vértice mais próximo do ponto (até `radius`), via blockmap."""
+        best = None
+        for _, _, w in self.walls_near(pt, radius):
+            for v in (w.start, w.end):
+                d = geo.point_distance(pt, v)
+                if d <= radius and (best is None or d < best[0]):
+                    best = (d, self.vertex_ids.get(_vertex_key(v)))
+        return best[1] if best else None
+
+    def move_vertex(self, vid, pos):
+        """Move um vértice compartilhado, atualizando todos os setores que o usam."""
+        if vid is None or vid >= len(self.vertices) or self.vertices[vid] is None:
+            return "Vértice não encontrado."
+        pos = (pos[0], pos[1])
+        edits = []
+        for sid in sorted(self.vertex_users.get(vid, ())):
+            sec = self.sectors_by_id[sid]
+            outer = [pos if v == vid else sec.outer[i] for i, v in enumerate(sec.vids)]
+            edits.append({"id": sid,
+                          "old": {"outer": [list(v) for v in sec.outer], "attrs": dict(sec.attrs)},
+                          "new": {"outer": [list(v) for v in outer], "attrs": dict(sec.attrs)}})
+        cmd = {"op": "sector_edit", "sectors": edits}
+        self._apply_command(cmd)
+        self._record(cmd)
+        return f"Vértice movido para ({pos[0]:.1f}, {pos[1]:.1f}) em {len(edits)} setores."
+
+    def _insert_entity(self, e):
+        self.entities.append(e)
+        self.entities_by_id[e.id] = e
+        self.next_entity_id = max(self.next_entity_id, e.id + 1)
+        if e.sector_id is not None:
+            self.entities_by_sector[e.sector_id].append(e)
+
+    def _discard_entity(self, e):
+        self.entities.remove(e)
+        self.entities_by_id.pop(e.id, None)
+        self._set_entity_sector(e, None)
+
+    def _set_entity_sector(self, e, sector_id):
+        """Troca o setor de uma entidade mantendo entities_by_sector."""
+        if e.sector_id is not None:
+            bucket = self.entities_by_sector.get(e.sector_id)
+            if bucket and e in bucket:
+                bucket.remove(e)
+                if not bucket:
+                    del self.entities_by_sector[e.sector_id]
+        e.sector_id = sector_id
+        if sector_id is not None:
+            self.entities_by_sector[sector_id].append(e)
+
+    def _set_sector_parent(self, sec, parent_id):
+        """Troca o pai de um setor mantendo children_by_parent."""
+        if sec.parent_id is not None:
+            siblings = self.children_by_parent.get(sec.parent_id)
+            if siblings and sec in siblings:
+                siblings.remove(sec)
+                if not siblings:
+                    del self.children_by_parent[sec.parent_id]
+        sec.parent_id = parent_id
+        if parent_id is not None:
+            self.children_by_parent[parent_id].append(sec)
+
+    def add_sector(self, sec):
+        self._insert_sector(sec)
+        self._record({"op": "sector_add", "sector": _sector_state(sec)})
+
+    def _insert_sector(self, sec):
+        self.sectors.append(sec)
+        self.next_sector_id = max(self.next_sector_id, sec.id + 1)
+        self.sectors_by_id[sec.id] = sec
+        if sec.parent_id is not None:
+            self.children_by_parent[sec.parent_id].append(sec)
+        self._link_sector(sec)
+
+    def add_entity(self, pos, etype, grid_map, angle=0.0):
+        """Cria uma nova entidade na posição."""
+        # Posição convertida dos pixeis da tela para coordenadas de grade
+        map_x, map_y = screen_to_map(pos[0], pos[1])
+        map_pos = (map_x, map_y)
+        # Encontra o setor em que a entidade está (o mais profundo que a contém).
+        sector_id = self.sector_id_at(map_pos)
+
+        e = Entity(map_pos, etype=etype, sector_id=sector_id, id=self.new_entity_id())
+        self._insert_entity(e)
+        self._record({"op": "entity_add", "entity": _entity_state(e)})
+        self.selected_entity = e
+        return f"Entidade {e.id} ({etype}) criada no setor {sector_id}."
+
+    def attach_objects(self, sectors_, entities_):
+        """Acrescenta setores e entidades carregados sob demanda (fora do histórico)."""
+        for s in sectors_:
+            self._insert_sector(s)
+        for e in entities_:
+            self._insert_entity(e)
+        self.revision += 1
+
+    def detach_objects(self, sector_ids, entity_ids):
+        """Retira setores e entidades descarregados, sem reparentar filhos nem
+        mover entidades (ao contrário de remove_sector/remove_entity)."""
+        sector_ids, entity_ids = set(sector_ids), set(entity_ids)
+        for sid in sector_ids:
+            s = self.sectors_by_id.pop(sid, None)
+            if s is None:
+                continue
+            siblings = self.children_by_parent.get(s.parent_id)
+            if siblings and s in siblings:
+                siblings.remove(s)
+                if not siblings:
+                    del self.children_by_parent[s.parent_id]
+            self._unlink_sector(s)
+            if self.selected_sector is s:
+                self.selected_sector = None
+        if sector_ids:
+            self.sectors[:] = [s for s in self.sectors if s.id not in sector_ids]
+            self.revision += 1
+        if entity_ids:
+            for e in self.entities:
+                if e.id in entity_ids:
+                    del self.entities_by_id[e.id]
+                    bucket = self.entities_by_sector.get(e.sector_id)
+                    if bucket and e in bucket:
+                        bucket.remove(e)
+                        if not bucket:
+                            del self.entities_by_sector[e.sector_id]
+                    if self.selected_entity is e:
+                        self.selected_entity = None
+            self.entities[:] = [e for e in self.entities if e.id not in entity_ids]
+
+    def depth(self, sector):
+        d = 0
+        cur = sector
+        while getattr(cur, "parent_id", None) is not None:
+            parent = self.sectors_by_id.get(cur.parent_id)
+            if not parent:
+                break
+            d += 1
+            cur = parent
+        return d
+
+    # -----------------------------
+    # Atributos dinâmicos
+    # -----------------------------
+    def set_attr(self, obj, key, value):
+        """Tenta definir um atributo para um Setor ou Entidade, com validação de tipo."""
+        registry = get_registry(obj)
+
+        # 1. Tentar validar contra o registro padrão
+        if key in registry:
+            spec = registry[key]
+            try:
+                # Tenta converter o valor (que vem como string) para o tipo correto
+                converted_value = spec.typ(value)
+            except (ValueError, TypeError):
+                return False # Falha na conversão
+        else:
+            # 2. Se a chave não está no registro (atributo customizado ou de parede):
+            # Armazena como string
+            converted_value = str(value)
+
+        cmd = _attr_command(obj, key, converted_value, True)
+        obj.attrs[key] = converted_value
+        self._record(cmd)
+        return True
+
+    def remove_attrs(self, obj, keys):
+        """Remove atributos customizados de um setor ou entidade."""
+        for key in keys:
+            if key in obj.attrs:
+                cmd = _attr_command(obj, key, None, False)
+                del obj.attrs[key]
+                self._record(cmd)
+    # ... (outras funções de atributo)
+
+    # -----------------------------
+    # Interações essenciais (Desenho/Seleção)
+    # -----------------------------
+
+    def add_vertex(self, mx, my, grid, use_snap):
+        self.current_vertices.append(snap_screen_point(mx, my, grid, use_snap))
+
+    def close_sector(self):
+        if len(self.current_vertices) < 3:
+            return "Setor precisa de 3+ vértices."
+        convex = geo.is_convex_polygon(self.current_vertices)
+        if not convex and not config.AUTO_CONVEX_DECOMPOSE:
+            return "Setor não é convexo."
+        if not convex and validate.find_crossings(geo.edges_of(self.current_vertices)):
+            return "Contorno auto-intersectante: setor não criado."
+        if geo.area_polygon(self.current_vertices) < 0:
+            self.current_vertices = list(reversed(self.current_vertices))
+
+        bbox = geo.polygon_bbox(self.current_vertices)
+        parents = [s for s in self.sectors
+                   if geo.bbox_contains_point(s.bbox, bbox[:2])
+                   and geo.bbox_contains_point(s.bbox, bbox[2:])
+                   and geo.point_in_poly(self.current_vertices[0], s.outer)
+                   and not geo.polys_intersect(self.current_vertices, s.outer)
+                   and all(geo.point_in_poly(v, s.outer) for v in self.current_vertices)]
+
+        if parents:
+            parent_id = min(parents, key=lambda s: abs(s.area)).id
+        else:
+            parent_id = None
+
+        if not convex:
+            return self._close_concave_sector(parent_id)
+
+        s = Sector(self.current_vertices, parent_id=parent_id, id=self.new_sector_id())
+        self.add_sector(s)
+        self.current_vertices = []
+        message = f"Setor {s.id} criado." if parent_id is None else f"Cômodo {s.id} dentro do setor {parent_id}."
+        return message
+
+    def _close_concave_sector(self, parent_id):
+        """Divide o contorno côncavo atual em setores convexos ligados por portais."""
+        result = geo.convex_decompose(self.current_vertices)
+        if result is None:
+            return "Não foi possível dividir o contorno em setores convexos."
+        pieces, diagonals = result
+        internal = {geo.normalize_edge(a, b) for a, b in diagonals}
+
+        added = []
+        for piece in pieces:
+            # As diagonais internas viram portais nos dois setores vizinhos
+            attrs = {f"wall_{i}": "portal" for i, (a, b) in enumerate(geo.edges_of(piece))
+                     if geo.normalize_edge(a, b) in internal}
+            s = Sector(piece, parent_id=parent_id, attrs=attrs, id=self.new_sector_id())
+            self._insert_sector(s)
+            added.append(s)
+        self._record({"op": "batch", "cmds": [{"op": "sector_add", "sector": _sector_state(s)} for s in added]})
+        self.current_vertices = []
+        return f"Setor côncavo dividido em {len(added)} setores convexos ({added[0].id}-{added[-1].id})."
+
+    def pick_sector_recursive(self, pt, sector):
+        if not geo.bbox_contains_point(sector.bbox, pt) or not geo.point_in_poly(pt, sector.outer):
+            return None
+        children = self.children_by_parent.get(sector.id, [])
+        for child in sorted(children, key=lambda c: abs(c.area)):
+            found = self.pick_sector_recursive(pt, child)
+            if found:
+                return found
+        return sector
+
+    def find_sector_at(self, pt):
+        """Retorna o setor mais profundo que contém o ponto (coordenadas do mapa)."""
+        roots = [s for s in self.sectors if getattr(s, "parent_id", None) is None]
+        roots.sort(key=lambda s: abs(s.area), reverse=True)
+        for root in roots:
+            found = self.pick_sector_recursive(pt, root)
+            if found:
+                return found
+        return None
 
-def clear_map():
-    global sectors, current_vertices, selected_sector
-    sectors = []
-    Sector.set_next_id(1)
-    Entity.set_next_id(1)
-    rebuild_indices()
-    selected_sector = None
-    current_vertices = []
-    return "Mapa limpo. Pronto para começar um novo!"
\ No newline at end of file
+    def sector_id_at(self, pt):
+        """Id do setor mais profundo que contém o ponto (None se nenhum).
+
+        Desce a árvore de setores com o mesmo teste exato de locate_points
+        (sem a tolerância do clique): um ponto só não paga a construção da
+        BSP, que fica para os lotes e a prévia.
+        """
+        # Setores cujo pai não está carregado (mapa em blocos) também servem de raiz
+        level = [s for s in self.sectors if s.parent_id not in self.sectors_by_id]
+        found = None
+        while level:
+            hits = [s for s in level if len(s.outer) >= 3 and geo.bbox_contains_point(s.bbox, pt)
+                    and geo.point_in_poly_exact(pt, s.outer)]
+            if not hits:
+                break
+            found = min(hits, key=lambda s: abs(s.area))
+            level = self.children_by_parent.get(found.id, [])
+        return found.id if found else None
+
+    def pick_sector(self, mx, my, grid_map):
+
+        mx, my, = geo.snap_to_grid(mx, my, grid_map)
+
+        map_x, map_y = screen_to_map(mx, my)
+        pt = (map_x, map_y)
+
+        self.selected_sector = self.find_sector_at(pt)
+        if self.selected_sector:
+            return f"Selecionado setor {self.selected_sector.id}"
+        return "Nenhum setor sob o clique."
+
+    def pick_entity(self, mx, my, grid_map):
+        """Tenta selecionar uma entidade próxima ao clique."""
+        map_x, map_y = screen_to_map(mx, my)
+        pt = (map_x, map_y)
+
+        # Itera sobre entidades de trás para frente (última criada é a mais visível)
+        for entity in reversed(self.entities):
+            e_pos = entity.pos
+            if geo.point_distance(pt, e_pos) < config.TOLERANCE:
+                self.selected_entity = entity
+                return f"Entidade {self.selected_entity.id} ({self.selected_entity.type}) selecionada."
+
+        self.selected_entity = None
+        return "Nenhuma entidade selecionada."
+
+    def remove_entity(self, entity):
+        """Remove uma entidade do mapa."""
+        if entity in self.entities:
+            cmd = {"op": "entity_remove", "entity": _entity_state(entity)}
+            self._discard_entity(entity)
+            self._record(cmd)
+            if self.selected_entity == entity:
+                self.selected_entity = None
+            return f"Entidade {entity.id} removida."
+        return "Entidade não encontrada."
+
+    def move_entity(self, entity, pos):
+        """Move uma entidade (coordenadas do mapa) e atualiza o seu setor."""
+        pos = tuple(pos)
+        sector_id = self.sector_id_at(pos)
+        cmd = {"op": "entity_move", "id": entity.id,
+               "old": [list(entity.pos), entity.sector_id],
+               "new": [list(pos), sector_id]}
+        entity.pos = pos
+        self._set_entity_sector(entity, sector_id)
+        self._record(cmd)
+        return f"Entidade {entity.id} movida para o setor {sector_id}."
+
+    def subtree(self, sector):
+        """Retorna o setor e todos os seus descendentes (pré-ordem)."""
+        result = []
+        stack = [sector]
+        while stack:
+            cur = stack.pop()
+            result.append(cur)
+            stack.extend(reversed(self.children_by_parent.get(cur.id, [])))
+        return result
+
+    def remove_sector(self, sector, cascade=False):
+        """Remove um setor atualizando os índices de forma incremental.
+
+        Com cascade=False os filhos sobem para o pai do setor removido; com
+        cascade=True toda a subárvore é removida. Entidades dos setores
+        removidos passam para o setor que continua a envolvê-las (o pai).
+        """
+        if self.sectors_by_id.get(sector.id) is not sector:
+            return "Setor não encontrado."
+
+        doomed = self.subtree(sector) if cascade else [sector]
+        reparented = [] if cascade else [c.id for c in self.children_by_parent.get(sector.id, [])]
+        moved = [[e.id, e.sector_id] for s in doomed for e in self.entities_by_sector.get(s.id, [])]
+        cmd = {"op": "sector_remove", "sectors": [_sector_state(s) for s in doomed],
+               "reparented": reparented, "entities": moved}
+        self._delete_sectors(doomed)
+        self._record(cmd)
+
+        if cascade:
+            return f"Setor {sector.id} e {len(doomed) - 1} descendentes deletados."
+        return f"Setor {sector.id} deletado."
+
+    def _delete_sectors(self, doomed):
+        """Remove os setores de `doomed` (raiz primeiro) e ajusta filhos e entidades.
+
+        O custo é proporcional à subárvore afetada, exceto pela compactação
+        da lista `sectors`.
+        """
+        root = doomed[0]
+        new_parent = root.parent_id
+        doomed_ids = {s.id for s in doomed}
+
+        for s in doomed:
+            # Filhos que sobrevivem sobem para o pai da raiz removida
+            for child in list(self.children_by_parent.get(s.id, [])):
+                if child.id not in doomed_ids:
+                    self._set_sector_parent(child, new_parent)
+            for e in list(self.entities_by_sector.get(s.id, [])):
+                self._set_entity_sector(e, new_parent)
+            self._set_sector_parent(s, None)
+            self.children_by_parent.pop(s.id, None)
+            del self.sectors_by_id[s.id]
+            self._unlink_sector(s)
+            if self.selected_sector is s:
+                self.selected_sector = None
+
+        if len(doomed) == 1:
+            self.sectors.remove(root)
+        else:
+            self.sectors[:] = [s for s in self.sectors if s.id not in doomed_ids]
+
+        # Mantém o parent_id original no objeto (usado pelo histórico)
+        root.parent_id = new_parent
+
+    def locate_points(self, points, sectors_=None):
+        """Id do setor mais profundo que contém cada ponto (None se nenhum), em lote.
+
+        Usa geo.locate_points com os setores do mais profundo (e menor) para
+        o mais raso; `sectors_` restringe os candidatos.
+        """
+        sectors_ = self.sectors if sectors_ is None else sectors_
+        ranked = sorted((s for s in sectors_ if len(s.outer) >= 3),
+                        key=lambda s: (-self.depth(s), abs(s.area)))
+        found = geo.locate_points(points, [s.outer for s in ranked], [s.bbox for s in ranked])
+        if geo.np is not None:
+            found = found.tolist()
+        return [ranked[i].id if i >= 0 else None for i in found]
+
+    def assign_entity_sectors(self, box=None):
+        """Recalcula em lote o sector_id das entidades (só as dentro de `box`, se dado).
+
+        Retorna quantas mudaram; elas ficam marcadas para o próximo save e os
+        ouvintes recebem {"op": "entity_sectors", "ids": [...]} (fora do histórico).
+        Com o mapa carregado em parte (streaming), entidades cujo setor atual
+        não está na memória ficam como estão.
+        """
+        ents, sectors_ = self.entities, None
+        if box is not None:
+            ents = [e for e in self.entities
+                    if box[0] <= e.pos[0] <= box[2] and box[1] <= e.pos[1] <= box[3]]
+            sectors_ = [s for s in self.sectors if s.outer and geo.bbox_overlap(s.bbox, box)]
+        if self.partial:
+            ents = [e for e in ents if e.sector_id is None or e.sector_id in self.sectors_by_id]
+        changed = []
+        for e, sector_id in zip(ents, self.locate_points([e.pos for e in ents], sectors_)):
+            if sector_id != e.sector_id:
+                self._set_entity_sector(e, sector_id)
+                self._unsaved_entities.add(e.id)
+                changed.append(e.id)
+        if changed:
+            self.revision += 1
+            notice = {"op": "entity_sectors", "ids": changed}
+            for listener in self.change_listeners:
+                listener(notice)
+        return len(changed)
+
+    # -----------------------------
+    # Limpeza de geometria
+    # -----------------------------
+    def cleanup_geometry(self, tol=None):
+        """Solda vértices próximos e funde arestas colineares consecutivas.
+
+        Os atributos wall_i são renumerados junto com as arestas. Retorna uma
+        mensagem com as paredes e nós da BSP economizados.
+        """
+        tol = config.TOLERANCE if tol is None else tol
+        walls_before = len(self.build_walls(self.sectors))
+        nodes_before = count_bsp_nodes(self.get_bsp())
+
+        rep = geo.weld_points([v for s in self.sectors for v in s.outer], tol)
+        users = defaultdict(set)
+        for s in self.sectors:
+            for v in s.outer:
+                users[rep[v]].add(s.id)
+
+        edits = []
+        for s in self.sectors:
+            loop = [rep[v] for v in s.outer]
+            tags = [(f"wall_{i}" in s.attrs, s.attrs.get(f"wall_{i}")) for i in range(len(loop))]
+            shared = {v for v in loop if len(users[v]) > 1}
+            loop, tags = _simplify_loop(loop, tags, shared)
+            if len(loop) < 3 or loop == s.outer:
+                continue
+            attrs = {k: v for k, v in s.attrs.items()
+                     if not (k.startswith("wall_") and k[5:].isdigit())}
+            for i, (present, value) in enumerate(tags):
+                if present:
+                    attrs[f"wall_{i}"] = value
+            edits.append({"id": s.id,
+                          "old": {"outer": [list(v) for v in s.outer], "attrs": dict(s.attrs)},
+                          "new": {"outer": [list(v) for v in loop], "attrs": attrs}})
+
+        if not edits:
+            return "Geometria já está limpa."
+        cmd = {"op": "sector_edit", "sectors": edits}
+        self._apply_command(cmd)
+        self._record(cmd)
+
+        walls_saved = walls_before - len(self.build_walls(self.sectors))
+        nodes_saved = nodes_before - count_bsp_nodes(self.get_bsp())
+        return (f"Limpeza: {len(edits)} setores ajustados, {walls_saved} paredes "
+                f"e {nodes_saved} nós da BSP a menos.")
+
+    # -----------------------------
+    # Histórico (undo/redo) por diffs de comando
+    # -----------------------------
+    def _restore_sector(self, state):
+        sec = Sector([tuple(v) for v in state["outer"]],
+                     parent_id=state["parent_id"], attrs=state["attrs"], id=state["id"])
+        self._insert_sector(sec)
+        return sec
+
+    def _find_entity(self, entity_id):
+        return self.entities_by_id.get(entity_id)
+
+    def _record(self, cmd):
+        """Registra um comando executado pelo usuário."""
+        if self._journal_suspended:
+            return
+        self.undo_stack.append(cmd)
+        self.redo_stack.clear()
+        self._write_journal(cmd, False)
+        self._notify_change(cmd)
+
+    def _notify_change(self, cmd):
+        self.revision += 1
+        touched_sectors, touched_entities = touched_objects(cmd)
+        boxes = []
+        for sid, states in touched_sectors.items():
+            outers = self._unsaved_sectors.setdefault(sid, [])
+            outers.extend(state["outer"] for state in states)
+            boxes.extend(geo.polygon_bbox(state["outer"]) for state in states if state["outer"])
+            if sid in self.sectors_by_id:
+                outers.append(list(self.sectors_by_id[sid].outer))
+        self._unsaved_entities.update(touched_entities)
+        if boxes:
+            # A geometria mudou (comandos de geometria chegam aqui já aplicados):
+            # entidades da região podem ter trocado de setor
+            self.assign_entity_sectors((min(b[0] for b in boxes), min(b[1] for b in boxes),
+                                        max(b[2] for b in boxes), max(b[3] for b in boxes)))
+        for listener in self.change_listeners:
+            listener(cmd)
+
+    def _mark_saved(self, folder):
+        self.saved_folder = folder
+        self._unsaved_sectors.clear()
+        self._unsaved_entities.clear()
+
+    def _write_journal(self, cmd, inverse):
+        if self.journal_file is None:
+            return
+        self.journal_file.write(json.dumps({"cmd": cmd, "inverse": inverse}) + "\n")
+        self.journal_file.flush()
+
+    def _apply_command(self, cmd, inverse=False):
+        """Aplica um comando (ou o seu inverso) sem registrá-lo no histórico."""
+        suspended = self._journal_suspended
+        self._journal_suspended = True
+        try:
+            op = cmd["op"]
+            if op == "batch":
+                for sub in (reversed(cmd["cmds"]) if inverse else cmd["cmds"]):
+                    self._apply_command(sub, inverse)
+
+            elif op == "sector_add":
+                state = cmd["sector"]
+                if not inverse:
+                    self._restore_sector(state)
+                elif state["id"] in self.sectors_by_id:
+                    self._delete_sectors([self.sectors_by_id[state["id"]]])
+
+            elif op == "sector_remove":
+                states = cmd["sectors"]
+                if inverse:
+                    for state in states:
+                        self._restore_sector(state)
+                    root_id = states[0]["id"]
+                    for child_id in cmd["reparented"]:
+                        if child_id in self.sectors_by_id:
+                            self._set_sector_parent(self.sectors_by_id[child_id], root_id)
+                    for entity_id, sector_id in cmd["entities"]:
+                        ent = self._find_entity(entity_id)
+                        if ent:
+                            self._set_entity_sector(ent, sector_id)
+                elif states[0]["id"] in self.sectors_by_id:
+                    root = self.sectors_by_id[states[0]["id"]]
+                    self._delete_sectors(self.subtree(root) if len(states) > 1 else [root])
+
+            elif op in ("entity_add", "entity_remove"):
+                state = cmd["entity"]
+                if (op == "entity_add") != inverse:
+                    ent = Entity(tuple(state["pos"]), etype=state["type"], angle=state["angle"],
+                                 sector_id=state["sector_id"], attrs=dict(state["attrs"]),
+                                 id=state["id"])
+                    self._insert_entity(ent)
+                else:
+                    ent = self._find_entity(state["id"])
+                    if ent:
+                        self._discard_entity(ent)
+                        if self.selected_entity is ent:
+                            self.selected_entity = None
+
+            elif op == "entity_move":
+                ent = self._find_entity(cmd["id"])
+                if ent:
+                    pos, sector_id = cmd["old"] if inverse else cmd["new"]
+                    ent.pos = tuple(pos)
+                    self._set_entity_sector(ent, sector_id)
+
+            elif op == "sector_edit":
+                for edit in cmd["sectors"]:
+                    sec = self.sectors_by_id.get(edit["id"])
+                    if sec:
+                        state = edit["old"] if inverse else edit["new"]
+                        self._unlink_sector(sec)
+                        sec.outer = [tuple(v) for v in state["outer"]]
+                        sec.attrs = dict(state["attrs"])
+                        self._link_sector(sec)
+
+            elif op == "attr_set":
+                if cmd["kind"] == "entity":
+                    obj = self._find_entity(cmd["id"])
+                else:
+                    obj = self.sectors_by_id.get(cmd["id"])
+                if obj:
+                    present, value = cmd["old"] if inverse else cmd["new"]
+                    if present:
+                        obj.attrs[cmd["key"]] = value
+                    else:
+                        obj.attrs.pop(cmd["key"], None)
+        finally:
+            self._journal_suspended = suspended
+
+    def undo(self):
+        """Desfaz o último comando."""
+        if not self.undo_stack:
+            return "Nada para desfazer."
+        cmd = self.undo_stack.pop()
+        self._apply_command(cmd, inverse=True)
+        self._write_journal(cmd, True)
+        self._notify_change(cmd)
+        self.redo_stack.append(cmd)
+        return f"Desfeito: {cmd['op']}."
+
+    def redo(self):
+        """Refaz o último comando desfeito."""
+        if not self.redo_stack:
+            return "Nada para refazer."
+        cmd = self.redo_stack.pop()
+        self._apply_command(cmd)
+        self._write_journal(cmd, False)
+        self._notify_change(cmd)
+        self.undo_stack.append(cmd)
+        return f"Refeito: {cmd['op']}."
+
+    def clear_history(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def start_journal(self, path, base=None):
+        """Reinicia o diário de comandos em `path`.
+
+        `base` é a pasta do mapa a partir da qual os comandos são válidos
+        (None para um mapa vazio). O diário é usado por replay_journal para
+        recuperar uma sessão interrompida.
+        """
+        if self.journal_file is not None:
+            self.journal_file.close()
+        self.journal_file = open(path, "w", encoding="utf-8")
+        self.journal_file.write(json.dumps({"base": base}) + "\n")
+        self.journal_file.flush()
+
+    def replay_journal(self, path):
+        """Recarrega o mapa base do diário e reaplica todos os comandos."""
+        if not os.path.exists(path):
+            return "Nenhum diário para recuperar."
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        if not lines:
+            return "Diário vazio."
+
+        base = json.loads(lines[0]).get("base")
+        if base:
+            self.load_map(base)
+        else:
+            self.clear_map()
+        if self.journal_file is not None:
+            # Os comandos recuperados passam a valer no diário atual
+            self.start_journal(self.journal_file.name, base)
+
+        applied = 0
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break # Última linha truncada pela falha
+            self._apply_command(entry["cmd"], inverse=entry["inverse"])
+            self._write_journal(entry["cmd"], entry["inverse"])
+            self._notify_change(entry["cmd"])
+            applied += 1
+
+        return f"Sessão recuperada: {applied} comandos reaplicados sobre '{base or 'mapa vazio'}'."
+
+    # -----------------------------
+    # Walls e BSP
+    # -----------------------------
+    def build_walls(self, sectors_=None):
+        """Paredes dos setores do documento (ou de uma lista avulsa)."""
+        if sectors_ is None:
+            sectors_ = self.sectors
+        if sectors_ is not self.sectors or any(s.vids is None for s in sectors_):
+            return build_walls(sectors_)
+
+        # Vizinhança pelas semi-arestas: O(1) por aresta
+        walls = []
+        for s in sectors_:
+            walls.extend(_sector_walls(s, s.vids, self.half_edges))
+        return walls
+
+    def change_key(self):
+        """Barata (O(1)): muda a cada load/clear e a cada alteração do documento."""
+        return (self.map_epoch, self.revision)
+
+    def geometry_key(self):
+        """Barata (O(1)): muda a cada load/clear e quando a geometria dos setores muda.
+
+        Todo setor entra, sai ou troca de contorno por _link_sector/_unlink_sector.
+        """
+        return (self.map_epoch, self.geometry_revision)
+
+    def get_bsp(self):
+        """BSP da geometria atual, reconstruída só quando algum setor mudou."""
+        key = self.geometry_key()
+        if self._bsp_cache["key"] != key:
+            self._bsp_cache["root"] = build_bsp_from_walls(self.build_walls(self.sectors))
+            self._bsp_cache["key"] = key
+        return self._bsp_cache["root"]
+
+    def get_blockmap(self):
+        """(paredes, blockmap) da geometria atual, refeitos só quando ela muda.
+
+        As paredes guardam só a geometria; is_portal pode estar desatualizado.
+        """
+        key = self.geometry_key()
+        if self._blockmap_cache["key"] != key:
+            walls = self.build_walls(self.sectors)
+            self._blockmap_cache["walls"] = walls
+            self._blockmap_cache["blockmap"] = blockmap.build_blockmap(walls, config.BLOCKMAP_CELL)
+            self._blockmap_cache["key"] = key
+        return self._blockmap_cache["walls"], self._blockmap_cache["blockmap"]
+
+    def validate_map(self):
+        """Problemas de geometria do mapa atual (ver validate.validate_sectors)."""
+        return validate.validate_sectors(self.sectors)
+
+    def walls_near(self, pt, radius, sector_id=None):
+        """Paredes a até `radius` do ponto, da mais próxima para a mais distante.
+
+        Retorna [(distância, índice, parede)]; com sector_id, só as paredes
+        cuja frente é aquele setor.
+        """
+        walls, bmap = self.get_blockmap()
+        found = []
+        for i in bmap.walls_near(pt, radius):
+            w = walls[i]
+            if sector_id is not None and w.sector_front != sector_id:
+                continue
+            d = geo.point_line_distance(pt, w.start, w.end)
+            if d <= radius:
+                found.append((d, i, w))
+        found.sort(key=lambda item: (item[0], item[1]))
+        return found
+
+    # -----------------------------
+    # Portal assist (visual + persistência)
+    # -----------------------------
+    # compute_portal_hints, try_create_portal_at_point
+
+    def compute_portal_hints(self):
+        """Encontra arestas colineares sobrepostas de setores diferentes.
+
+        Os pares de arestas candidatos saem de uma varredura pelos bboxes das
+        arestas (validate.overlapping_pairs), sem comparar todos os setores.
+        Preenche portal_hints {(setor, i): [(setor, j)]}, o conjunto
+        portal_hint_edges e a lista portal_hint_segments (usada na compilação).
+        """
+        self.portal_hint_segments = []
+        self.portal_hints.clear()
+        self.portal_hint_edges.clear()
+
+        edges = [(s.id, i, a, b) for s in self.sectors if len(s.outer) >= 2
+                 for i, (a, b) in enumerate(s.edges)]
+        boxes = [geo.polygon_bbox((a, b)) for _, _, a, b in edges]
+        for m, n in validate.overlapping_pairs(boxes, eps=1.5):
+            if m > n:
+                m, n = n, m # Mantém a ordem dos setores na lista
+            sid1, i, a1, a2 = edges[m]
+            sid2, j, b1, b2 = edges[n]
+            if sid1 == sid2: continue
+            if geo.almost_colinear(a1,a2,b1,b2) and geo.overlap_on_line(a1,a2,b1,b2):
+                self.portal_hint_segments.append(((a1,a2),(b1,b2)))
+                self.portal_hints[(sid1, i)].append((sid2, j))
+                self.portal_hints[(sid2, j)].append((sid1, i))
+                self.portal_hint_edges.add((sid1, i))
+                self.portal_hint_edges.add((sid2, j))
+        self._portal_hint_key = self.geometry_key()
+
+    def get_portal_hint_edges(self):
+        """Conjunto de arestas (setor, i) com dica de portal, refeito se a geometria mudou."""
+        if self._portal_hint_key != self.geometry_key():
+            self.compute_portal_hints()
+        return self.portal_hint_edges
+
+    def try_create_portal_at_point(self, pt, grid_map):
+        """Liga/desliga o portal da aresta com dica mais próxima do clique (pixels da tela).
+
+        A aresta é achada pelo blockmap; ela e as arestas sobrepostas dos
+        vizinhos mudam juntas, num único comando de histórico.
+        """
+        hint_edges = self.get_portal_hint_edges()
+        pt = screen_to_map(*pt)
+        for _, _, w in self.walls_near(pt, config.PICK_RADIUS_PX / grid_map):
+            key = (w.sector_front, w.edge_index)
+            if key not in hint_edges:
+                continue
+            targets = [key] + self.portal_hints[key]
+            make_portal = get_attr(self.sectors_by_id[key[0]], f"wall_{key[1]}") != "portal"
+            cmds = []
+            for sid, i in targets:
+                sec = self.sectors_by_id[sid]
+                attr = f"wall_{i}"
+                if make_portal and get_attr(sec, attr) != "portal":
+                    cmds.append(_attr_command(sec, attr, "portal", True))
+                elif not make_portal and attr in sec.attrs:
+                    cmds.append(_attr_command(sec, attr, None, False))
+            if not cmds:
+                continue # Nada a mudar nesta aresta: sem comando vazio no histórico
+            cmd = {"op": "batch", "cmds": cmds}
+            self._apply_command(cmd)
+            self._record(cmd)
+            return True
+        return False
+
+    # -----------------------------
+    # Persistência
+    # -----------------------------
+    def export_map(self, map_name="map.json", pvs=False, blockmap_cell=None, tile_size=None,
+                   codec=None, level=None, elide_defaults=False):
+        """Grava map.json e entities.json na pasta `map_name`.
+
+        codec ("gzip", "lzma" ou "zlib") comprime os arquivos em fluxo com o nível
+        `level` (map.json.gz etc.); elide_defaults omite atributos iguais ao padrão.
+        """
+
+        #1- Cria o diretório (se não existir)
+        os.makedirs(map_name, exist_ok=True)
+        changelog.wait_idle(map_name) # Uma compactação atrasada não pode sobrescrever este save
+
+        if tile_size:
+            # Layout em blocos: só setores e entidades (paredes, PVS e blockmap
+            # são derivados e ficam para o compile_maps)
+            index = chunks.export_tiles(map_name, [s.to_json(elide_defaults) for s in self.sectors],
+                                        [e.to_json(elide_defaults) for e in self.entities], tile_size,
+                                        self.next_sector_id, self.next_entity_id)
+            # load_map e o editor preferem map.json: a base antiga não pode sobrar
+            for name in ("map.json", "entities.json"):
+                compression.remove_all(os.path.join(map_name, name))
+            changelog.clear_log(map_name)
+            return f"Mapa '{map_name}' exportado em {len(index['tiles'])} blocos de {tile_size:g} unidades."
+
+        #2- Prepara os dados do mapa (Setores e Paredes)
+        walls = self.build_walls(self.sectors)
+        # Tabela de vértices compacta: cada setor referencia os cantos por índice
+        remap = {}
+        vertex_data = []
+        sector_data = []
+        for s in self.sectors:
+            sdata = s.to_json(elide_defaults)
+            for vid in s.vids:
+                if vid not in remap:
+                    remap[vid] = len(vertex_data)
+                    x, y = self.vertices[vid]
+                    vertex_data.append([round(x, 2), round(y, 2)])
+            sdata["vids"] = [remap[vid] for vid in s.vids]
+            del sdata["outer"] # Refeito a partir de "vids" no load_map
+            sector_data.append(sdata)
+        map_data = {
+            "vertices": vertex_data,
+            "sectors": sector_data,
+            "walls": [w.to_json() for w in walls],
+        }
+        if pvs:
+            # Visibilidade entre setores pré-calculada pelos portais
+            map_data["pvs"] = visibility.compute_pvs(self.sectors, walls, config.PVS_MAX_DEPTH).to_json()
+        if blockmap_cell:
+            # Grade de paredes: colisão testa só as paredes das células tocadas
+            map_data["blockmap"] = blockmap.build_blockmap(walls, blockmap_cell).to_json()
+        if codec is not None and level is not None:
+            # A compactação do registro regrava a base com o mesmo nível
+            map_data["compression_level"] = level
+
+        #3- Prepara os dados das entidades
+        entity_data = {
+            "entities": [e.to_json(elide_defaults) for e in self.entities],
+        }
+
+        #4- Exportar map.json
+        # Comprimido: sem indentação, que só aumentaria o trabalho do compressor
+        dump_args = {"indent": 2} if codec is None else {"separators": (",", ":")}
+        names = []
+        for name, data in (("map.json", map_data), ("entities.json", entity_data)):
+            filepath = os.path.join(map_name, name)
+            compression.remove_variants(filepath, keep=codec) # Senão load_map poderia ler a versão antiga
+            with compression.open_text(compression.codec_path(filepath, codec), "w", codec, level) as f:
+                json.dump(data, f, **dump_args)
+            names.append(os.path.basename(compression.codec_path(filepath, codec)))
+        changelog.clear_log(map_name) # A base nova já contém o registro
+        chunks.remove_tiles(map_name) # Blocos de uma exportação anterior ficariam desatualizados
+        self._mark_saved(map_name)
+        return f"Mapa '{map_name}' exportado com sucesso em 2 arquivos: {names[0]} e {names[1]}."
+
+    def save_incremental(self, map_name, pvs=False, blockmap_cell=None, **export_args):
+        """Acrescenta ao changes.jsonl só o que mudou desde o último save.
+
+        Sem base na pasta (outra pasta, mapa em blocos ou nunca salvo) faz
+        export_map completo. Quando o registro passa de CHANGELOG_COMPACT_BYTES
+        ele é fundido na base numa thread em segundo plano.
+        """
+        if (self.saved_folder is None or os.path.normpath(map_name) != os.path.normpath(self.saved_folder)
+                or not compression.exists(os.path.join(map_name, "map.json"))):
+            return self.export_map(map_name, pvs=pvs, blockmap_cell=blockmap_cell, **export_args)
+        if not self._unsaved_sectors and not self._unsaved_entities:
+            return f"Mapa '{map_name}': nada alterado desde o último save."
+
+        # Paredes dos setores alterados e dos vizinhos (o setor de trás pode ter mudado)
+        wall_owners = set(self._unsaved_sectors)
+        for outers in self._unsaved_sectors.values():
+            for outer in outers:
+                for v in outer:
+                    vid = self.vertex_ids.get(_vertex_key(v))
+                    if vid is not None:
+                        wall_owners.update(self.vertex_users.get(vid, ()))
+        live = [sid for sid in sorted(wall_owners) if sid in self.sectors_by_id]
+        walls = [w.to_json() for sid in live
+                 for w in _sector_walls(self.sectors_by_id[sid], self.sectors_by_id[sid].vids, self.half_edges)]
+
+        entities_by_id = self.entities_by_id
+        record = {
+            "sectors": [self.sectors_by_id[sid].to_json() for sid in sorted(self._unsaved_sectors)
+                        if sid in self.sectors_by_id],
+            "removed_sectors": [sid for sid in sorted(self._unsaved_sectors) if sid not in self.sectors_by_id],
+            "walls": {"sectors": sorted(wall_owners), "walls": walls},
+            "entities": [entities_by_id[eid].to_json() for eid in sorted(self._unsaved_entities)
+                         if eid in entities_by_id],
+            "removed_entities": [eid for eid in sorted(self._unsaved_entities) if eid not in entities_by_id],
+        }
+        changelog.append_record(map_name, record)
+        self._mark_saved(map_name)
+
+        msg = (f"Mapa '{map_name}' salvo (incremental): {len(record['sectors'])} setores, "
+               f"{len(record['entities'])} entidades, "
+               f"{len(record['removed_sectors']) + len(record['removed_entities'])} remoções.")
+        if changelog.log_size(map_name) > config.CHANGELOG_COMPACT_BYTES:
+            changelog.compact_async(map_name)
+            msg += " Compactando o registro em segundo plano."
+        return msg
+
+    def load_map(self, map_name="map.json", assign_entities=True):
+        # Carrega o mapa da estrutura de pasta
+        # assign_entities revalida o setor salvo de cada entidade (em lote)
+
+        # map.json e entities.json podem estar comprimidos (map.json.gz etc.)
+        map_file = compression.resolve(os.path.join(map_name, "map.json"))
+        entities_filepath = os.path.join(map_name, "entities.json")
+        tiled = map_file is None and chunks.is_tiled(map_name)
+
+        if map_file is None and not tiled:
+            return f"ERRO: Arquivo de mapa não encontrado, verifique se o nome está certo."
+
+        #1 Carrega mapa com setores e paredes.
+        self.sectors.clear()
+        self.entities.clear()
+        if tiled:
+            # Layout em blocos lido por inteiro (o editor usa streaming.TileStreamer)
+            index = chunks.read_index(map_name)
+            for key in sorted(index["tiles"]):
+                tile = chunks.read_tile(map_name, key)
+                self.sectors.extend(sector_from_json(sdata) for sdata in tile["sectors"])
+                self.entities.extend(entity_from_json(edata) for edata in tile["entities"])
+        else:
+            # Base + registro incremental lidos juntos (a compactação troca os arquivos)
+            with changelog.lock:
+                with compression.open_text(map_file[0], "r", map_file[1]) as f:
+                    map_data = json.load(f)
+
+                entity_data = {"entities": []}
+                entities_file = compression.resolve(entities_filepath)
+                if entities_file is not None:
+                    with compression.open_text(entities_file[0], "r", entities_file[1]) as f:
+                        entity_data = json.load(f)
+                else:
+                    # Aviso para o usuário se o arquivo secundário estiver faltando
+                    print(f"Aviso: Arquivo de entidades {entities_filepath} não encontrado. Assumindo zero entidades.")
+                records = changelog.read_log(map_name)
+            changelog.apply_records(map_data, entity_data, records)
+
+            vertex_data = map_data.get("vertices")
+            for sdata in map_data.get("sectors", []):
+                self.sectors.append(sector_from_json(sdata, vertex_data))
+
+            # Carrega entidades do mapa.
+            for edata in entity_data.get("entities", []):
+                self.entities.append(entity_from_json(edata))
+
+        self._reset_ids()
+        self.rebuild_indices()
+        self.map_epoch = next(_epochs)
+
+        self.selected_sector = None
+        self.selected_entity = None
+        self.current_vertices = []
+        self.clear_history()
+        self._mark_saved(None if tiled else map_name)
+
+        msg = f"Mapa '{map_name}' carregado. Setores: {len(self.sectors)}. Entidades: {len(self.entities)}."
+        if assign_entities:
+            reassigned = self.assign_entity_sectors()
+            if reassigned:
+                msg += f" {reassigned} entidades mudaram de setor."
+        return msg
+
+    def clear_map(self):
+        self.sectors = []
+        self.entities.clear()
+        self.map_epoch = next(_epochs)
+        self.next_sector_id = 1
+        self.next_entity_id = 1
+        self.rebuild_indices()
+        self.selected_sector = None
+        self.selected_entity = None
+        self.current_vertices = []
+        self.clear_history()
+        self._mark_saved(None)
+        return "Mapa limpo. Pronto para começar um novo!"
+
+doc = MapDocument() # Documento aberto no editor
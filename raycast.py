@@ -0,0 +1,246 @@
+# raycast.py
+# Consultas de raio / linha de visão sobre a BSP (percurso frente-para-trás).
+# Os raios são segmentos origem -> alvo; o parâmetro t vai de 0 a 1.
+import math
+
+import geometry as geo
+from data_structures import BSPNode
+
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional: sem ele os lotes usam o percurso em Python
+    np = None
+
+EPS = 1e-9
+SEG_TOL = 1e-6 # Folga na projeção do ponto de impacto sobre a parede
+
+class RayHit:
+    def __init__(self, wall_id, point, distance, sector_id, t):
+        self.wall_id = wall_id     # índice da parede em build_walls
+        self.point = point
+        self.distance = distance
+        self.sector_id = sector_id # setor do lado de onde o raio veio
+        self.t = t
+
+    def __repr__(self):
+        return f"<RayHit wall={self.wall_id}, dist={self.distance:.2f}, sector={self.sector_id}>"
+
+def ray_target(origin, angle, max_dist):
+    """Alvo de um raio a partir de um ângulo em graus (mesma convenção das entidades)."""
+    a = math.radians(angle)
+    return (origin[0] + max_dist * math.cos(a), origin[1] + max_dist * math.sin(a))
+
+def blocking_walls(walls, solid_portals=False):
+    """Máscara das paredes que bloqueiam a visão (portais são aberturas)."""
+    return [solid_portals or not w.is_portal for w in walls]
+
+def _hit_sector(wall, origin):
+    """Setor do lado da parede em que está a origem do raio."""
+    if geo.point_side(origin, (wall.start, wall.end)) >= 0:
+        return wall.sector_front
+    return wall.sector_back
+
+def _project(p, seg):
+    (ax, ay), (bx, by) = seg
+    vx, vy = bx - ax, by - ay
+    return ((p[0] - ax) * vx + (p[1] - ay) * vy) / (vx * vx + vy * vy + EPS)
+
+# -----------------------------
+# Raio único (Python)
+# -----------------------------
+def _trace(node, origin, delta, t0, t1, blocking):
+    if not isinstance(node, BSPNode):
+        return None
+    (x1, y1), (x2, y2) = node.line
+    a = (x2 - x1) * (origin[1] - y1) - (y2 - y1) * (origin[0] - x1)
+    b = (x2 - x1) * delta[1] - (y2 - y1) * delta[0]
+    s0 = a + b * t0
+    s1 = a + b * t1
+    near_front = s0 > 0 or (s0 == 0 and s1 >= 0)
+    far_front = s1 > 0 or (s1 == 0 and s0 >= 0)
+    near = node.front if near_front else node.back
+
+    if near_front == far_front:
+        return _trace(near, origin, delta, t0, t1, blocking)
+
+    t_split = -a / b
+    hit = _trace(near, origin, delta, t0, t_split, blocking)
+    if hit is not None:
+        return hit
+
+    # Paredes sobre a reta do divisor
+    p = (origin[0] + delta[0] * t_split, origin[1] + delta[1] * t_split)
+    for seg, wall_id in zip(node.wall_segments, node.wall_ids):
+        if blocking[wall_id] and -SEG_TOL <= _project(p, seg) <= 1 + SEG_TOL:
+            return (t_split, wall_id)
+
+    far = node.back if near_front else node.front
+    return _trace(far, origin, delta, t_split, t1, blocking)
+
+def cast_ray(bsp_root, walls, origin, target, solid_portals=False, blocking=None):
+    """Primeira parede atingida pelo segmento origem -> alvo (RayHit ou None)."""
+    if blocking is None:
+        blocking = blocking_walls(walls, solid_portals)
+    delta = (target[0] - origin[0], target[1] - origin[1])
+    found = _trace(bsp_root, origin, delta, 0.0, 1.0, blocking)
+    if found is None:
+        return None
+    t, wall_id = found
+    if t < EPS:
+        return None # Origem encostada na parede
+    point = (origin[0] + delta[0] * t, origin[1] + delta[1] * t)
+    return RayHit(wall_id, point, t * math.hypot(*delta), _hit_sector(walls[wall_id], origin), t)
+
+def line_of_sight(bsp_root, walls, a, b, solid_portals=False):
+    """True se nenhuma parede bloqueia o segmento a -> b."""
+    return cast_ray(bsp_root, walls, a, b, solid_portals) is None
+
+# -----------------------------
+# Lotes de raios (NumPy)
+# -----------------------------
+def _trace_batch(node, O, D, idx, t0, t1, best_t, best_wall, blocking):
+    if not isinstance(node, BSPNode) or len(idx) == 0:
+        return
+    # Raios que já bateram antes desta sub-árvore não precisam descer
+    alive = t0 < best_t[idx]
+    if not alive.all():
+        idx, t0, t1 = idx[alive], t0[alive], t1[alive]
+        if len(idx) == 0:
+            return
+
+    (x1, y1), (x2, y2) = node.line
+    ox, oy = O[idx, 0], O[idx, 1]
+    dx, dy = D[idx, 0], D[idx, 1]
+    a = (x2 - x1) * (oy - y1) - (y2 - y1) * (ox - x1)
+    b = (x2 - x1) * dy - (y2 - y1) * dx
+    s0 = a + b * t0
+    s1 = a + b * t1
+    near_front = (s0 > 0) | ((s0 == 0) & (s1 >= 0))
+    far_front = (s1 > 0) | ((s1 == 0) & (s0 >= 0))
+    crossing = near_front != far_front
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_split = np.where(crossing, -a / np.where(b == 0, 1, b), t1)
+
+    # 1. Lado próximo
+    _trace_batch(node.front, O, D, idx[near_front], t0[near_front], t_split[near_front],
+                 best_t, best_wall, blocking)
+    back = ~near_front
+    _trace_batch(node.back, O, D, idx[back], t0[back], t_split[back],
+                 best_t, best_wall, blocking)
+
+    # 2. Paredes sobre o divisor, para os raios que o atravessam
+    cross = crossing & (t_split < best_t[idx])
+    if cross.any():
+        ci = idx[cross]
+        ts = t_split[cross]
+        px = O[ci, 0] + D[ci, 0] * ts
+        py = O[ci, 1] + D[ci, 1] * ts
+        for seg, wall_id in zip(node.wall_segments, node.wall_ids):
+            if not blocking[wall_id]:
+                continue
+            (ax, ay), (bx, by) = seg
+            vx, vy = bx - ax, by - ay
+            u = ((px - ax) * vx + (py - ay) * vy) / (vx * vx + vy * vy + EPS)
+            hit = (u >= -SEG_TOL) & (u <= 1 + SEG_TOL) & (ts < best_t[ci])
+            if hit.any():
+                best_t[ci[hit]] = ts[hit]
+                best_wall[ci[hit]] = wall_id
+
+    # 3. Lado distante, só para quem atravessou sem bater
+    far = crossing & (t_split < best_t[idx])
+    far_f = far & far_front
+    far_b = far & ~far_front
+    _trace_batch(node.front, O, D, idx[far_f], t_split[far_f], t1[far_f],
+                 best_t, best_wall, blocking)
+    _trace_batch(node.back, O, D, idx[far_b], t_split[far_b], t1[far_b],
+                 best_t, best_wall, blocking)
+
+def cast_rays(bsp_root, walls, origins, targets, solid_portals=False):
+    """Lança vários raios de uma vez.
+
+    Retorna (wall_ids, distances, sector_ids): parede atingida (-1 se nenhuma),
+    distância até o impacto (inf se nenhum) e setor do lado da origem
+    (-1 se nenhum). Com NumPy são arrays e o percurso é vetorizado por nó;
+    sem NumPy são listas calculadas raio a raio.
+    """
+    blocking = blocking_walls(walls, solid_portals)
+    if np is None:
+        wall_ids, distances, sector_ids = [], [], []
+        for o, t in zip(origins, targets):
+            hit = cast_ray(bsp_root, walls, o, t, blocking=blocking)
+            wall_ids.append(hit.wall_id if hit else -1)
+            distances.append(hit.distance if hit else math.inf)
+            sid = hit.sector_id if hit else None
+            sector_ids.append(-1 if sid is None else sid)
+        return wall_ids, distances, sector_ids
+
+    O = np.asarray(origins, dtype=float).reshape(-1, 2)
+    T = np.asarray(targets, dtype=float).reshape(-1, 2)
+    D = T - O
+    n = len(O)
+    best_t = np.full(n, np.inf)
+    best_wall = np.full(n, -1, dtype=np.int64)
+    if bsp_root is not None and n:
+        _trace_batch(bsp_root, O, D, np.arange(n), np.zeros(n), np.ones(n),
+                     best_t, best_wall, np.asarray(blocking, dtype=bool))
+
+    # Impactos na própria origem não contam
+    touching = best_t < EPS
+    best_t[touching] = np.inf
+    best_wall[touching] = -1
+
+    hit = best_wall >= 0
+    distances = best_t * np.hypot(D[:, 0], D[:, 1])
+    sector_ids = np.full(n, -1, dtype=np.int64)
+    if hit.any():
+        starts = np.array([w.start for w in walls], dtype=float)
+        ends = np.array([w.end for w in walls], dtype=float)
+        fronts = np.array([-1 if w.sector_front is None else w.sector_front for w in walls])
+        backs = np.array([-1 if w.sector_back is None else w.sector_back for w in walls])
+        hw = best_wall[hit]
+        a, b, o = starts[hw], ends[hw], O[hit]
+        side = (b[:, 0] - a[:, 0]) * (o[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (o[:, 0] - a[:, 0])
+        sector_ids[hit] = np.where(side >= 0, fronts[hw], backs[hw])
+    return best_wall, distances, sector_ids
+
+def sight_matrix(bsp_root, walls, positions, solid_portals=False):
+    """Matriz simétrica de linha de visão entre todos os pares de posições.
+
+    Ex.: sight_matrix(bsp, walls, [e.pos for e in mm.doc.entities]).
+    """
+    n = len(positions)
+    pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+    origins = [positions[i] for i, _ in pairs]
+    targets = [positions[j] for _, j in pairs]
+    wall_ids, _, _ = cast_rays(bsp_root, walls, origins, targets, solid_portals)
+    visible = [[i == j for j in range(n)] for i in range(n)]
+    for (i, j), wall_id in zip(pairs, wall_ids):
+        visible[i][j] = visible[j][i] = (wall_id < 0)
+    return visible
+
+# -----------------------------
+# Referência por força bruta
+# -----------------------------
+def cast_ray_brute(walls, origin, target, solid_portals=False):
+    """Testa o segmento contra todas as paredes (usado para comparação)."""
+    best = None
+    ox, oy = origin
+    dx, dy = target[0] - ox, target[1] - oy
+    for i, w in enumerate(walls):
+        if w.is_portal and not solid_portals:
+            continue
+        (ax, ay), (bx, by) = w.start, w.end
+        ex, ey = bx - ax, by - ay
+        denom = geo.cross(dx, dy, ex, ey)
+        if abs(denom) < EPS:
+            continue
+        t = geo.cross(ax - ox, ay - oy, ex, ey) / denom
+        u = geo.cross(ax - ox, ay - oy, dx, dy) / denom
+        if EPS <= t <= 1 and -SEG_TOL <= u <= 1 + SEG_TOL and (best is None or t < best[0]):
+            best = (t, i)
+    if best is None:
+        return None
+    t, i = best
+    point = (ox + dx * t, oy + dy * t)
+    return RayHit(i, point, t * math.hypot(dx, dy), _hit_sector(walls[i], origin), t)
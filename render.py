@@ -7,6 +7,11 @@ from data_structures import BSPNode
 from data_structures import Entity 
 import map_manager as mm # Para acessar o estado do mapa
 
+try:
+    import numpy as np
+except ImportError: # NumPy é opcional: sem ele a conversão é feita ponto a ponto
+    np = None
+
 def draw_grid(screen):
     """Desenha a grade de fundo."""
     start_x = -config.CAM_OFFSET_X % config.GRID
@@ -18,7 +23,7 @@ def draw_grid(screen):
 
 def draw_current(screen):
     """Desenha o polígono em construção."""
-    verts = map_list_to_screen(mm.current_vertices)
+    verts = current_screen_points()
     if len(verts) > 1:
         pg.draw.lines(screen, config.COL_SECTOR, False, verts, 2)
     
@@ -38,13 +43,106 @@ def map_to_screen (point):
 def map_list_to_screen(points):
     return [map_to_screen(p) for p in points]
 
+# -----------------------------
+# Cache de coordenadas de tela
+# -----------------------------
+# Vértices de cada setor já convertidos para a tela, válidos enquanto a câmera
+# (GRID e deslocamento) e o documento (mm.doc.change_key) não mudam.
+_screen_cache = {"view": None, "geom": None, "sectors": {}}
+_current_cache = {"view": None, "src": [], "pts": []}
+
+def view_key():
+    return (config.GRID, config.CAM_OFFSET_X, config.CAM_OFFSET_Y)
+
+def _screen_entry(sector):
+    """(rev, vértices em tela, bbox em tela) de um setor, calculado em Python."""
+    pts = map_list_to_screen(sector.outer)
+    min_x, min_y = map_to_screen(sector.bbox[:2])
+    max_x, max_y = map_to_screen(sector.bbox[2:])
+    return (sector.rev, pts, (min_x, min_y, max_x, max_y))
+
+_map_arrays = {"geom": None, "arrays": None}
+
+def _sector_arrays(geom):
+    """Vértices de todos os setores num array só (refeito quando a geometria muda)."""
+    if _map_arrays["geom"] != geom:
+        sectors_ = [s for s in mm.doc.sectors if s.outer]
+        sizes = [len(s.outer) for s in sectors_]
+        flat = np.array([p for s in sectors_ for p in s.outer], dtype=float).reshape(-1, 2)
+        bboxes = np.array([s.bbox for s in sectors_], dtype=float).reshape(-1, 4)
+        starts = [0]
+        for size in sizes[:-1]:
+            starts.append(starts[-1] + size)
+        _map_arrays["arrays"] = (sectors_, flat, bboxes, starts, sizes)
+        _map_arrays["geom"] = geom
+    return _map_arrays["arrays"]
+
+def _screen_entries_batch(geom):
+    """Converte todos os setores de uma vez (pan/zoom)."""
+    sectors_, flat, bboxes, starts, sizes = _sector_arrays(geom)
+    grid, ox, oy = view_key()
+    pts = (flat * grid + (ox, oy)).tolist()
+    boxes = (bboxes * grid + (ox, oy, ox, oy)).tolist()
+    return {s.id: (s.rev, pts[start:start + size], tuple(box))
+            for s, start, size, box in zip(sectors_, starts, sizes, boxes)}
+
+def _refresh_screen_cache():
+    view, geom = view_key(), mm.doc.change_key()
+    cache = _screen_cache
+    if cache["view"] == view and cache["geom"] == geom:
+        return cache["sectors"]
+    if cache["view"] != view or cache["geom"] is None or cache["geom"][0] != geom[0]:
+        # Pan/zoom ou mapa novo: tudo de uma vez
+        if np is not None:
+            cache["sectors"] = _screen_entries_batch(geom)
+        else:
+            cache["sectors"] = {s.id: _screen_entry(s) for s in mm.doc.sectors if s.outer}
+    else:
+        # Mesma câmera: só os setores cuja revisão mudou
+        old = cache["sectors"]
+        entries = {}
+        for s in mm.doc.sectors:
+            if not s.outer:
+                continue
+            entry = old.get(s.id)
+            entries[s.id] = entry if entry is not None and entry[0] == s.rev else _screen_entry(s)
+        cache["sectors"] = entries
+    cache["view"], cache["geom"] = view, geom
+    return cache["sectors"]
+
+def current_screen_points():
+    """Vértices do polígono em construção em tela; só os novos são convertidos."""
+    cache = _current_cache
+    src = mm.doc.current_vertices
+    view = view_key()
+    n = len(cache["src"])
+    if cache["view"] != view or len(src) < n or src[:n] != cache["src"]:
+        cache["view"], cache["src"], cache["pts"] = view, [], []
+        n = 0
+    if len(src) > n:
+        cache["src"].extend(src[n:])
+        cache["pts"].extend(map_list_to_screen(src[n:]))
+    return cache["pts"]
+
 def draw_sectors_and_walls(screen, mode="select"):
     """Desenha os setores e suas paredes."""
-    for sector in mm.sectors:
-        screen_outer = map_list_to_screen(sector.outer)
+    if lod_active():
+        draw_sectors_lod(screen, mode)
+        return
+    hint_edges = mm.doc.get_portal_hint_edges() if mode == "portal" else set()
+    min_wall = config.LOD_MIN_WALL_PX ** 2
+    cached = _refresh_screen_cache()
+    for sector in mm.doc.sectors:
+        entry = cached.get(sector.id)
+        if entry is None:
+            continue
+        min_x, min_y, max_x, max_y = entry[2]
+        if max_x < 0 or max_y < 0 or min_x > config.VIEW_W or min_y > config.H:
+            continue
+        screen_outer = entry[1]
         # Preenchimento (transparente)
         fill_color = list(config.COL_SECTOR_FILL)
-        if sector is mm.selected_sector:
+        if sector is mm.doc.selected_sector:
              fill_color[3] = 120 # Mais opaco se selecionado
 
         surface = pg.Surface((config.VIEW_W, config.H), pg.SRCALPHA)
@@ -52,13 +150,15 @@ def draw_sectors_and_walls(screen, mode="select"):
         screen.blit(surface, (0, 0))
 
         # Contorno
-        color = config.COL_SECTOR_SELECTED if sector is mm.selected_sector else config.COL_SECTOR
+        color = config.COL_SECTOR_SELECTED if sector is mm.doc.selected_sector else config.COL_SECTOR
         if len(sector.outer) >= 3:
             pg.draw.polygon(screen, color, screen_outer, 2)
 
         # Desenhar paredes e portais
         if len(sector.outer) >= 2:
             for i, (a, b) in enumerate(geo.edges_of(screen_outer)):
+                if (b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2 < min_wall:
+                    continue # Parede menor que um pixel
                 wall_type = mm.get_attr(sector, f"wall_{i}")
                 
                 if wall_type == "portal":
@@ -74,23 +174,104 @@ def draw_sectors_and_walls(screen, mode="select"):
                     if wall_type == "portal":
                         pg.draw.line(screen, col, a, b, width + 2)
                     
-                    # Desenhar dica de portal (só funciona se a lógica do mm.portal_hint_segments rodar)
-                    for (h1, h2), (h3, h4) in mm.portal_hint_segments:
-                        if geo.point_line_distance(a, h1, h2) < 1.0 or geo.point_line_distance(b, h1, h2) < 1.0:
-                            if geo.almost_colinear(a, b, h1, h2):
-                                # Desenha o segmento de intersecção
-                                sx, sy = (h1[0]+h2[0])/2, (h1[1]+h2[1])/2
-                                pg.draw.circle(screen, config.COL_PORTAL_HINT, (int(sx), int(sy)), 10, 1)
+                    # Dica de portal: consulta O(1) por aresta
+                    if (sector.id, i) in hint_edges:
+                        sx, sy = (a[0]+b[0])/2, (a[1]+b[1])/2
+                        pg.draw.circle(screen, config.COL_PORTAL_HINT, (int(sx), int(sy)), 10, 1)
 
                 # Desenhar todas as paredes como padrão no modo 'draw/select'
                 if mode != "portal":
                     pg.draw.line(screen, col, a, b, width)
 
-# render.py
+# -----------------------------
+# Nível de detalhe (zoom afastado)
+# -----------------------------
+_simplified = {} # sector.id -> (vértices em tela usados, contorno simplificado)
+
+def lod_active():
+    return config.GRID < config.LOD_GRID
+
+def simplified_outline(sector_id, screen_outer):
+    """Contorno sem vértices a menos de LOD_MIN_WALL_PX do último mantido.
+
+    Guardado junto da lista de vértices em tela de que veio: quando o cache de
+    tela é refeito (pan/zoom ou edição) a lista muda e o contorno é recalculado.
+    """
+    entry = _simplified.get(sector_id)
+    if entry is not None and entry[0] is screen_outer:
+        return entry[1]
+    tol = config.LOD_MIN_WALL_PX
+    out = [screen_outer[0]]
+    for p in screen_outer[1:]:
+        last = out[-1]
+        if abs(p[0] - last[0]) + abs(p[1] - last[1]) >= tol:
+            out.append(p)
+    _simplified[sector_id] = (screen_outer, out)
+    return out
+
+def draw_sectors_lod(screen, mode="select"):
+    """Versão simplificada de draw_sectors_and_walls para zoom afastado.
+
+    Um único overlay para todos os preenchimentos, contornos decimados, só
+    portais além do contorno e setores menores que LOD_MIN_SECTOR_PX como pontos.
+    """
+    cached = _refresh_screen_cache()
+    if len(_simplified) > 2 * len(cached):
+        _simplified.clear() # Descarta setores removidos
+    surface = pg.Surface((config.VIEW_W, config.H), pg.SRCALPHA)
+    outlines = []
+    for sector in mm.doc.sectors:
+        entry = cached.get(sector.id)
+        if entry is None:
+            continue
+        min_x, min_y, max_x, max_y = entry[2]
+        if max_x < 0 or max_y < 0 or min_x > config.VIEW_W or min_y > config.H:
+            continue
+        selected = sector is mm.doc.selected_sector
+        color = config.COL_SECTOR_SELECTED if selected else config.COL_SECTOR
+        if max(max_x - min_x, max_y - min_y) < config.LOD_MIN_SECTOR_PX:
+            screen.set_at((int(min_x), int(min_y)), color)
+            continue
+        outline = simplified_outline(sector.id, entry[1])
+        if len(outline) < 3:
+            pg.draw.line(screen, color, outline[0], outline[-1], 1)
+            continue
+        fill_color = list(config.COL_SECTOR_FILL)
+        if selected:
+            fill_color[3] = 120
+        pg.draw.polygon(surface, fill_color, outline)
+        outlines.append((sector, entry[1], outline, color))
+    screen.blit(surface, (0, 0))
+
+    for sector, screen_outer, outline, color in outlines:
+        pg.draw.polygon(screen, color, outline, 1)
+        if mode != "portal":
+            continue
+        for key in sector.attrs:
+            if not key.startswith("wall_") or sector.attrs[key] != "portal":
+                continue
+            i = int(key[5:])
+            if i < len(screen_outer):
+                pg.draw.line(screen, config.COL_PORTAL_CONFIRMED, screen_outer[i],
+                             screen_outer[(i + 1) % len(screen_outer)], 2)
+
+def draw_issues(screen, issues):
+    """Marca os problemas encontrados por validate.validate_sectors."""
+    for issue in issues:
+        x, y = map_to_screen(issue["point"])
+        pg.draw.circle(screen, config.COL_WARN, (int(x), int(y)), 7, 2)
+        pg.draw.line(screen, config.COL_WARN, (x - 4, y - 4), (x + 4, y + 4), 2)
+        pg.draw.line(screen, config.COL_WARN, (x - 4, y + 4), (x + 4, y - 4), 2)
+
 def draw_entities(screen):
     """Desenha todas as entidades no mapa."""
-    for e in mm.entities:
+    if lod_active():
+        draw_entity_clusters(screen)
+        return
+    for e in mm.doc.entities:
         pos = map_to_screen(e.pos)
+        if not (-10 <= pos[0] <= config.VIEW_W + 10 and -10 <= pos[1] <= config.H + 10):
+            continue
         color = Entity.ICONS.get(e.type, config.COL_TEXT)
         
         # Desenhar o ponto central
@@ -103,12 +284,60 @@ def draw_entities(screen):
         pg.draw.line(screen, color, pos, (end_x, end_y), 2)
         
         # Desenhar um contorno se a entidade estiver selecionada
-        if e is mm.selected_entity:
+        if e is mm.doc.selected_entity:
             pg.draw.circle(screen, config.COL_SECTOR_SELECTED, pos, 10, 2)
 
+def _entity_clusters(cell):
+    """[(contagem, x, y, entidade representante)] por célula de tela visível."""
+    grid, ox, oy = view_key()
+    ents = mm.doc.entities
+    if np is not None and ents:
+        xy = np.array([e.pos for e in ents], dtype=float) * grid + (ox, oy)
+        visible = ((xy[:, 0] >= 0) & (xy[:, 1] >= 0)
+                   & (xy[:, 0] <= config.VIEW_W) & (xy[:, 1] <= config.H))
+        index = np.nonzero(visible)[0]
+        xy = xy[index]
+        cells = (xy // cell).astype(np.int64)
+        keys = cells[:, 0] * (config.H // cell + 2) + cells[:, 1]
+        _, first, inverse, counts = np.unique(keys, return_index=True,
+                                              return_inverse=True, return_counts=True)
+        sx = np.bincount(inverse, weights=xy[:, 0]) / counts
+        sy = np.bincount(inverse, weights=xy[:, 1]) / counts
+        return [(int(c), x, y, ents[i])
+                for c, x, y, i in zip(counts.tolist(), sx.tolist(), sy.tolist(),
+                                      index[first].tolist())]
+
+    clusters = {}
+    for e in ents:
+        x = e.pos[0] * grid + ox
+        y = e.pos[1] * grid + oy
+        if x < 0 or y < 0 or x > config.VIEW_W or y > config.H:
+            continue
+        c = clusters.setdefault((int(x // cell), int(y // cell)), [0, 0.0, 0.0, e])
+        c[0] += 1
+        c[1] += x
+        c[2] += y
+    return [(n, sx / n, sy / n, e) for n, sx, sy, e in clusters.values()]
+
+def draw_entity_clusters(screen):
+    """Agrupa as entidades em células de LOD_ENTITY_CLUSTER_PX pixels.
+
+    Cada célula vira um marcador na média das posições, com a cor da primeira
+    entidade e raio crescendo com a quantidade; sem setas de direção.
+    """
+    cell = config.LOD_ENTITY_CLUSTER_PX
+    for count, x, y, e in _entity_clusters(cell):
+        color = Entity.ICONS.get(e.type, config.COL_TEXT)
+        radius = 2 + min(int(math.log2(count)), cell // 2 - 2)
+        pg.draw.circle(screen, color, (int(x), int(y)), radius)
+
+    e = mm.doc.selected_entity
+    if e is not None:
+        pg.draw.circle(screen, config.COL_SECTOR_SELECTED, map_to_screen(e.pos), 6, 2)
+
 def draw_bsp(screen, bsp_root):
     """Função recursiva para desenhar a árvore BSP (apenas debug)."""
-    if bsp_root is None: return
+    if not isinstance(bsp_root, BSPNode): return # None ou folha (subsetor)
 
     # Desenhar o divisor (como um segmento que divide o espaço)
     a, b = bsp_root.line
@@ -141,7 +370,7 @@ def draw_bsp(screen, bsp_root):
 
 def render_bsp(bsp_root, cam_pos, screen):
     """Renderiza a BSP de trás para frente (Back-to-Front)."""
-    if bsp_root is None: return
+    if not isinstance(bsp_root, BSPNode): return
 
     line = bsp_root.line
     side = geo.point_side_label(cam_pos, line)
@@ -161,4 +390,152 @@ def render_bsp(bsp_root, cam_pos, screen):
         render_bsp(bsp_root.back, cam_pos, screen)
     else: # Colinear
         render_bsp(bsp_root.front, cam_pos, screen)
-        render_bsp(bsp_root.back, cam_pos, screen)
\ No newline at end of file
+        render_bsp(bsp_root.back, cam_pos, screen)
+# -----------------------------
+# Prévia em primeira pessoa
+# -----------------------------
+def _shade(color, light, z):
+    """Escurece a cor pelo light_level do setor e pela distância."""
+    f = max(0.15, min(1.0, (light / 255.0) / (1.0 + z * config.FP_DEPTH_FALLOFF)))
+    return (int(color[0] * f), int(color[1] * f), int(color[2] * f))
+
+def draw_first_person(screen, bsp_root, walls, cam_pos, cam_angle):
+    """Prévia em primeira pessoa a partir de cam_pos/cam_angle (graus).
+
+    A BSP é percorrida de frente para trás. Cada parede é recortada contra
+    um buffer de oclusão por coluna: paredes sólidas fecham as colunas,
+    portais só desenham os degraus e estreitam a janela vertical. O
+    percurso termina assim que todas as colunas estiverem fechadas.
+    Retorna (colunas preenchidas, total de colunas, paredes desenhadas).
+    """
+    view_w, view_h = config.VIEW_W, config.H
+    step = config.FP_COLUMN_STEP
+    cols = view_w // step
+    horizon = view_h / 2.0
+    focal = (cols / 2.0) / math.tan(math.radians(config.FP_FOV) / 2.0)
+    focal_y = focal * step # Pixels verticais por unidade em z = 1
+
+    pg.draw.rect(screen, config.COL_BG, (0, 0, view_w, view_h))
+    if bsp_root is None:
+        return 0, cols, 0
+
+    fx, fy = math.cos(math.radians(cam_angle)), math.sin(math.radians(cam_angle))
+    rx, ry = -fy, fx
+    cam_sector = mm.doc.sectors_by_id.get(mm.locate_sector(bsp_root, cam_pos))
+    eye_z = (mm.get_attr(cam_sector, "floor_h") if cam_sector else 0.0) + config.FP_EYE_HEIGHT
+
+    # Portal se qualquer um dos lados da parede compartilhada estiver marcado
+    portal_edges = {geo.normalize_edge(w.start, w.end) for w in walls
+                    if w.is_portal and w.sector_back is not None}
+
+    top = [0] * cols          # primeira linha livre de cada coluna
+    bottom = [view_h] * cols  # última linha livre (exclusiva)
+    solid = [False] * cols
+    state = {"filled": 0, "walls": 0}
+
+    def heights(sector_id):
+        sec = mm.doc.sectors_by_id.get(sector_id)
+        if sec is None:
+            return 0.0, 0.0, 255
+        return (mm.get_attr(sec, "floor_h"), mm.get_attr(sec, "ceiling_h"),
+                mm.get_attr(sec, "light_level"))
+
+    def to_camera(p):
+        dx, dy = p[0] - cam_pos[0], p[1] - cam_pos[1]
+        return dx * rx + dy * ry, dx * fx + dy * fy
+
+    def span(c, y0, y1, color):
+        y0 = max(y0, top[c])
+        y1 = min(y1, bottom[c])
+        if y1 > y0:
+            pg.draw.rect(screen, color, (c * step, y0, step, y1 - y0))
+
+    def draw_wall(seg, wall_id):
+        wall = walls[wall_id]
+        if geo.point_side(cam_pos, seg) > 0:
+            near_id, far_id = wall.sector_front, wall.sector_back
+        elif wall.sector_back is not None:
+            return # O lado de trás é desenhado pela parede gêmea
+        else:
+            near_id, far_id = wall.sector_front, None # Cômodo visto de fora
+
+        (x1, z1), (x2, z2) = to_camera(seg[0]), to_camera(seg[1])
+        near = config.FP_NEAR
+        if z1 < near and z2 < near:
+            return
+        if z1 < near:
+            t = (near - z1) / (z2 - z1)
+            x1, z1 = x1 + (x2 - x1) * t, near
+        elif z2 < near:
+            t = (near - z2) / (z1 - z2)
+            x2, z2 = x2 + (x1 - x2) * t, near
+
+        c1 = cols / 2.0 + x1 / z1 * focal
+        c2 = cols / 2.0 + x2 / z2 * focal
+        if c1 > c2:
+            c1, c2, z1, z2 = c2, c1, z2, z1
+        start, end = max(0, math.ceil(c1)), min(cols, math.ceil(c2))
+        if start >= end:
+            return
+
+        is_portal = far_id is not None and geo.normalize_edge(wall.start, wall.end) in portal_edges
+        floor_h, ceil_h, light = heights(near_id)
+        if is_portal:
+            back_floor, back_ceil, _ = heights(far_id)
+        state["walls"] += 1
+
+        inv1, inv2 = 1.0 / z1, 1.0 / z2
+        for c in range(start, end):
+            if solid[c]:
+                continue
+            t = (c - c1) / (c2 - c1) if c2 > c1 else 0.0
+            inv_z = inv1 + (inv2 - inv1) * t # 1/z é linear na tela
+            z = 1.0 / inv_z
+            y_ceil = int(horizon - (ceil_h - eye_z) * inv_z * focal_y)
+            y_floor = int(horizon - (floor_h - eye_z) * inv_z * focal_y)
+
+            span(c, top[c], y_ceil, _shade(config.COL_FP_CEILING, light, z))
+            span(c, y_floor, bottom[c], _shade(config.COL_FP_FLOOR, light, z))
+
+            if not is_portal:
+                span(c, y_ceil, y_floor, _shade(config.COL_FP_WALL, light, z))
+                solid[c] = True
+                state["filled"] += 1
+                continue
+
+            # Portal: degraus superior/inferior e janela para o setor de trás
+            y_back_ceil = int(horizon - (back_ceil - eye_z) * inv_z * focal_y)
+            y_back_floor = int(horizon - (back_floor - eye_z) * inv_z * focal_y)
+            if y_back_ceil > y_ceil:
+                span(c, y_ceil, y_back_ceil, _shade(config.COL_FP_STEP, light, z))
+            if y_back_floor < y_floor:
+                span(c, y_back_floor, y_floor, _shade(config.COL_FP_STEP, light, z))
+            top[c] = max(top[c], y_ceil, y_back_ceil)
+            bottom[c] = min(bottom[c], y_floor, y_back_floor)
+            if top[c] >= bottom[c]:
+                solid[c] = True
+                state["filled"] += 1
+
+    def visit(node):
+        """Percurso frente-para-trás; retorna True quando a tela está cheia."""
+        if not isinstance(node, BSPNode):
+            return state["filled"] >= cols
+        cam_front = geo.point_side(cam_pos, node.line) >= 0
+        near, far = (node.front, node.back) if cam_front else (node.back, node.front)
+        if visit(near):
+            return True
+        for seg, wall_id in zip(node.wall_segments, node.wall_ids):
+            draw_wall(seg, wall_id)
+        if state["filled"] >= cols:
+            return True
+        return visit(far)
+
+    visit(bsp_root)
+    return state["filled"], cols, state["walls"]
+
+def find_player_spawn():
+    """Primeira entidade player_spawn do mapa (ou None)."""
+    for e in mm.doc.entities:
+        if e.type == "player_spawn":
+            return e
+    return None
@@ -0,0 +1,162 @@
+# streaming.py
+# Carregamento sob demanda de mapas em blocos (chunks.py) no editor: só os
+# blocos perto da câmera ficam no documento (mm.doc); os distantes saem em ordem LRU
+# quando o total de objetos passa do orçamento, e só os blocos alterados são
+# regravados ao salvar.
+from collections import OrderedDict
+
+import chunks
+import config
+import map_manager as mm
+
+class TileStreamer:
+    def __init__(self, folder, budget=None, margin=None, doc=None):
+        self.folder = folder
+        self.doc = mm.doc if doc is None else doc
+        self.index = chunks.read_index(folder)
+        self.tile_size = self.index["tile_size"]
+        self.budget = config.CHUNK_BUDGET if budget is None else budget
+        self.margin = (config.CHUNK_MARGIN if margin is None else margin) * self.tile_size
+        self.loaded = OrderedDict()  # bloco -> (ids de setores, ids de entidades), do menos ao mais recente
+        self.sector_tile = {}        # id do setor -> bloco dono
+        self.entity_tile = {}        # id da entidade -> bloco dono
+        self.dirty = set()           # blocos alterados desde o último flush
+        self.pinned = set()          # blocos editados na sessão (o histórico ainda pode tocá-los)
+        self._last_box = None
+
+    def resident_objects(self):
+        return sum(len(sids) + len(eids) for sids, eids in self.loaded.values())
+
+    # -----------------------------
+    # Carga e descarte
+    # -----------------------------
+    def load_tile(self, key):
+        if key in self.loaded:
+            self.loaded.move_to_end(key)
+            return
+        sids, eids = set(), set()
+        if key in self.index["tiles"]:
+            tile = chunks.read_tile(self.folder, key)
+            new_sectors = [mm.sector_from_json(sdata) for sdata in tile["sectors"]]
+            new_entities = [mm.entity_from_json(edata) for edata in tile["entities"]]
+            self.doc.attach_objects(new_sectors, new_entities)
+            sids = {s.id for s in new_sectors}
+            eids = {e.id for e in new_entities}
+        self.loaded[key] = (sids, eids)
+        for sid in sids:
+            self.sector_tile[sid] = key
+        for eid in eids:
+            self.entity_tile[eid] = key
+        if key in self.index["tiles"]:
+            # Revalida o setor das entidades na região do bloco (on_change marca os blocos)
+            self.doc.assign_entity_sectors(self.index["tiles"][key]["bbox"])
+
+    def evict_tile(self, key):
+        sids, eids = self.loaded.pop(key)
+        if key in self.dirty:
+            self._write_tile(key, sids, eids)
+        self.doc.detach_objects(sids, eids)
+        for sid in sids:
+            self.sector_tile.pop(sid, None)
+        for eid in eids:
+            self.entity_tile.pop(eid, None)
+
+    def update(self, box):
+        """Carrega os blocos que tocam `box` (coordenadas do mapa, com margem)
+        e descarta os menos usados além do orçamento. True se algo mudou."""
+        if box == self._last_box:
+            return False
+        self._last_box = box
+        m = self.margin
+        wanted = chunks.tiles_in_box(self.index, (box[0] - m, box[1] - m, box[2] + m, box[3] + m))
+        before = set(self.loaded)
+        for key in wanted:
+            self.load_tile(key)
+        wanted = set(wanted)
+        for key in list(self.loaded):
+            if self.resident_objects() <= self.budget:
+                break
+            if key not in wanted and key not in self.pinned:
+                self.evict_tile(key)
+        return set(self.loaded) != before
+
+    # -----------------------------
+    # Alterações e gravação
+    # -----------------------------
+    def _owner_for_new(self, key):
+        self.load_tile(key) # O bloco precisa estar inteiro na memória antes de ser regravado
+        return self.loaded[key]
+
+    def _touch_sector(self, sid, state=None):
+        key = self.sector_tile.get(sid)
+        if key is None and state is not None:
+            key = chunks.sector_tile(state, self.tile_size)
+            self._owner_for_new(key)[0].add(sid)
+            self.sector_tile[sid] = key
+        if key is not None:
+            self.dirty.add(key)
+
+    def _touch_entity(self, eid, state=None):
+        key = self.entity_tile.get(eid)
+        if key is None and state is not None:
+            key = chunks.tile_of(state["pos"], self.tile_size)
+            self._owner_for_new(key)[1].add(eid)
+            self.entity_tile[eid] = key
+        if key is not None:
+            self.dirty.add(key)
+
+    def on_change(self, cmd):
+        """Ouvinte de doc.change_listeners: marca os blocos tocados pelo comando."""
+        touched_sectors, touched_entities = mm.touched_objects(cmd)
+        for sid, states in touched_sectors.items():
+            self._touch_sector(sid, states[0] if states else None)
+        for eid, state in touched_entities.items():
+            self._touch_entity(eid, state)
+        self.pinned |= self.dirty
+
+    def _write_tile(self, key, sids, eids):
+        entities_by_id = self.doc.entities_by_id
+        tile = {"sectors": [self.doc.sectors_by_id[sid].to_json() for sid in sorted(sids)
+                            if sid in self.doc.sectors_by_id],
+                "entities": [entities_by_id[eid].to_json() for eid in sorted(eids)
+                             if eid in entities_by_id]}
+        entry = chunks.write_tile(self.folder, key, tile)
+        if entry is None:
+            self.index["tiles"].pop(key, None)
+        else:
+            self.index["tiles"][key] = entry
+
+    def flush(self):
+        """Regrava só os blocos alterados e o índice. Retorna quantos foram gravados."""
+        written = len(self.dirty)
+        for key in sorted(self.dirty):
+            sids, eids = self.loaded[key]
+            self._write_tile(key, sids, eids)
+        self.dirty.clear()
+        self.index["next_sector_id"] = max(self.index["next_sector_id"], self.doc.next_sector_id)
+        self.index["next_entity_id"] = max(self.index["next_entity_id"], self.doc.next_entity_id)
+        chunks.write_index(self.folder, self.index)
+        self._last_box = None # bboxes do índice podem ter mudado
+        return written
+
+    def status_text(self):
+        """Resumo curto para a linha de estatísticas: carregados/total e alterados."""
+        return f"{len(self.loaded)}/{len(self.index['tiles'])} blocos +{len(self.dirty)}"
+
+def open_tiled(folder, budget=None, margin=None, doc=None):
+    """Troca o mapa do documento (padrão: o do editor) por um mapa em blocos
+    vazio, carregado sob demanda."""
+    streamer = TileStreamer(folder, budget, margin, doc)
+    doc = streamer.doc
+    doc.clear_map()
+    # Ids novos não podem colidir com os dos blocos ainda não carregados
+    doc.next_sector_id = streamer.index["next_sector_id"]
+    doc.next_entity_id = streamer.index["next_entity_id"]
+    doc.change_listeners.append(streamer.on_change)
+    doc.partial = True
+    return streamer
+
+def close(streamer):
+    if streamer is not None and streamer.on_change in streamer.doc.change_listeners:
+        streamer.doc.change_listeners.remove(streamer.on_change)
+        streamer.doc.partial = False
@@ -14,11 +14,16 @@ mode = "draw"
 show_grid = True
 use_snap = True
 show_bsp = False
+show_preview = False
+frame_stats = "" # FPS e tempo do último quadro (FrameScheduler)
+prompt = None # Caixa de texto ativa: {"label", "text", "callback"}
 
 def init_ui(pg_font, on_export_func=None, on_load_func=None, on_clear_func=None, on_bsp_toggle_func=None):
     """Inicializa fontes e constrói a UI inicial."""
     global font
     font = pg_font
+    # Texto só é capturado com uma caixa aberta (a tecla que abre a caixa não vaza para ela)
+    pg.key.stop_text_input()
     #if on_export_func and on_load_funck and on_clear_func and on_bsp_toggle_func:
     #    rebuild_ui(on_export_func, on_load_func, on_clear_func, on_bsp_toggle_func)
 
@@ -70,8 +75,8 @@ def rebuild_attr_panel():
     
     # Atributos dinâmicos são apenas strings na UI por simplicidade
     y_start = 220
-    if mm.selected_entity:
-        entity = mm.selected_entity
+    if mm.doc.selected_entity:
+        entity = mm.doc.selected_entity
         
         # ... (Exibição básica de ID, tipo, posição, etc.) ...
         attr_elements.append((y_start, f"ENTIDADE {entity.id} | Tipo: {entity.type}", config.COL_PORTAL_CONFIRMED))
@@ -113,13 +118,13 @@ def rebuild_attr_panel():
         y_start += 10
         # Continua para a seção de setores, mas com y_start mais alto
 
-    elif mm.selected_sector:
+    elif mm.doc.selected_sector:
         # Título
-        attr_elements.append((y_start, f"Setor {mm.selected_sector.id} | Profundidade: {mm.depth(mm.selected_sector)}", config.COL_SECTOR_SELECTED))
+        attr_elements.append((y_start, f"Setor {mm.doc.selected_sector.id} | Profundidade: {mm.doc.depth(mm.doc.selected_sector)}", config.COL_SECTOR_SELECTED))
         y_start += 20
         # Atributos atuais
         for i, (key, spec) in enumerate(ATTRIBUTE_REGISTRY.items()):
-            val = mm.get_attr(mm.selected_sector, key)
+            val = mm.get_attr(mm.doc.selected_sector, key)
             if val is None:
                 display_val = f"<{spec.typ.__name__}> (Default: {spec.default})"
                 color = config.COL_TEXT
@@ -133,11 +138,11 @@ def rebuild_attr_panel():
         
         # Atributos de parede
         y_start += 10
-        attr_elements.append((y_start, f"Setor {mm.selected_sector.id} | Profundidade: {mm.depth(mm.selected_sector)}", config.COL_SECTOR_SELECTED))
+        attr_elements.append((y_start, f"Setor {mm.doc.selected_sector.id} | Profundidade: {mm.doc.depth(mm.doc.selected_sector)}", config.COL_SECTOR_SELECTED))
         y_start += 20
 
-        for i, (key, spec) in enumerate(mm.selected_sector.outer):
-            wall_attr = mm.get_attr(mm.selected_sector, f"wall_{i}")
+        for i, (key, spec) in enumerate(mm.doc.selected_sector.outer):
+            wall_attr = mm.get_attr(mm.doc.selected_sector, f"wall_{i}")
             if wall_attr:
                 display_val = wall_attr
                 color = config.COL_PORTAL_CONFIRMED if wall_attr == "portal" else config.COL_TEXT
@@ -153,7 +158,7 @@ def rebuild_help_panel():
     global help_elements
     help_elements.clear()
     
-    y_start = config.H - 180
+    y_start = config.H - 280
     help_elements.append((y_start, "--- Comandos ---", config.COL_TEXT))
     y_start += 20
     
@@ -166,13 +171,21 @@ def rebuild_help_panel():
     y_start += 20
     help_elements.append((y_start, "[Limpar Vértices [N]]", config.COL_TEXT))
     y_start += 20
-    help_elements.append((y_start, "[Desfazer Vértice [Z]]", config.COL_TEXT))
+    help_elements.append((y_start, "[Desfazer [Z] / Refazer [Y]]", config.COL_TEXT))
+    y_start += 20
+    help_elements.append((y_start, "[Recuperar Sessão [R]]", config.COL_TEXT))
+    y_start += 20
+    help_elements.append((y_start, "[Mover Entidade/Vértice [M]]", config.COL_TEXT))
     y_start += 20
     help_elements.append((y_start, "[Atribuir Attr [A]]", config.COL_TEXT))
     y_start += 20
-    help_elements.append((y_start, "[Deletar Setor [DEL]]", config.COL_TEXT))
+    help_elements.append((y_start, "[Deletar Setor [DEL] / c/ filhos [Shift+DEL]]", config.COL_TEXT))
     y_start += 20
     help_elements.append((y_start, "[Wall Attr [W]]", config.COL_TEXT))
+    y_start += 20
+    help_elements.append((y_start, "[Limpar Geometria [C] / Validar [V]]", config.COL_TEXT))
+    y_start += 20
+    help_elements.append((y_start, f"[Prévia 1ª Pessoa [F]]: {'ON' if show_preview else 'OFF'}", config.COL_TEXT))
 
 
 # --- Drawing ---
@@ -189,6 +202,8 @@ def draw_ui(screen):
     # Modo Atual
     mode_text = font.render(f"MODO: {mode.upper()}", True, config.COL_SECTOR_SELECTED)
     screen.blit(mode_text, (config.VIEW_W + 10, 180))
+    stats_text = font.render(frame_stats, True, config.COL_TEXT)
+    screen.blit(stats_text, (config.UI_W + config.VIEW_W - stats_text.get_width() - 10, 180))
 
     # Mensagem de status
     message_text = font.render(message, True, config.COL_WARN)
@@ -208,8 +223,58 @@ def draw_ui(screen):
         text_surf = font.render(text, True, color)
         screen.blit(text_surf, (config.VIEW_W + 10, y))
 
+    if prompt is not None:
+        draw_prompt(screen)
+
+# --- Caixa de texto (não bloqueante) ---
+def begin_prompt(label, callback, initial=""):
+    """Abre uma caixa de texto na janela.
+
+    O loop continua rodando; ao confirmar com Enter, callback(texto) é
+    chamado com o texto sem espaços nas pontas (vazio se cancelado com Esc).
+    """
+    global prompt
+    prompt = {"label": label, "text": initial, "callback": callback}
+    pg.key.start_text_input()
+
+def prompt_active():
+    return prompt is not None
+
+def _finish_prompt(text):
+    global prompt
+    callback = prompt["callback"]
+    prompt = None
+    pg.key.stop_text_input()
+    callback(text.strip())
+
+def handle_prompt_event(event):
+    """Consome teclado e cliques enquanto a caixa de texto está aberta."""
+    if event.type == pg.TEXTINPUT:
+        prompt["text"] += event.text
+    elif event.type == pg.KEYDOWN:
+        if event.key in (pg.K_RETURN, pg.K_KP_ENTER):
+            _finish_prompt(prompt["text"])
+        elif event.key == pg.K_ESCAPE:
+            _finish_prompt("")
+        elif event.key == pg.K_BACKSPACE:
+            prompt["text"] = prompt["text"][:-1]
+    elif event.type not in (pg.KEYUP, pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP, pg.MOUSEWHEEL):
+        return False # Movimento do mouse, janela etc. seguem normalmente
+    return True
+
+def draw_prompt(screen):
+    box = pg.Rect(10, config.H - 70, config.VIEW_W - 20, 60)
+    pg.draw.rect(screen, config.COL_UI, box)
+    pg.draw.rect(screen, config.COL_SECTOR, box, 2)
+    label = font.render(prompt["label"], True, config.COL_TEXT)
+    screen.blit(label, (box.x + 10, box.y + 8))
+    text = font.render(prompt["text"] + "_", True, config.COL_SECTOR_SELECTED)
+    screen.blit(text, (box.x + 10, box.y + 32))
+
 def handle_ui_event(event):
     """Trata eventos para botões de UI."""
+    if prompt is not None:
+        return handle_prompt_event(event)
     for element in ui_elements:
         if element.handle_event(event):
             return True
@@ -236,3 +301,11 @@ def toggle_snap():
 def toggle_bsp():
     global show_bsp
     show_bsp = not show_bsp
+
+def toggle_preview():
+    global show_preview
+    show_preview = not show_preview
+
+def set_frame_stats(text):
+    global frame_stats
+    frame_stats = text
@@ -0,0 +1,110 @@
+# validate.py
+# Validação do mapa inteiro: contornos auto-intersectantes, paredes que se
+# cruzam e setores sobrepostos. Usa uma varredura em x (sweep-and-prune)
+# com o conjunto ativo ordenado por y, então só pares próximos são testados.
+import bisect
+import heapq
+
+import geometry as geo
+
+EPS = 1e-6
+
+KIND_LABELS = {
+    "self_intersection": "contorno(s) auto-intersectante(s)",
+    "crossing": "cruzamento(s) de paredes",
+    "overlap": "sobreposição(ões) de setores",
+}
+
+def overlapping_pairs(boxes, eps=EPS):
+    """Pares (i, j) de bboxes (min_x, min_y, max_x, max_y) que se tocam.
+
+    Varre os retângulos por min_x; os ativos ficam num heap por max_x (para
+    sair da varredura) e numa lista ordenada por min_y, de onde a consulta
+    por faixa de y retira os candidatos.
+    """
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][0])
+    leaving = [] # heap (max_x, i)
+    by_y = []    # [(min_y, i)] ordenada
+    for i in order:
+        x0, y0, x1, y1 = boxes[i]
+        while leaving and leaving[0][0] < x0 - eps:
+            _, j = heapq.heappop(leaving)
+            del by_y[bisect.bisect_left(by_y, (boxes[j][1], j))]
+        end = bisect.bisect_right(by_y, (y1 + eps, len(boxes)))
+        for _, j in by_y[:end]:
+            if boxes[j][3] >= y0 - eps:
+                yield (j, i) if j < i else (i, j)
+        heapq.heappush(leaving, (x1, i))
+        bisect.insort(by_y, (y0, i))
+
+def find_crossings(segments, eps=EPS):
+    """Cruzamentos próprios entre segmentos [(a, b), ...].
+
+    Retorna [(i, j, ponto)]. Extremos encostados e trechos colineares
+    (paredes compartilhadas) não são cruzamentos.
+    """
+    boxes = [geo.polygon_bbox(seg) for seg in segments]
+    found = []
+    for i, j in overlapping_pairs(boxes, eps):
+        p = geo.proper_intersection(*segments[i], *segments[j], eps)
+        if p is not None:
+            found.append((i, j, p))
+    return found
+
+def _ancestors(sector, by_id):
+    seen = set()
+    parent_id = sector.parent_id
+    while parent_id is not None and parent_id not in seen:
+        seen.add(parent_id)
+        parent = by_id.get(parent_id)
+        parent_id = parent.parent_id if parent else None
+    return seen
+
+def validate_sectors(sectors_, eps=EPS):
+    """Valida uma lista de setores.
+
+    Retorna [{"kind", "sectors": [ids], "point": (x, y)}], com kind em
+    KIND_LABELS. Setores aninhados (pai/filho) não contam como sobrepostos.
+    """
+    issues = []
+    segments, owner = [], []
+    for s in sectors_:
+        for i, (a, b) in enumerate(s.edges):
+            if geo.point_distance(a, b) > eps:
+                segments.append((a, b))
+                owner.append(s.id)
+
+    # 1. Contornos e paredes que se cruzam
+    crossing_pairs = set()
+    for i, j, p in find_crossings(segments, eps):
+        a, b = owner[i], owner[j]
+        if a == b:
+            issues.append({"kind": "self_intersection", "sectors": [a], "point": p})
+        else:
+            crossing_pairs.add((min(a, b), max(a, b)))
+            issues.append({"kind": "crossing", "sectors": sorted((a, b)), "point": p})
+
+    # 2. Sobreposições sem cruzamento (um setor dentro do outro sem ser filho)
+    valid = [s for s in sectors_ if len(s.outer) >= 3]
+    by_id = {s.id: s for s in valid}
+    ancestors = {s.id: _ancestors(s, by_id) for s in valid}
+    for i, j in overlapping_pairs([s.bbox for s in valid], eps):
+        a, b = valid[i], valid[j]
+        pair = (min(a.id, b.id), max(a.id, b.id))
+        if pair in crossing_pairs or a.id in ancestors[b.id] or b.id in ancestors[a.id]:
+            continue
+        for inner, outer in ((a, b), (b, a)):
+            if geo.point_strictly_in_poly(inner.centroid, outer.outer, eps):
+                issues.append({"kind": "overlap", "sectors": list(pair), "point": inner.centroid})
+                break
+    return issues
+
+def summarize(issues):
+    """Mensagem curta com a contagem de problemas por tipo."""
+    if not issues:
+        return "Mapa válido: nenhum problema encontrado."
+    counts = {kind: 0 for kind in KIND_LABELS}
+    for issue in issues:
+        counts[issue["kind"]] += 1
+    parts = [f"{n} {KIND_LABELS[k]}" for k, n in counts.items() if n]
+    return f"{len(issues)} problemas: " + ", ".join(parts) + "."
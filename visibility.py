@@ -0,0 +1,263 @@
+# visibility.py
+# Conjunto potencialmente visível (PVS) entre setores, calculado offline
+# percorrendo o grafo setor/portal com recorte por anti-penumbra.
+import base64
+from collections import defaultdict
+
+import geometry as geo
+
+EPS = 1e-6
+
+# -----------------------------
+# Grafo de portais
+# -----------------------------
+def build_portal_graph(walls):
+    """Retorna {sector_id: [(segmento, vizinho_id)]}.
+
+    O segmento é orientado como parede do setor de origem (interior à frente),
+    então atravessar o portal significa ir para o lado de trás da reta.
+    Um portal marcado em qualquer um dos lados abre a passagem nos dois sentidos.
+    """
+    graph = defaultdict(dict)
+    for w in walls:
+        if not w.is_portal or w.sector_back is None:
+            continue
+        key = geo.normalize_edge(w.start, w.end)
+        graph[w.sector_front][(key, w.sector_back)] = (w.start, w.end)
+        graph[w.sector_back][(key, w.sector_front)] = (w.end, w.start)
+    # Ordem fixa: o resultado do fluxo (poda e limite de profundidade) não
+    # depende da ordem das paredes no arquivo
+    return {sid: [(portals[key], key[1]) for key in sorted(portals)]
+            for sid, portals in graph.items()}
+
+# -----------------------------
+# Recorte de segmentos
+# -----------------------------
+def clip_to_antipenumbra(source, portal, target):
+    """Recorta `target` à região alcançável por retas que passam por
+    `source` e depois por `portal`.
+
+    As fronteiras são as retas que ligam um extremo de `source` a um extremo
+    de `portal` deixando os dois segmentos em lados opostos; `target` é
+    mantido do lado do portal.
+    """
+    for i in range(2):
+        u, u_other = source[i], source[1 - i]
+        for j in range(2):
+            v, v_other = portal[j], portal[1 - j]
+            if geo.point_distance(u, v) < EPS:
+                continue
+            line = (u, v)
+            side_src = geo.point_side(u_other, line)
+            side_portal = geo.point_side(v_other, line)
+            if side_src > EPS and side_portal < -EPS:
+                keep = -1
+            elif side_src < -EPS and side_portal > EPS:
+                keep = 1
+            else:
+                continue # Não separa os dois segmentos
+            target = geo.clip_segment(target, line, keep, EPS)
+            if target is None or geo.segment_length(target) < EPS:
+                return None
+    return target
+
+# -----------------------------
+# Fluxo pelos portais
+# -----------------------------
+def _param(pt, seg):
+    """Posição de `pt` ao longo de `seg` (0 no início, 1 no fim)."""
+    (ax, ay), (bx, by) = seg
+    dx, dy = bx - ax, by - ay
+    return ((pt[0] - ax) * dx + (pt[1] - ay) * dy) / (dx * dx + dy * dy)
+
+def _span(part, seg):
+    t0, t1 = _param(part[0], seg), _param(part[1], seg)
+    return (t0, t1) if t0 <= t1 else (t1, t0)
+
+def _covered(explored, key, src, dst):
+    """True se `key` já foi percorrido com origem e passagem que contêm as atuais.
+
+    A visibilidade além do portal só diminui quando origem e passagem
+    encolhem, então esse ramo não acrescenta nenhum setor.
+    """
+    for s0, s1, d0, d1 in explored.get(key, ()):
+        if s0 <= src[0] + EPS and src[1] <= s1 + EPS and d0 <= dst[0] + EPS and dst[1] <= d1 + EPS:
+            return True
+    return False
+
+def _might_see(graph, sector_id, seg, nb):
+    """Pré-passe grosseiro: setores alcançáveis por `seg` passando só por
+    portais que têm algum ponto além da sua reta.
+
+    Uma reta de visão que atravessa o portal fica além dele dali em diante,
+    então o fluxo exato nunca vê nada fora desse conjunto.
+    """
+    seen = {nb}
+    stack = [nb]
+    while stack:
+        cur = stack.pop()
+        for q, nxt in graph.get(cur, []):
+            if nxt in seen or nxt == sector_id:
+                continue
+            if geo.point_side(q[0], seg) > EPS and geo.point_side(q[1], seg) > EPS:
+                continue # Inteiramente antes do portal
+            seen.add(nxt)
+            stack.append(nxt)
+    return seen
+
+def _flow(graph, might, first, source, passage, sector_id, path, visible, explored, bound, max_depth):
+    for seg, nb in graph.get(sector_id, []):
+        if nb in path:
+            continue
+        # O portal seguinte precisa estar além da passagem e da origem
+        target = geo.clip_segment(seg, passage, -1, EPS)
+        if target is not None:
+            target = geo.clip_segment(target, source, -1, EPS)
+        if target is None or geo.segment_length(target) < EPS:
+            continue
+        target = clip_to_antipenumbra(source, passage, target)
+        if target is None:
+            continue
+        # Estreita a origem olhando de volta pelo portal
+        new_source = clip_to_antipenumbra(target, passage, source)
+        if new_source is None:
+            continue
+        visible.add(nb)
+        # Além deste portal só dá para ver o que ele mesmo vê: sem setor novo possível, para
+        new_bound = bound & might[(sector_id, seg)]
+        if new_bound <= visible:
+            continue
+        if max_depth is not None and len(path) >= max_depth:
+            # Portais demais no caminho: conta como visível tudo o que ainda
+            # poderia ser visto por aqui (resultado conservador, custo limitado)
+            visible |= new_bound
+            continue
+        # Sem a poda, caminhos diferentes até o mesmo portal tornam o custo exponencial
+        key = (nb, seg)
+        src, dst = _span(new_source, first), _span(target, seg)
+        if _covered(explored, key, src, dst):
+            continue
+        explored.setdefault(key, []).append(src + dst)
+        path.add(nb)
+        _flow(graph, might, first, new_source, target, nb, path, visible, explored, new_bound, max_depth)
+        path.discard(nb)
+
+def portal_visibility(graph, max_depth=None):
+    """{(setor, segmento do portal): setores potencialmente visíveis através dele}.
+
+    max_depth limita quantos portais o fluxo atravessa antes de desistir
+    de recortar (None = sem limite).
+    """
+    portals = [(sid, seg, nb) for sid, items in graph.items() for seg, nb in items]
+    might = {(sid, seg): _might_see(graph, sid, seg, nb) for sid, seg, nb in portals}
+    # Os portais de menor pré-passe primeiro: o fluxo de cada um substitui o seu
+    # pré-passe e limita os fluxos seguintes que passam por ele
+    portals.sort(key=lambda p: (len(might[(p[0], p[1])]), p[0], p[1]))
+    for sid, seg, nb in portals:
+        visible = {nb}
+        # (setor, portal) -> [(origem, passagem)] já percorridos, em parâmetros dos segmentos
+        _flow(graph, might, seg, seg, seg, nb, {sid, nb}, visible, {}, might[(sid, seg)], max_depth)
+        might[(sid, seg)] = visible
+    return might
+
+def visible_sectors(graph, sector_id, portal_vis=None):
+    """Conjunto de setores potencialmente visíveis a partir de `sector_id`."""
+    if portal_vis is None:
+        portal_vis = portal_visibility(graph)
+    visible = {sector_id}
+    for seg, _ in graph.get(sector_id, []):
+        visible |= portal_vis[(sector_id, seg)]
+    return visible
+
+# -----------------------------
+# Bitsets comprimidos
+# -----------------------------
+def compress_row(row):
+    """Compressão por corrida de zeros: 0x00 seguido da quantidade de zeros."""
+    out = bytearray()
+    i = 0
+    while i < len(row):
+        if row[i]:
+            out.append(row[i])
+            i += 1
+            continue
+        run = 1
+        while i + run < len(row) and row[i + run] == 0 and run < 255:
+            run += 1
+        out += bytes((0, run))
+        i += run
+    return bytes(out)
+
+def decompress_row(data, row_bytes):
+    out = bytearray()
+    i = 0
+    while i < len(data) and len(out) < row_bytes:
+        if data[i]:
+            out.append(data[i])
+            i += 1
+        else:
+            out += bytes(data[i + 1])
+            i += 2
+    return bytes(out[:row_bytes]).ljust(row_bytes, b"\0")
+
+class PVS:
+    """Visibilidade setor-a-setor guardada como bitsets comprimidos."""
+    def __init__(self, sector_ids, rows):
+        self.sector_ids = list(sector_ids)
+        self.index = {sid: i for i, sid in enumerate(self.sector_ids)}
+        self.rows = rows # bitsets comprimidos, na ordem de sector_ids
+        self.row_bytes = (len(self.sector_ids) + 7) // 8
+        self._cache = {}
+
+    def _row(self, sector_id):
+        i = self.index[sector_id]
+        row = self._cache.get(i)
+        if row is None:
+            row = self._cache[i] = decompress_row(self.rows[i], self.row_bytes)
+        return row
+
+    def is_visible(self, from_id, to_id):
+        if from_id not in self.index or to_id not in self.index:
+            return False
+        j = self.index[to_id]
+        return bool(self._row(from_id)[j >> 3] & (1 << (j & 7)))
+
+    def visible_from(self, sector_id):
+        if sector_id not in self.index:
+            return set()
+        row = self._row(sector_id)
+        return {sid for j, sid in enumerate(self.sector_ids) if row[j >> 3] & (1 << (j & 7))}
+
+    def compressed_size(self):
+        return sum(len(r) for r in self.rows)
+
+    def to_json(self):
+        return {
+            "sector_ids": self.sector_ids,
+            "rows": [base64.b64encode(r).decode("ascii") for r in self.rows],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["sector_ids"], [base64.b64decode(r) for r in data["rows"]])
+
+def compute_pvs(sectors_, walls, max_depth=None):
+    """Calcula o PVS de todos os setores a partir das paredes (build_walls).
+
+    Ver portal_visibility para max_depth.
+    """
+    graph = build_portal_graph(walls)
+    sector_ids = sorted(s.id for s in sectors_)
+    index = {sid: i for i, sid in enumerate(sector_ids)}
+    row_bytes = (len(sector_ids) + 7) // 8
+
+    portal_vis = portal_visibility(graph, max_depth)
+    rows = []
+    for sid in sector_ids:
+        row = bytearray(row_bytes)
+        for vid in visible_sectors(graph, sid, portal_vis):
+            j = index.get(vid)
+            if j is not None:
+                row[j >> 3] |= 1 << (j & 7)
+        rows.append(compress_row(bytes(row)))
+    return PVS(sector_ids, rows)